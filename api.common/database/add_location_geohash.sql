@@ -0,0 +1,23 @@
+-- Add a geohash (with index) to the location table.
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS `loop`.`temp_migration_function` $$
+CREATE PROCEDURE `loop`.`temp_migration_function`()
+BEGIN
+
+IF (SELECT COLUMN_NAME FROM information_schema.columns WHERE table_schema = 'loop' AND table_name = 'location' AND column_name = 'geohash') IS NULL THEN
+    ALTER TABLE `location` ADD COLUMN `geohash` VARCHAR(9) NULL;
+    CREATE INDEX `idx_location__geohash` ON `location` (`geohash`);
+END IF;
+
+-- Backfill (matches loop.geo.encode_geohash).
+UPDATE `loop`.`location`
+SET `geohash` = ST_GeoHash(`longitude`, `latitude`, 9)
+WHERE `geohash` IS NULL;
+
+END $$
+
+CALL `loop`.`temp_migration_function`() $$
+DROP PROCEDURE `loop`.`temp_migration_function` $$
+
+DELIMITER ;
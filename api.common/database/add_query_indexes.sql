@@ -0,0 +1,48 @@
+-- Add indexes for the rating feed, friendship and user lookup queries.
+-- Index names match those pony generates for loop.db_entities, except the
+-- unique email key, which is named like the other unique keys in
+-- database/create_*_table.sql (e.g. unique_cognito_user_name).
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS `loop`.`temp_migration_function` $$
+CREATE PROCEDURE `loop`.`temp_migration_function`()
+BEGIN
+
+-- Ratings by user (feed, user ratings and delete user), newest first.
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'rating' AND index_name = 'idx_rating__user_last_updated_id') IS NULL THEN
+    CREATE INDEX `idx_rating__user_last_updated_id` ON `rating` (`user`, `last_updated`, `id`);
+END IF;
+
+-- Ratings by place, newest first.
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'rating' AND index_name = 'idx_rating__location_last_updated') IS NULL THEN
+    CREATE INDEX `idx_rating__location_last_updated` ON `rating` (`location`, `last_updated`);
+END IF;
+
+-- Unfiltered ratings, newest first.
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'rating' AND index_name = 'idx_rating__last_updated') IS NULL THEN
+    CREATE INDEX `idx_rating__last_updated` ON `rating` (`last_updated`);
+END IF;
+
+-- A user's friendships (either direction) with a status.
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'friend' AND index_name = 'idx_friend__friend_1_status') IS NULL THEN
+    CREATE INDEX `idx_friend__friend_1_status` ON `friend` (`friend_1`, `status`);
+END IF;
+
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'friend' AND index_name = 'idx_friend__friend_2_status') IS NULL THEN
+    CREATE INDEX `idx_friend__friend_2_status` ON `friend` (`friend_2`, `status`);
+END IF;
+
+-- Users by email (fails if there are duplicate emails, which must be
+-- resolved first).
+IF (SELECT DISTINCT INDEX_NAME FROM information_schema.statistics WHERE table_schema = 'loop' AND table_name = 'user' AND index_name = 'unique_email') IS NULL THEN
+    ALTER TABLE `user` ADD UNIQUE unique_email(
+        `email`
+    );
+END IF;
+
+END $$
+
+CALL `loop`.`temp_migration_function`() $$
+DROP PROCEDURE `loop`.`temp_migration_function` $$
+
+DELIMITER ;
@@ -0,0 +1,27 @@
+-- Add a normalised search name (with index) to the user table.
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS `loop`.`temp_migration_function` $$
+CREATE PROCEDURE `loop`.`temp_migration_function`()
+BEGIN
+
+IF (SELECT COLUMN_NAME FROM information_schema.columns WHERE table_schema = 'loop' AND table_name = 'user' AND column_name = 'search_name') IS NULL THEN
+    ALTER TABLE `user` ADD COLUMN `search_name` VARCHAR(255) NULL;
+    CREATE INDEX `idx_user__search_name` ON `user` (`search_name`);
+END IF;
+
+-- Backfill (matches loop.utils.get_search_name).
+UPDATE `loop`.`user`
+SET `search_name` = TRIM(
+    REGEXP_REPLACE(
+        LOWER(CONCAT(`first_name`, ' ', `last_name`)), '[^[:alnum:]]+', ' '
+    )
+)
+WHERE `search_name` IS NULL;
+
+END $$
+
+CALL `loop`.`temp_migration_function`() $$
+DROP PROCEDURE `loop`.`temp_migration_function` $$
+
+DELIMITER ;
@@ -0,0 +1,43 @@
+-- Create a location_stats table (rating counts and score sums per location).
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS `loop`.`temp_migration_function` $$
+CREATE PROCEDURE `loop`.`temp_migration_function`()
+BEGIN
+
+IF (SELECT TABLE_NAME FROM information_schema.tables WHERE table_schema = 'loop' AND table_name = 'location_stats') IS NULL THEN
+    CREATE TABLE `location_stats` (
+        `location` INT NOT NULL,
+        `count` INT NOT NULL DEFAULT 0,
+        `food_sum` INT NOT NULL DEFAULT 0,
+        `price_sum` INT NOT NULL DEFAULT 0,
+        `vibe_sum` INT NOT NULL DEFAULT 0,
+        `last_rated` DATETIME NULL,
+        FOREIGN KEY (`location`) REFERENCES `location`(`id`),
+        PRIMARY KEY (`location`)
+    );
+END IF;
+
+-- Backfill (matches loop.data.rebuild_location_stats).
+INSERT INTO `loop`.`location_stats`
+    (`location`, `count`, `food_sum`, `price_sum`, `vibe_sum`, `last_rated`)
+SELECT
+    l.`id`,
+    COUNT(r.`id`),
+    COALESCE(SUM(r.`food`), 0),
+    COALESCE(SUM(r.`price`), 0),
+    COALESCE(SUM(r.`vibe`), 0),
+    MAX(COALESCE(r.`last_updated`, r.`created`))
+FROM `loop`.`location` l
+LEFT JOIN `loop`.`rating` r ON r.`location` = l.`id`
+WHERE NOT EXISTS (
+    SELECT 1 FROM `loop`.`location_stats` s WHERE s.`location` = l.`id`
+)
+GROUP BY l.`id`;
+
+END $$
+
+CALL `loop`.`temp_migration_function`() $$
+DROP PROCEDURE `loop`.`temp_migration_function` $$
+
+DELIMITER ;
@@ -1,21 +1,22 @@
 from typing import Dict
 
-from loop.api_classes import UserCredentials
+from loop.api_classes import ImportRatings, UserCredentials
 from loop.auth import CognitoAuth
 from loop.constants import DELETE_USER_QUEUE, logger
 from loop.data import (
     DB_SESSION_RETRYABLE,
     DB_TYPE,
+    create_ratings,
+    delete_rating_entry,
     delete_user_entry,
     delete_user_friendships,
     delete_user_ratings,
     get_user_from_email,
 )
-from loop.data_classes import UserObject
+from loop.data_classes import RatingsImportResults, UserObject
 from loop.enums import DbType
 from loop.exceptions import BadRequestError
 from loop.queue_service import SqsClient
-from pony.orm import commit
 
 """
 This module contains some logic for admin (only) api endpoints.
@@ -34,12 +35,18 @@ def _get_rating(rating_id: int, db_instance_type: DbType = DbType.WRITE):
 @DB_SESSION_RETRYABLE
 def delete_rating(rating_id: int) -> None:
     """Deletes the rating object with rating id from the database"""
-    rating = _get_rating(rating_id)
-    rating.delete()
-    commit()
+    delete_rating_entry(_get_rating(rating_id))
     return
 
 
+def import_ratings(import_ratings: ImportRatings) -> RatingsImportResults:
+    """Creates the ratings for the user (by email), e.g. migrated ratings."""
+    if not isinstance(import_ratings, ImportRatings):
+        raise TypeError('import_ratings must be an instance of ImportRatings.')
+    user: UserObject = get_user_from_email(import_ratings.email)
+    return create_ratings(import_ratings.ratings, user)
+
+
 def delete_user(user_credentials: UserCredentials) -> Dict:
     """
     Deletes the user from everywhere by doing the following:
@@ -65,8 +72,9 @@ def delete_user(user_credentials: UserCredentials) -> Dict:
     return auth_client.admin_delete_user(user_credentials)
 
 
+@DB_SESSION_RETRYABLE
 def delete_user_from_rds(user_credentials: UserCredentials) -> Dict:
-    """This function deletes the user entirely from RDS."""
+    """This function deletes the user entirely from RDS in one transaction."""
     if not isinstance(user_credentials, UserCredentials):
         raise TypeError(
             'user_credentials must be an instance of UserCredentials.'
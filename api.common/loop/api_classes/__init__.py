@@ -1,10 +1,16 @@
 from .api_classes import (
+    BoundingBox,
     Coordinates,
     CreateRating,
     ForgotPassword,
     FriendValidator,
+    ImportRatings,
     LoginCredentials,
+    MapView,
+    NearbyPlaces,
+    PaginatedFriends,
     PaginatedRatings,
+    RestaurantIds,
     SearchUsers,
     SignUpCredentials,
     UpdateRating,
@@ -1,5 +1,5 @@
 from copy import deepcopy
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from loop.api_classes.validators import (
     validate_code,
@@ -8,7 +8,17 @@ from loop.api_classes.validators import (
     validate_message_length,
     validate_str_uuid,
 )
-from loop.constants import MAX_RATING, MIN_PAGE_COUNT, MIN_RATING
+from loop.constants import (
+    FRIENDS_PAGE_COUNT,
+    IMPORT_RATINGS_MAX_COUNT,
+    MAX_FRIENDS_PAGE_COUNT,
+    MAX_MAP_ZOOM,
+    MAX_RATING,
+    MAX_RESTAURANT_IDS,
+    MIN_PAGE_COUNT,
+    MIN_RATING,
+)
+from loop.enums import MapMode, UserSearchMode
 from pydantic import BaseModel, Extra, model_validator, validator
 
 
@@ -69,6 +79,69 @@ class FriendValidator(BaseModel):
         return
 
 
+class RestaurantIds(BaseModel):
+    ids: List[str]
+
+    @validator("ids", pre=True)
+    @classmethod
+    def validate_ids(cls, ids: Union[str, List[str]]):
+        """Comma separated (from the query string), without duplicates."""
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        if not isinstance(ids, list):
+            raise ValueError('ids must be comma separated place ids.')
+        ids = list(
+            dict.fromkeys(str(id).strip() for id in ids if str(id).strip())
+        )
+        validate_int(len(ids), max_count=MAX_RESTAURANT_IDS, min_count=1)
+        return ids
+
+
+class BoundingBox(BaseModel):
+    """A map viewport, which crosses the antimeridian if west > east."""
+
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @validator("south", "north")
+    @classmethod
+    def validate_latitude(cls, latitude: float):
+        if not -90 <= latitude <= 90:
+            raise ValueError('Latitude must be between -90 and 90.')
+        return latitude
+
+    @validator("west", "east")
+    @classmethod
+    def validate_longitude(cls, longitude: float):
+        if not -180 <= longitude <= 180:
+            raise ValueError('Longitude must be between -180 and 180.')
+        return longitude
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate_south_north(cls, values):
+        if values.south > values.north:
+            raise ValueError('South cannot be greater than north.')
+        return values
+
+    def to_tuple(self) -> Tuple[float, float, float, float]:
+        return self.south, self.west, self.north, self.east
+
+
+class MapView(BoundingBox):
+    zoom: int
+    mode: MapMode = MapMode.PINS
+
+    @validator("zoom")
+    @classmethod
+    def validate_zoom(cls, zoom: int):
+        if not 0 <= zoom <= MAX_MAP_ZOOM:
+            raise ValueError(f'Zoom must be between 0 and {MAX_MAP_ZOOM}.')
+        return zoom
+
+
 class Coordinates(BaseModel):
     lat: float
     lng: float
@@ -80,6 +153,32 @@ class Coordinates(BaseModel):
         return f"{self.lat},{self.lng}"
 
 
+class NearbyPlaces(Coordinates):
+    page_count: int = MIN_PAGE_COUNT
+
+    class Config:
+        extra = Extra.forbid
+
+    @validator("lat")
+    @classmethod
+    def validate_latitude(cls, latitude: float):
+        if not -90 <= latitude <= 90:
+            raise ValueError('Latitude must be between -90 and 90.')
+        return latitude
+
+    @validator("lng")
+    @classmethod
+    def validate_longitude(cls, longitude: float):
+        if not -180 <= longitude <= 180:
+            raise ValueError('Longitude must be between -180 and 180.')
+        return longitude
+
+    @validator("page_count")
+    @classmethod
+    def validate_page_count(cls, page_count: int):
+        return validate_int(page_count, min_count=MIN_PAGE_COUNT)
+
+
 class UserCredentials(BaseModel):
     email: str
 
@@ -89,6 +188,18 @@ class UserCredentials(BaseModel):
         return validate_email_address(email)
 
 
+class ImportRatings(UserCredentials):
+    ratings: List[CreateRating]
+
+    @validator("ratings")
+    @classmethod
+    def validate_ratings_count(cls, ratings: List[CreateRating]):
+        validate_int(
+            len(ratings), max_count=IMPORT_RATINGS_MAX_COUNT, min_count=1
+        )
+        return ratings
+
+
 class LoginCredentials(UserCredentials):
     password: str
 
@@ -125,6 +236,7 @@ class PaginatedRatings(BaseModel):
 class SearchUsers(BaseModel):
     term: Optional[str] = str()
     page_count: int
+    mode: UserSearchMode = UserSearchMode.FUZZY
 
     class Config:
         extra = Extra.forbid
@@ -133,3 +245,18 @@ class SearchUsers(BaseModel):
     @classmethod
     def validate_page_count(cls, page_count: int):
         return validate_int(page_count, min_count=MIN_PAGE_COUNT)
+
+
+class PaginatedFriends(BaseModel):
+    cursor: Optional[int] = None
+    limit: int = FRIENDS_PAGE_COUNT
+
+    class Config:
+        extra = Extra.forbid
+
+    @validator("limit")
+    @classmethod
+    def validate_limit(cls, limit: int):
+        return validate_int(
+            limit, max_count=MAX_FRIENDS_PAGE_COUNT, min_count=MIN_PAGE_COUNT
+        )
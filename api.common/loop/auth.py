@@ -1,6 +1,7 @@
-from typing import Dict, List
+from threading import Lock
+from typing import Dict, List, Optional
 
-import boto3
+from cachetools import TTLCache
 from loop.api_classes import (
     ForgotPassword,
     LoginCredentials,
@@ -10,10 +11,14 @@ from loop.api_classes import (
 )
 from loop.constants import (
     ADMIN,
+    ADMIN_GROUP_CACHE_MAX_USERS,
+    ADMIN_GROUP_CACHE_TTL_SECONDS,
     AUTH_FLOW,
     COGNITO_SECRET_NAME,
     MINIMUM_PASSWORD_LENGTH,
 )
+from loop.data_classes import CognitoConfig
+from loop.deadline import check_budget, get_boto_config
 from loop.exceptions import (
     BadRequestError,
     ConflictError,
@@ -35,22 +40,62 @@ actions:
 - Change password (following forgot password)
 - Delete user from Cognito
 
+The boto3 client and user pool config are shared by every CognitoAuth in the
+container, and admin group membership is cached for a short TTL.
+
 """
 
+COGNITO_CONFIG: Optional[CognitoConfig] = None
+COGNITO_CONFIG_LOCK = Lock()
+
+ADMIN_GROUP_MEMBERSHIP = TTLCache(
+    maxsize=ADMIN_GROUP_CACHE_MAX_USERS, ttl=ADMIN_GROUP_CACHE_TTL_SECONDS
+)
+ADMIN_GROUP_MEMBERSHIP_LOCK = Lock()
+
+
+def get_cognito_config() -> CognitoConfig:
+    global COGNITO_CONFIG
+    with COGNITO_CONFIG_LOCK:
+        if COGNITO_CONFIG is None:
+            import boto3
+
+            # The client is shared across requests, so its timeouts are not
+            # derived from this request's deadline.
+            auth_client = boto3.client(
+                'cognito-idp', config=get_boto_config(use_deadline=False)
+            )
+            cognito_secret = get_secret(COGNITO_SECRET_NAME)
+            if (
+                'user_pool_id' not in cognito_secret
+                or 'client_id' not in cognito_secret
+            ):
+                raise ValueError(
+                    'cognito secret missing user_pool_id or client_id'
+                )
+            COGNITO_CONFIG = CognitoConfig(
+                auth_client=auth_client,
+                user_pool_id=cognito_secret['user_pool_id'],
+                client_id=cognito_secret['client_id'],
+            )
+        return COGNITO_CONFIG
+
+
+def clear_cognito_cache() -> None:
+    global COGNITO_CONFIG
+    with COGNITO_CONFIG_LOCK:
+        COGNITO_CONFIG = None
+    with ADMIN_GROUP_MEMBERSHIP_LOCK:
+        ADMIN_GROUP_MEMBERSHIP.clear()
+
 
 class CognitoAuth:
     def __init__(self, is_admin=False):
-        self._auth_client = boto3.client('cognito-idp')
-        cognito_secret = get_secret(COGNITO_SECRET_NAME)
-        if (
-            'user_pool_id' not in cognito_secret
-            or 'client_id' not in cognito_secret
-        ):
-            raise ValueError(
-                'cognito secret missing user_pool_id or client_id'
-            )
-        self._user_pool_id = cognito_secret['user_pool_id']
-        self._client_id = cognito_secret['client_id']
+        check_budget('Cognito')
+        cognito_config = get_cognito_config()
+        self._auth_client = cognito_config.auth_client
+        self._user_pool_id = cognito_config.user_pool_id
+        self._client_id = cognito_config.client_id
         self.is_admin = is_admin
 
     def _get_user_groups(self, username: str) -> List[Dict]:
@@ -72,11 +117,16 @@ class CognitoAuth:
 
     def _check_is_admin(self, username: str) -> bool:
         """Checks whether or not the user is in the admin group."""
+        cache_key = (self._user_pool_id, username)
+        with ADMIN_GROUP_MEMBERSHIP_LOCK:
+            is_admin = ADMIN_GROUP_MEMBERSHIP.get(cache_key)
+        if is_admin is not None:
+            return is_admin
         user_groups = self._get_user_groups(username)
-        if ADMIN in [group['GroupName'] for group in user_groups]:
-            return True
-        else:
-            return False
+        is_admin = ADMIN in [group['GroupName'] for group in user_groups]
+        with ADMIN_GROUP_MEMBERSHIP_LOCK:
+            ADMIN_GROUP_MEMBERSHIP[cache_key] = is_admin
+        return is_admin
 
     def _initiate_auth(self, login_credentials: LoginCredentials) -> Dict:
         """Initiates the login"""
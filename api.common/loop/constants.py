@@ -20,6 +20,21 @@ RDS_WRITE = 'write'
 MAX_DB_INIT_RETRIES = 3
 RETRY_DB_DELAY_SECONDS = 5
 
+# db_session retries (see loop.db_session.retryable_db_session) back off
+# exponentially from the base delay with full jitter, up to the max delay
+# per retry and the max elapsed time in all.
+DB_RETRY_MAX_RETRIES = 5
+DB_RETRY_BASE_DELAY_SECONDS = 0.05
+DB_RETRY_MAX_DELAY_SECONDS = 1
+DB_RETRY_MAX_ELAPSED_SECONDS = 5
+
+# Opt-in per-request SQL instrumentation (see loop.sql_metrics).
+SQL_METRICS_ENABLED = os.environ.get('LOOP_SQL_METRICS', '0') == '1'
+SQL_METRICS_NAMESPACE = f'{PROJECT}/{ENVIRONMENT}/sql'
+# Statements slower than this are logged with their caller (and EXPLAIN
+# output when LOGLEVEL is DEBUG). A negative threshold disables the log.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('LOOP_SLOW_QUERY_MS', 500))
+
 RESTAURANT_THUMBNAILS_BUCKET = (
     f'{PROJECT}-s3-restaurant-thumbnail-store-{ENVIRONMENT}'
 )
@@ -36,6 +51,48 @@ MINIMUM_PASSWORD_LENGTH = 8
 VERIFICATION_CODE_LENGTH = 6
 
 COGNITO_SECRET_NAME = f'{PROJECT}-cognito-secret-{ENVIRONMENT}'
+ADMIN_GROUP_CACHE_TTL_SECONDS = 60
+ADMIN_GROUP_CACHE_MAX_USERS = 256
+
+THREAD_POOL_MAX_WORKERS = 8
+
+# How long a request waits for each dependency it fans out to on the thread
+# pool.
+GOOGLE_PLACE_TIMEOUT_SECONDS = 5
+THUMBNAIL_CHECK_TIMEOUT_SECONDS = 2
+PLACE_RATINGS_TIMEOUT_SECONDS = 5
+
+# Request deadline (see loop.deadline). API Gateway gives up on the lambda
+# after 29s, and the margin is kept back to return the response.
+REQUEST_DEADLINE_SECONDS = 29
+DEADLINE_SAFETY_MARGIN_SECONDS = 1
+# Outbound calls are not started with less time than this left.
+MIN_CALL_BUDGET_SECONDS = 0.25
+# A failed db_session is not retried with less time than this left.
+DB_RETRY_MIN_BUDGET_SECONDS = 1
+# The thumbnail check is skipped with less time than this left.
+THUMBNAIL_CHECK_MIN_BUDGET_SECONDS = 3
+AWS_CONNECT_TIMEOUT_SECONDS = 2
+AWS_READ_TIMEOUT_SECONDS = 5
+AWS_MAX_ATTEMPTS = 3
+GOOGLE_CONNECT_TIMEOUT_SECONDS = 2
+GOOGLE_READ_TIMEOUT_SECONDS = 5
+# Total time googlemaps may spend retrying a request.
+GOOGLE_RETRY_TIMEOUT_SECONDS = 10
+
+PRINCIPAL_CACHE_MAX_TOKENS = 1024
+# Optional JWKS document (file path or secret name) used to verify the
+# signature of Cognito tokens locally.
+COGNITO_JWKS_FILE = os.environ.get('COGNITO_JWKS_FILE')
+COGNITO_JWKS_SECRET_NAME = os.environ.get('COGNITO_JWKS_SECRET_NAME')
+JWT_ALGORITHM = 'RS256'
+
+SECRET_CACHE_TTL_SECONDS = int(
+    os.environ.get('SECRET_CACHE_TTL_SECONDS', 300)
+)
+SECRET_STALE_GRACE_SECONDS = 60
+SECRET_PREFETCH_MAX_WORKERS = 4
+BATCH_GET_SECRET_MAX_IDS = 20
 
 LOOP_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
@@ -56,4 +113,38 @@ MIN_PAGE_COUNT = 1
 
 SEARCH_USER_PAGE_COUNT = 20
 
+FRIENDS_PAGE_COUNT = 20
+MAX_FRIENDS_PAGE_COUNT = 100
+
+SEARCH_USER_DB_CANDIDATES = 200
+
+USER_SEARCH_SESSION_TTL_SECONDS = 30
+USER_SEARCH_SESSION_MAX_USERS = 256
+USER_SEARCH_SESSION_MAX_CANDIDATES = 200
+
 UPDATE_RATING_FIELDS = ['price', 'vibe', 'food', 'message']
+
+# Admin rating imports (e.g. a user's list migrated from another app).
+IMPORT_RATINGS_MAX_COUNT = 1000
+IMPORT_RATINGS_BATCH_SIZE = 100
+
+# Places found on Google at once, for imports and /restaurants.
+FIND_LOCATIONS_MAX_WORKERS = 8
+MAX_RESTAURANT_IDS = 50
+
+# Map queries (see loop.geo). Geohashes of 9 characters are cells of about
+# 5m x 5m.
+GEOHASH_PRECISION = 9
+MAX_BBOX_GEOHASH_CELLS = 32
+MAX_MAP_ZOOM = 21
+MAX_MAP_PINS = 500
+# Place clusters are cached per (user, zoom, geohash cell), and are the
+# cells with PLACE_CLUSTER_PRECISION_OFFSET more characters.
+PLACE_CLUSTER_CACHE_TTL_SECONDS = 60
+PLACE_CLUSTER_CACHE_MAX_CELLS = 4096
+PLACE_CLUSTER_PRECISION_OFFSET = 1
+# Nearby places are searched for within a radius growing until there are
+# enough for the page.
+NEARBY_PLACES_PAGE_COUNT = 20
+NEARBY_PLACES_MIN_RADIUS_KM = 2
+NEARBY_PLACES_RADIUS_GROWTH = 4
@@ -1,13 +1,15 @@
 import math
 import os
+from collections import defaultdict
 from datetime import datetime
 from time import sleep
-from typing import Dict, Iterator, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 from loop import exceptions, secrets
-from loop.api_classes import PaginatedRatings, UpdateRating
+from loop.api_classes import CreateRating, PaginatedRatings, UpdateRating
 from loop.constants import (
     ENVIRONMENT,
+    IMPORT_RATINGS_BATCH_SIZE,
     LOOP_TIME_FORMAT,
     MAX_DB_INIT_RETRIES,
     PROJECT,
@@ -19,35 +21,44 @@ from loop.constants import (
 from loop.data_classes import (
     NULL_RATING_PAGE_RESULT,
     Location,
+    LocationStats,
     Rating,
+    RatingsImportResults,
     RatingsPageResults,
     UserCreateObject,
     UserObject,
 )
 from loop.db_entities import define_entities
-from loop.db_session import DBSession
-from loop.enums import DbType
-from loop.google_client import find_location
+from loop.db_session import DBSession, retryable_db_session
+from loop.enums import DbType, FriendStatusType
+from loop.geo import encode_geohash
+from loop.google_client import find_location, find_locations
+from loop.sql_metrics import InstrumentedDatabase
 from pony.orm import Database
 from pony.orm import InternalError as PonyOrmDbInternalError
 from pony.orm import (
     MultipleObjectsFoundError,
     OperationalError,
     TransactionError,
-    commit,
+    TransactionIntegrityError,
+    coalesce,
+    count,
     db_session,
     desc,
+    flush,
+    rollback,
     select,
 )
 from pony.orm.core import Query
 
-DB_SESSION_RETRYABLE = db_session(
-    retry=5,
-    retry_exceptions=(
+# Mutators do not commit themselves. The outermost DB_SESSION_RETRYABLE call
+# commits once on exit, so mutators called within it share its transaction.
+DB_SESSION_RETRYABLE = retryable_db_session(
+    (
         TransactionError,
         PonyOrmDbInternalError,
         OperationalError,
-    ),
+    )
 )
 
 """This file contains database initialisation/management logic"""
@@ -60,12 +71,13 @@ def init_db(
 ) -> None:
     for retry_count in range(MAX_DB_INIT_RETRIES + 1):
         try:
-            db = Database()
+            db = InstrumentedDatabase()
             define_entities(db)
             db.bind(**db_dict)
             db.generate_mapping(
                 check_tables=check_tables, create_tables=create_tables
             )
+            load_lookup_tables(db)
             return db
         except Exception as error:
             if "was already bound" in repr(error):
@@ -89,6 +101,87 @@ def init_db(
 
 DB_TYPE = DBSession()
 
+"""
+Static lookup tables (friend statuses and groups) are read once when the
+database is initialised so that friend/user queries can compare foreign key
+ids directly rather than joining on descriptions.
+"""
+FRIEND_STATUS_IDS: Dict[FriendStatusType, int] = dict()
+GROUP_DESCRIPTIONS: Dict[int, str] = dict()
+
+
+def load_lookup_tables(db: Database) -> None:
+    """
+    This function (re)loads the friend status and group lookup maps from the
+    database. The maps are built before being swapped in, so concurrent
+    readers see either the old or the new map.
+    """
+    global FRIEND_STATUS_IDS, GROUP_DESCRIPTIONS
+    friend_status_ids: Dict[FriendStatusType, int] = dict()
+    group_descriptions: Dict[int, str] = dict()
+    # Mapping has not been generated if there is no schema, so there is
+    # nothing to load yet.
+    if db.schema is not None:
+        with db_session:
+            for status_id, description in select(
+                (status.id, status.description)
+                for status in db.Friend_status
+            ):
+                try:
+                    friend_status_ids[FriendStatusType(description)] = (
+                        status_id
+                    )
+                except ValueError:
+                    logger.warning(
+                        f'Unknown friend status in rds: {description}'
+                    )
+            for group_id, description in select(
+                (group.id, group.description) for group in db.Group
+            ):
+                group_descriptions[group_id] = description
+    FRIEND_STATUS_IDS = friend_status_ids
+    GROUP_DESCRIPTIONS = group_descriptions
+
+
+def get_friend_status_id(
+    friend_status_type: FriendStatusType,
+    db_instance_type: DbType = DbType.WRITE,
+) -> int:
+    """
+    This function returns the id of a friend status from the lookup map.
+
+    The map is reloaded if the status is missing (e.g. rows were inserted
+    after the database was initialised).
+    """
+    if not isinstance(friend_status_type, FriendStatusType):
+        raise TypeError(
+            'friend_status_type must be an instance of FriendStatusType.'
+        )
+    friend_status_ids = FRIEND_STATUS_IDS
+    if friend_status_type not in friend_status_ids:
+        load_lookup_tables(DB_TYPE[db_instance_type])
+        friend_status_ids = FRIEND_STATUS_IDS
+    if friend_status_type not in friend_status_ids:
+        raise exceptions.UnknownFriendStatusTypeError(
+            f'Unknown friend status supplied: {friend_status_type.value}'
+        )
+    return friend_status_ids[friend_status_type]
+
+
+def _get_group_descriptions(
+    user, db_instance_type: DbType = DbType.WRITE
+) -> List[str]:
+    """
+    This function returns the descriptions of a user's groups using the group
+    lookup map (only the group ids are read from rds).
+    """
+    group_ids = select(group.id for group in user.groups)[:]
+    group_descriptions = GROUP_DESCRIPTIONS
+    if any(group_id not in group_descriptions for group_id in group_ids):
+        load_lookup_tables(DB_TYPE[db_instance_type])
+        group_descriptions = GROUP_DESCRIPTIONS
+    return [group_descriptions.get(group_id) for group_id in group_ids]
+
 
 def init_write_db(
     check_tables: bool = False, create_tables: bool = False
@@ -136,7 +229,7 @@ def get_user_ratings(
         )
         for rating in DB_TYPE[db_instance_type].Rating
         if rating.user.id == user.id
-    )
+    ).order_by(1)
     for (
         id,
         food,
@@ -177,7 +270,7 @@ def get_user_from_cognito_username(
     return UserObject(
         id=user.id,
         cognito_user_name=user.cognito_user_name,
-        groups=[group.description for group in user.groups],
+        groups=_get_group_descriptions(user, db_instance_type),
     )
 
 
@@ -194,7 +287,7 @@ def get_user_from_email(
     return UserObject(
         id=user.id,
         cognito_user_name=user.cognito_user_name,
-        groups=[group.description for group in user.groups],
+        groups=_get_group_descriptions(user, db_instance_type),
     )
 
 
@@ -213,7 +306,6 @@ def create_user(
         first_name=user.first_name,
         last_name=user.last_name,
     )
-    commit()
     logger.info(f'Successfully created user in rds: {user.__dict__}')
     return
 
@@ -235,7 +327,15 @@ def create_rating(
         user=rating.user,
         message=rating.message,
     )
-    commit()
+    _update_location_stats(
+        rating.location,
+        ratings=1,
+        food=rating.food,
+        price=rating.price,
+        vibe=rating.vibe,
+        rated=datetime.utcnow(),
+        db_instance_type=db_instance_type,
+    )
     logger.info(f'Successfully created rating in rds: {rating.__dict__}')
     return
 
@@ -272,15 +372,30 @@ def update_rating(
     """
     if not isinstance(update_rating, UpdateRating):
         raise TypeError('update_rating must be an instance of UpdateRating')
-    rating = _get_rating(update_rating.id, user)
+    rating = _get_rating(update_rating.id, user, db_instance_type)
+    scores = (rating.food, rating.price, rating.vibe)
     for field in UPDATE_RATING_FIELDS:
         (
             setattr(rating, field, getattr(update_rating, field))
             if getattr(update_rating, field)
             else None
         )
-    update_object_last_updated_time(rating)
-    commit()
+    # Only a change of score re-rates the place (and writes its stats).
+    food, price, vibe = (
+        score - previous_score
+        for score, previous_score in zip(
+            (rating.food, rating.price, rating.vibe), scores
+        )
+    )
+    if food or price or vibe:
+        _update_location_stats(
+            rating.location.id,
+            food=food,
+            price=price,
+            vibe=vibe,
+            rated=datetime.utcnow(),
+            db_instance_type=db_instance_type,
+        )
     logger.info(
         f'Successfully updated rating in rds: {update_rating.__dict__}'
     )
@@ -300,13 +415,181 @@ def delete_rating(
         isinstance(rating_id, str) and not rating_id.isdigit()
     ):
         raise TypeError('rating_id must be an int.')
-    rating = _get_rating(int(rating_id), user)
-    rating.delete()
-    commit()
+    delete_rating_entry(_get_rating(int(rating_id), user), db_instance_type)
     logger.info(f'Successfully deleted rating {rating_id}.')
     return
 
 
+def delete_rating_entry(
+    rating, db_instance_type: DbType = DbType.WRITE
+) -> None:
+    """
+    This function deletes the rating database object and removes it from
+    its location's stats.
+    """
+    location_id = rating.location.id
+    food, price, vibe = rating.food, rating.price, rating.vibe
+    rating.delete()
+    _update_location_stats(
+        location_id,
+        ratings=-1,
+        food=-food,
+        price=-price,
+        vibe=-vibe,
+        db_instance_type=db_instance_type,
+    )
+
+
+def _get_last_rated(
+    location_id: int, db_instance_type: DbType = DbType.WRITE
+) -> Optional[datetime]:
+    """
+    This function returns when the location was last rated, i.e. the
+    latest last_updated, or created for ratings without one. Ratings can
+    have no last_updated if they were inserted by _bulk_insert, which skips
+    the entity hooks, or created by pony on SQLite, where the column has no
+    default. Both are lookups on the (location, last_updated) index: the
+    max of the location's entries, and the entries without a last_updated.
+    """
+    ratings = select(
+        rating
+        for rating in DB_TYPE[db_instance_type].Rating
+        if rating.location.id == location_id
+    )
+    last_updated = select(rating.last_updated for rating in ratings).max()
+    last_created = select(
+        rating.created for rating in ratings if rating.last_updated is None
+    ).max()
+    return max(filter(None, (last_updated, last_created)), default=None)
+
+
+def _update_location_stats(
+    location_id: int,
+    ratings: int = 0,
+    food: int = 0,
+    price: int = 0,
+    vibe: int = 0,
+    rated: Optional[datetime] = None,
+    db_instance_type: DbType = DbType.WRITE,
+) -> None:
+    """
+    This function adds to (or with negative values, subtracts from) the
+    location's stats, in the caller's transaction. Concurrent changes to
+    the same stats fail pony's optimistic check, and are retried by
+    DB_SESSION_RETRYABLE.
+
+    If ratings were removed, last_rated is looked up again.
+    """
+    db = DB_TYPE[db_instance_type]
+    stats = db.Location_stats.get(location=location_id)
+    if stats is None:
+        stats = db.Location_stats(location=location_id)
+    stats.count += ratings
+    stats.food_sum += food
+    stats.price_sum += price
+    stats.vibe_sum += vibe
+    if ratings < 0:
+        stats.last_rated = _get_last_rated(location_id, db_instance_type)
+    if rated and (stats.last_rated is None or rated > stats.last_rated):
+        stats.last_rated = rated
+
+
+@DB_SESSION_RETRYABLE
+def get_location_stats(
+    google_id: str, db_instance_type: DbType = DbType.WRITE
+) -> Optional[LocationStats]:
+    """
+    This function returns the number of ratings of a place (google_id), their
+    average scores and when it was last rated, or None for a place not in
+    the Location table.
+    """
+    if not isinstance(google_id, str):
+        raise TypeError('google_id must be of type string')
+    location = DB_TYPE[db_instance_type].Location.get(google_id=google_id)
+    if not location:
+        return None
+    stats = location.stats
+    if not stats or stats.count == 0:
+        return LocationStats(ratings=0)
+    return LocationStats(
+        ratings=stats.count,
+        food=round(stats.food_sum / stats.count, 2),
+        price=round(stats.price_sum / stats.count, 2),
+        vibe=round(stats.vibe_sum / stats.count, 2),
+        last_rated=(
+            stats.last_rated.strftime(LOOP_TIME_FORMAT)
+            if stats.last_rated
+            else None
+        ),
+    )
+
+
+@DB_SESSION_RETRYABLE
+def rebuild_location_stats(
+    location_ids: Optional[List[int]] = None,
+    db_instance_type: DbType = DbType.WRITE,
+) -> int:
+    """
+    This function recomputes the stats of the locations (all of them by
+    default) from their ratings, in one transaction, e.g. to repair them.
+    Returns the number of locations.
+    """
+    return rebuild_db_location_stats(DB_TYPE[db_instance_type], location_ids)
+
+
+def rebuild_db_location_stats(
+    db: Database, location_ids: Optional[List[int]] = None
+) -> int:
+    """
+    This function recomputes the stats of the locations in db, in the
+    caller's db_session, for callers with their own database (e.g. the
+    dataset generator). Returns the number of locations.
+    """
+    locations = select(location.id for location in db.Location)
+    ratings = select(rating for rating in db.Rating)
+    stats_query = select(stats for stats in db.Location_stats)
+    if location_ids is not None:
+        locations = locations.filter(
+            lambda location_id: location_id in location_ids
+        )
+        ratings = ratings.filter(
+            lambda rating: rating.location.id in location_ids
+        )
+        stats_query = stats_query.filter(
+            lambda stats: stats.location.id in location_ids
+        )
+    totals = {
+        location_id: totals
+        for location_id, *totals in select(
+            (
+                rating.location.id,
+                count(rating),
+                sum(rating.food),
+                sum(rating.price),
+                sum(rating.vibe),
+                max(coalesce(rating.last_updated, rating.created)),
+            )
+            for rating in ratings
+        )
+    }
+    location_stats = {stats.location.id: stats for stats in stats_query}
+    location_ids = locations[:]
+    for location_id in location_ids:
+        ratings_count, food, price, vibe, last_rated = totals.get(
+            location_id, (0, 0, 0, 0, None)
+        )
+        stats = location_stats.get(location_id) or db.Location_stats(
+            location=location_id
+        )
+        stats.count = ratings_count
+        stats.food_sum = food
+        stats.price_sum = price
+        stats.vibe_sum = vibe
+        stats.last_rated = last_rated
+    logger.info(f'Rebuilt the stats of {len(location_ids)} locations.')
+    return len(location_ids)
+
+
 @DB_SESSION_RETRYABLE
 def create_location_entry(
     location: Location, db_instance_type: DbType = DbType.WRITE
@@ -323,7 +606,11 @@ def create_location_entry(
         latitude=location.coordinates.lat,
         longitude=location.coordinates.lng,
     )
-    commit()
+    # Created with the location, so rating it only updates the stats.
+    DB_TYPE[db_instance_type].Location_stats(location=location_entry)
+    # Flushed (not committed) for the id, so the location is written in the
+    # caller's transaction.
+    flush()
     logger.info(f'Successfully created location in rds: {location.__dict__}')
     return location_entry
 
@@ -348,20 +635,299 @@ def get_or_create_location_id(
     return location.id
 
 
-@DB_SESSION_RETRYABLE
-def update_object_last_updated_time(db_object) -> None:
+def _get_or_insert_location_id(
+    google_id: str,
+    location: Optional[Location],
+    db_instance_type: DbType = DbType.WRITE,
+) -> int:
     """
-    This function updates a database object's last updated field.
+    This function gets the location id for a google_id, inserting the
+    location (already found using google API) if it is not in the Location
+    table.
+
+    If another request inserts the place first, the insert is rolled back
+    and the location is read again, so it must be the first write of the
+    transaction.
     """
+    db = DB_TYPE[db_instance_type]
+    location_entry = db.Location.get(google_id=google_id)
+    if location_entry:
+        return location_entry.id
+    if location is None:
+        # The place was in the Location table but has since been deleted.
+        raise exceptions.BadRequestError(
+            f'Could not find google place with ID: {google_id}'
+        )
     try:
-        db_object.last_updated
-    except AttributeError as e:
-        raise AttributeError(
-            f'DB object {db_object} does not have a last_updated field: {e}'
+        return create_location_entry(location, db_instance_type).id
+    except TransactionIntegrityError:
+        rollback()
+        location_entry = db.Location.get(google_id=google_id)
+        if not location_entry:
+            raise
+        return location_entry.id
+
+
+@DB_SESSION_RETRYABLE
+def _create_place_rating(
+    rating: CreateRating,
+    user: UserObject,
+    location: Optional[Location],
+    db_instance_type: DbType = DbType.WRITE,
+) -> None:
+    location_id = _get_or_insert_location_id(
+        rating.google_id, location, db_instance_type
+    )
+    create_rating(
+        Rating(
+            location=location_id,
+            user=user.id,
+            price=rating.price,
+            vibe=rating.vibe,
+            food=rating.food,
+            message=rating.message,
+        ),
+        db_instance_type,
+    )
+
+
+def create_place_rating(
+    rating: CreateRating,
+    user: UserObject,
+    db_instance_type: DbType = DbType.WRITE,
+) -> None:
+    """
+    This function creates a user's rating of a place (google_id), creating
+    the place's Location entry first if it does not exist, in one
+    transaction.
+
+    A place not in the Location table is found using google API before the
+    transaction, so retries of the transaction do not repeat the call (or
+    hold the transaction open while waiting for it).
+    """
+    if not isinstance(rating, CreateRating):
+        raise TypeError('rating must be an instance of CreateRating')
+    if not isinstance(user, UserObject):
+        raise TypeError('user must be an instance of UserObject.')
+    location = None
+    if rating.google_id not in get_location_ids(
+        [rating.google_id], db_instance_type
+    ):
+        location = find_location(rating.google_id)
+    _create_place_rating(rating, user, location, db_instance_type)
+
+
+@DB_SESSION_RETRYABLE
+def get_location_ids(
+    google_ids: List[str], db_instance_type: DbType = DbType.WRITE
+) -> Dict[str, int]:
+    """
+    This function maps google_ids to location ids (for the places in the
+    Location table) with one IN query.
+    """
+    if not google_ids:
+        return dict()
+    return dict(
+        select(
+            (location.google_id, location.id)
+            for location in DB_TYPE[db_instance_type].Location
+            if location.google_id in google_ids
         )
-    db_object.last_updated = datetime.utcnow()
-    commit()
-    return
+    )
+
+
+@DB_SESSION_RETRYABLE
+def get_locations_by_google_ids(
+    google_ids: List[str], db_instance_type: DbType = DbType.WRITE
+) -> Dict[str, Dict]:
+    """
+    This function gets the id, name, coordinates and address of the places
+    in the Location table, by google_id, with one IN query.
+    """
+    if not isinstance(google_ids, list):
+        raise TypeError('google_ids must be a list.')
+    if not google_ids:
+        return dict()
+    locations_query = select(
+        (
+            location.id,
+            location.google_id,
+            location.display_name,
+            location.address,
+            location.latitude,
+            location.longitude,
+        )
+        for location in DB_TYPE[db_instance_type].Location
+        if location.google_id in google_ids
+    )
+    return {
+        google_id: {
+            'id': id,
+            'google_id': google_id,
+            'display_name': display_name,
+            'address': address,
+            'coordinates': {'lat': latitude, 'lng': longitude},
+        }
+        for (
+            id,
+            google_id,
+            display_name,
+            address,
+            latitude,
+            longitude,
+        ) in locations_query
+    }
+
+
+def _bulk_insert(
+    db: Database,
+    entity,
+    columns: List[str],
+    rows: List[Tuple],
+    batch_size: int = IMPORT_RATINGS_BATCH_SIZE,
+) -> None:
+    """
+    This function inserts rows with one executemany per batch, in the
+    caller's transaction.
+    """
+    provider = db.provider
+    placeholder = '?' if provider.paramstyle == 'qmark' else '%s'
+    sql = (
+        f'INSERT INTO {provider.quote_name(entity._table_)} '
+        f'({", ".join(provider.quote_name(column) for column in columns)}) '
+        f'VALUES ({", ".join([placeholder] * len(columns))})'
+    )
+    cursor = db.get_connection().cursor()
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start : start + batch_size])
+
+
+@DB_SESSION_RETRYABLE
+def _insert_ratings(
+    ratings: Sequence[CreateRating],
+    user: UserObject,
+    locations: Dict[str, Location],
+    db_instance_type: DbType = DbType.WRITE,
+) -> int:
+    """
+    This function inserts the (new) locations and then the ratings of places
+    with locations, in one transaction. Returns the number of ratings
+    created.
+    """
+    db = DB_TYPE[db_instance_type]
+    # A location may have been created since it was looked up.
+    existing_location_ids = get_location_ids(list(locations), db_instance_type)
+    _bulk_insert(
+        db,
+        db.Location,
+        [
+            'google_id',
+            'address',
+            'display_name',
+            'latitude',
+            'longitude',
+            'geohash',
+        ],
+        [
+            (
+                google_id,
+                location.address,
+                location.display_name,
+                location.coordinates.lat,
+                location.coordinates.lng,
+                encode_geohash(
+                    location.coordinates.lat, location.coordinates.lng
+                ),
+            )
+            for google_id, location in locations.items()
+            if google_id not in existing_location_ids
+        ],
+    )
+    location_ids = get_location_ids(
+        list({rating.google_id for rating in ratings}), db_instance_type
+    )
+    rating_rows = [
+        (
+            rating.price,
+            rating.vibe,
+            rating.food,
+            rating.message,
+            location_ids[rating.google_id],
+            user.id,
+        )
+        for rating in ratings
+        if rating.google_id in location_ids
+    ]
+    _bulk_insert(
+        db,
+        db.Rating,
+        ['price', 'vibe', 'food', 'message', 'location', 'user'],
+        rating_rows,
+    )
+    location_totals = defaultdict(lambda: [0, 0, 0, 0])
+    for price, vibe, food, _, location_id, _ in rating_rows:
+        totals = location_totals[location_id]
+        totals[0] += 1
+        totals[1] += food
+        totals[2] += price
+        totals[3] += vibe
+    rated = datetime.utcnow()
+    # In id order, so concurrent transactions lock the stats in one order.
+    for location_id, (ratings_count, food, price, vibe) in sorted(
+        location_totals.items()
+    ):
+        _update_location_stats(
+            location_id,
+            ratings=ratings_count,
+            food=food,
+            price=price,
+            vibe=vibe,
+            rated=rated,
+            db_instance_type=db_instance_type,
+        )
+    return len(rating_rows)
+
+
+def create_ratings(
+    ratings: List[CreateRating],
+    user: UserObject,
+    db_instance_type: DbType = DbType.WRITE,
+) -> RatingsImportResults:
+    """
+    This function creates many ratings for a user (e.g. a list imported
+    from another app):
+
+    - The google_ids are resolved to locations with one IN query.
+    - Places not in the Location table are found using google API
+      concurrently (outside the transaction). Ratings of places which
+      cannot be found are not created.
+    - The new locations and the ratings are inserted in batches in one
+      transaction.
+    """
+    if not isinstance(ratings, list) or not all(
+        isinstance(rating, CreateRating) for rating in ratings
+    ):
+        raise TypeError('ratings must be a list of CreateRating.')
+    if not isinstance(user, UserObject):
+        raise TypeError('user must be an instance of UserObject.')
+    google_ids = list(dict.fromkeys(rating.google_id for rating in ratings))
+    location_ids = get_location_ids(google_ids, db_instance_type)
+    locations, failed_google_ids = find_locations(
+        [
+            google_id
+            for google_id in google_ids
+            if google_id not in location_ids
+        ]
+    )
+    created = _insert_ratings(ratings, user, locations, db_instance_type)
+    logger.info(
+        f'Successfully created {created} ratings in rds for user {user.id} '
+        f'({len(locations)} new locations, {len(failed_google_ids)} places '
+        'not found).'
+    )
+    return RatingsImportResults(
+        created=created, failed_google_ids=failed_google_ids
+    )
 
 
 @DB_SESSION_RETRYABLE
@@ -389,7 +955,12 @@ def _get_ratings(
         ratings = ratings.filter(
             lambda rating: rating.location.google_id == place_id
         )
-    return ratings.order_by(lambda rating: desc(rating.last_updated))
+    # Ties (on last_updated) are broken by id, newest first, so that the
+    # order does not depend on the index used and is one backward scan of
+    # the (user, last_updated, id) index.
+    return ratings.order_by(
+        lambda rating: (desc(rating.last_updated), desc(rating.id))
+    )
 
 
 def _get_serialized_ratings(ratings_query: Query) -> Dict:
@@ -475,8 +1046,29 @@ def delete_user_ratings(
         for rating in DB_TYPE[db_instance_type].Rating
         if rating.user.id == user.id
     )
+    location_totals = select(
+        (
+            rating.location.id,
+            count(rating),
+            sum(rating.food),
+            sum(rating.price),
+            sum(rating.vibe),
+        )
+        for rating in ratings
+    )[:]
     ratings.delete(bulk=True)
-    commit()
+    # In id order, so concurrent transactions lock the stats in one order.
+    for location_id, ratings_count, food, price, vibe in sorted(
+        location_totals
+    ):
+        _update_location_stats(
+            location_id,
+            ratings=-ratings_count,
+            food=-food,
+            price=-price,
+            vibe=-vibe,
+            db_instance_type=db_instance_type,
+        )
     return
 
 
@@ -493,7 +1085,6 @@ def delete_user_friendships(
         if f.friend_1.id == user.id or f.friend_2.id == user.id
     )
     frienships.delete(bulk=True)
-    commit()
     return
 
 
@@ -508,5 +1099,4 @@ def delete_user_entry(
     if not user:
         raise exceptions.BadRequestError('User not found')
     user.delete()
-    commit()
     return
@@ -1,9 +1,9 @@
 from copy import deepcopy
-from dataclasses import asdict, dataclass
-from typing import Dict, Optional, Union
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Union
 
 from loop.api_classes import Coordinates
-from loop.enums import FriendStatusType
+from loop.enums import FriendStatusType, UserSearchMode
 
 """This file contains all dataclasses"""
 
@@ -50,6 +50,18 @@ class Rating:
     message: Optional[str] = None
 
 
+@dataclass
+class LocationStats:
+    ratings: int
+    food: Optional[float] = None
+    price: Optional[float] = None
+    vibe: Optional[float] = None
+    last_rated: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
 @dataclass
 class UploadThumbnailEvent:
     place_id: str
@@ -77,6 +89,49 @@ class RatingsPageResults:
 NULL_RATING_PAGE_RESULT = RatingsPageResults(page_data=list(), total_pages=0)
 
 
+@dataclass
+class NearbyPlacesPageResults:
+    page_data: List[Dict[str, Union[str, int, float, Dict[str, float]]]]
+    total_pages: int
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+NULL_NEARBY_PLACES_PAGE_RESULT = NearbyPlacesPageResults(
+    page_data=list(), total_pages=0
+)
+
+
+@dataclass
+class RatingsImportResults:
+    created: int
+    # Places that could not be found (their ratings are not created).
+    failed_google_ids: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+@dataclass
+class FriendsPageResults:
+    page_data: List[Dict[str, Union[str, int]]]
+    next_cursor: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+@dataclass
+class FriendCounts:
+    friends: int = 0
+    inbound: int = 0
+    outbound: int = 0
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
 @dataclass
 class PaginatedUserSearch:
     user_data: Dict
@@ -89,3 +144,52 @@ class PaginatedUserSearch:
 NULL_USER_SEARCH_PAGE_RESULT = RatingsPageResults(
     page_data=list(), total_pages=0
 )
+
+
+@dataclass
+class UserSearchSession:
+    """
+    The last user search made by a user - kept briefly so that typeahead
+    searches can reuse the candidates and ranking. Both lists are capped,
+    and flagged as truncated if they were cut off.
+    """
+
+    mode: UserSearchMode
+    term: str
+    search_users: List[Dict[str, Union[str, int]]]
+    ranked_users: List[Dict[str, Union[str, int]]]
+    truncated: bool = False
+    ranked_truncated: bool = False
+
+
+@dataclass
+class CachedSecret:
+    value: Dict
+    version_id: Optional[str]
+    expires_at: float
+
+
+@dataclass
+class CognitoConfig:
+    auth_client: object
+    user_pool_id: str
+    client_id: str
+
+
+@dataclass
+class CachedPrincipal:
+    user: UserObject
+    expires_at: float
+
+
+@dataclass
+class SqlMetrics:
+    statements: int = 0
+    db_time_ms: float = 0.0
+    retries: int = 0
+    retry_delay_ms: float = 0.0
+    fingerprints: Dict[str, int] = field(default_factory=dict)
+    retries_by_function: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
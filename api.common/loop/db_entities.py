@@ -6,11 +6,27 @@ from pony.orm import (
     PrimaryKey,
     Required,
     Set,
+    composite_index,
     composite_key,
 )
+from loop.constants import GEOHASH_PRECISION
+from loop.geo import encode_geohash
+from loop.utils import get_search_name
 
 """This module defines the database objects"""
 
+# created defaults to the insert time, as in the MySQL schema
+# (database/create_*_table.sql), so tables created by pony behave the same.
+SQL_NOW = 'CURRENT_TIMESTAMP'
+
+
+def touch(entity) -> None:
+    """
+    Sets an entity's last_updated to now. Called from before_update, so it
+    is written in the same UPDATE (and transaction) as the change itself.
+    """
+    entity.last_updated = datetime.utcnow()
+
 
 def define_entities(db: Database) -> None:
     class User(db.Entity):
@@ -19,17 +35,25 @@ def define_entities(db: Database) -> None:
         """
 
         id = PrimaryKey(int, auto=True)
-        created = Optional(datetime)
+        created = Optional(datetime, sql_default=SQL_NOW)
         last_updated = Optional(datetime)
-        cognito_user_name = Required(str)
-        email = Required(str)
+        cognito_user_name = Required(str, unique=True)
+        email = Required(str, unique=True)
         first_name = Required(str)
         last_name = Required(str)
+        search_name = Optional(str, 255, nullable=True, index=True)
         ratings = Set('Rating')
         friend_1 = Set('Friend', reverse='friend_1')
         friend_2 = Set('Friend', reverse='friend_2')
         groups = Set('Group')
 
+        def before_insert(self):
+            self.search_name = get_search_name(self.first_name, self.last_name)
+
+        def before_update(self):
+            self.search_name = get_search_name(self.first_name, self.last_name)
+            touch(self)
+
     class Group(db.Entity):
         """
         List of all groups.
@@ -45,14 +69,26 @@ def define_entities(db: Database) -> None:
         """
 
         id = PrimaryKey(int, auto=True)
-        google_id = Required(str)
+        google_id = Required(str, unique=True)
         address = Required(str)
         display_name = Required(str)
         latitude = Required(float)
         longitude = Required(float)
-        created = Optional(datetime)
+        # See loop.geo.
+        geohash = Optional(
+            str, GEOHASH_PRECISION, nullable=True, index=True
+        )
+        created = Optional(datetime, sql_default=SQL_NOW)
         last_updated = Optional(datetime)
         ratings = Set('Rating')
+        stats = Optional('Location_stats', cascade_delete=True)
+
+        def before_insert(self):
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+
+        def before_update(self):
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+            touch(self)
 
     class Rating(db.Entity):
         id = PrimaryKey(int, auto=True)
@@ -61,9 +97,28 @@ def define_entities(db: Database) -> None:
         food = Required(int)
         location = Required(Location)
         user = Required(User)
-        created = Optional(datetime)
-        last_updated = Optional(datetime)
+        created = Optional(datetime, sql_default=SQL_NOW)
+        last_updated = Optional(datetime, index=True)
         message = Optional(str, nullable=True)
+        composite_index(user, last_updated, id)
+        composite_index(location, last_updated)
+
+        def before_update(self):
+            touch(self)
+
+    class Location_stats(db.Entity):
+        """
+        The number of ratings of each location, the sums of their scores and
+        when it was last rated. Kept up to date by the loop.data rating
+        functions (and repaired with data.rebuild_location_stats).
+        """
+
+        location = PrimaryKey(Location)
+        count = Required(int, default=0)
+        food_sum = Required(int, default=0)
+        price_sum = Required(int, default=0)
+        vibe_sum = Required(int, default=0)
+        last_rated = Optional(datetime)
 
     class Friend_status(db.Entity):
         id = PrimaryKey(int, auto=True)
@@ -75,5 +130,10 @@ def define_entities(db: Database) -> None:
         friend_1 = Required(User, reverse='friend_1')
         friend_2 = Required(User, reverse='friend_2')
         status = Required(Friend_status)
-        created = Optional(datetime)
+        created = Optional(datetime, sql_default=SQL_NOW)
         last_updated = Optional(datetime)
+        composite_index(friend_1, status)
+        composite_index(friend_2, status)
+
+        def before_update(self):
+            touch(self)
@@ -1,8 +1,23 @@
-from typing import Iterator, Optional, Tuple
+import random
+import time
+from functools import wraps
+from threading import Lock
+from typing import Callable, Iterator, Optional, Tuple, Type
 
+from loop.constants import (
+    DB_RETRY_BASE_DELAY_SECONDS,
+    DB_RETRY_MAX_DELAY_SECONDS,
+    DB_RETRY_MAX_ELAPSED_SECONDS,
+    DB_RETRY_MAX_RETRIES,
+    DB_RETRY_MIN_BUDGET_SECONDS,
+    logger,
+)
+from loop.deadline import has_budget
 from loop.enums import DbType
 from loop.exceptions import DbDisconnectFailedError
-from pony.orm import Database
+from loop.sql_metrics import record_retry
+from pony.orm import Database, db_session
+from pony.orm.core import local
 
 """
 This module defines the DBSession class, which manages database session
@@ -21,9 +36,16 @@ Key Features:
  `items()`. This allows the class to behave somewhat like a dictionary.
 - **Len Support**: The `__len__` method returns the number of database
  instances managed by the class.
+- **Deferred Initialisation**: An initialiser can be registered for a database
+ instance, which is then connected on first access rather than at import (e.g.
+ to keep Pony's `generate_mapping` out of a lambda's cold start).
 
 This design allows for flexible management of database instances and future
  extensibility if additional database types (e.g., read-only) are added.
+
+It also provides retryable_db_session, a db_session that retries with
+exponential backoff and full jitter rather than immediately (which under
+lock contention turns into a retry storm).
 """
 
 
@@ -41,12 +63,32 @@ class DBSession:
         """
         for instance in self._db_instances:
             setattr(self, instance, None)
+        self._initialisers = dict()
+        self._initialiser_lock = Lock()
+
+    def set_initialiser(
+        self, db_type_item: DbType, initialiser: Callable[[], None]
+    ) -> None:
+        """
+        Registers a function that sets the db instance, called the first time
+        the instance is accessed while it is unset.
+        """
+        if not isinstance(db_type_item, DbType):
+            raise TypeError('Must set DBSession initialiser with key DbType.')
+        self._initialisers[db_type_item] = initialiser
+
+    def _initialise(self, db_type_item: DbType) -> None:
+        with self._initialiser_lock:
+            if self._write_db is None:
+                self._initialisers[db_type_item]()
 
     def __getitem__(self, db_type_item: DbType) -> Optional[Database]:
         """
         Allowing accessing to the _write_db attribute using an index.
         """
         if db_type_item == DbType.WRITE:
+            if self._write_db is None and db_type_item in self._initialisers:
+                self._initialise(db_type_item)
             return self._write_db
         raise ValueError('Must index DBSession with DbType.')
 
@@ -88,3 +130,73 @@ class DBSession:
         Return the number of db instances we allow for iteration.
         """
         return len(self._db_instances)
+
+
+def get_retry_delay(
+    retry: int,
+    base_delay_seconds: float = DB_RETRY_BASE_DELAY_SECONDS,
+    max_delay_seconds: float = DB_RETRY_MAX_DELAY_SECONDS,
+) -> float:
+    """
+    Full jitter: a uniformly random delay up to the exponential backoff
+    (base_delay_seconds * 2 ** retry, capped at max_delay_seconds), so that
+    contending sessions spread out rather than retrying together.
+    """
+    return random.uniform(
+        0, min(max_delay_seconds, base_delay_seconds * 2**retry)
+    )
+
+
+def retryable_db_session(
+    retry_exceptions: Tuple[Type[Exception], ...],
+    max_retries: int = DB_RETRY_MAX_RETRIES,
+    max_elapsed_seconds: float = DB_RETRY_MAX_ELAPSED_SECONDS,
+) -> Callable[[Callable], Callable]:
+    """
+    Decorator running the function in a db_session, retried (after
+    get_retry_delay) when it raises one of retry_exceptions, while there are
+    retries left, the retry would start within max_elapsed_seconds and the
+    request deadline allows. Retries are counted by function in the
+    request's SqlMetrics.
+
+    Like pony's db_session, a call inside another db_session joins it and
+    is not retried (the outermost session is).
+    """
+
+    def decorator(func: Callable) -> Callable:
+        session_func = db_session(func)
+        function = f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def _retryable_db_session(*args, **kwargs):
+            if local.db_session is not None:
+                return session_func(*args, **kwargs)
+            start = time.monotonic()
+            retry = 0
+            while True:
+                try:
+                    return session_func(*args, **kwargs)
+                except retry_exceptions as e:
+                    delay = get_retry_delay(retry)
+                    if (
+                        retry >= max_retries
+                        or time.monotonic() - start + delay
+                        > max_elapsed_seconds
+                        or not has_budget(delay + DB_RETRY_MIN_BUDGET_SECONDS)
+                    ):
+                        logger.warning(
+                            f'Giving up on {function} after {retry} '
+                            f'retries: {e!r}'
+                        )
+                        raise e
+                    logger.warning(
+                        f'Retrying {function} in {delay * 1000:.0f}ms '
+                        f'(retry {retry + 1}): {e!r}'
+                    )
+                    record_retry(function, delay)
+                    time.sleep(delay)
+                    retry += 1
+
+        return _retryable_db_session
+
+    return decorator
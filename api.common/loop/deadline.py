@@ -0,0 +1,129 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Tuple
+
+from loop.constants import (
+    AWS_CONNECT_TIMEOUT_SECONDS,
+    AWS_MAX_ATTEMPTS,
+    AWS_READ_TIMEOUT_SECONDS,
+    DEADLINE_SAFETY_MARGIN_SECONDS,
+    MIN_CALL_BUDGET_SECONDS,
+    REQUEST_DEADLINE_SECONDS,
+)
+from loop.exceptions import GatewayTimeoutError
+
+"""
+This module provides a request scoped deadline, set by the API handler from
+the lambda's remaining time, which outbound calls (Google, S3, SQS, Cognito
+and db_session retries) derive their timeouts and retry decisions from:
+
+- Timeouts are capped at the time remaining
+- Retries are only made while there is time for them
+- Calls are not started when the remaining time is below
+  MIN_CALL_BUDGET_SECONDS (a GatewayTimeoutError is raised instead), and
+  optional work can be skipped with has_budget
+
+Outside of request_deadline() there is no deadline and the default timeouts
+apply. The deadline is a context variable, so work submitted with
+loop.utils.submit shares it.
+"""
+
+CURRENT_DEADLINE: ContextVar[Optional[float]] = ContextVar(
+    'current_deadline', default=None
+)
+
+
+@contextmanager
+def request_deadline(remaining_ms: Optional[int] = None) -> Iterator[float]:
+    """
+    Sets the deadline (as a time.monotonic() value) to the lambda's
+    remaining time (or REQUEST_DEADLINE_SECONDS, whichever is sooner) less
+    DEADLINE_SAFETY_MARGIN_SECONDS.
+    """
+    budget_seconds = REQUEST_DEADLINE_SECONDS
+    if remaining_ms is not None:
+        budget_seconds = min(budget_seconds, remaining_ms / 1000)
+    deadline = (
+        time.monotonic() + budget_seconds - DEADLINE_SAFETY_MARGIN_SECONDS
+    )
+    token = CURRENT_DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        CURRENT_DEADLINE.reset(token)
+
+
+def get_remaining_seconds() -> Optional[float]:
+    """The time left before the deadline, or None if there is no deadline."""
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def has_budget(seconds: float) -> bool:
+    remaining_seconds = get_remaining_seconds()
+    return remaining_seconds is None or remaining_seconds >= seconds
+
+
+def check_budget(
+    dependency: str, seconds: float = MIN_CALL_BUDGET_SECONDS
+) -> None:
+    """Raises a GatewayTimeoutError if there is not time to call dependency."""
+    if not has_budget(seconds):
+        raise GatewayTimeoutError(
+            f'Not enough time left in the request to call {dependency}.'
+        )
+
+
+def get_timeout(timeout_seconds: float) -> float:
+    """The timeout, capped at the time remaining."""
+    remaining_seconds = get_remaining_seconds()
+    if remaining_seconds is None:
+        return timeout_seconds
+    return min(timeout_seconds, remaining_seconds)
+
+
+def get_timeouts(
+    connect_timeout_seconds: float, read_timeout_seconds: float
+) -> Tuple[float, float]:
+    return get_timeout(connect_timeout_seconds), get_timeout(
+        read_timeout_seconds
+    )
+
+
+def get_max_attempts(max_attempts: int, attempt_seconds: float) -> int:
+    """
+    The number of attempts (of up to attempt_seconds each, at least one)
+    that fit in the time remaining.
+    """
+    remaining_seconds = get_remaining_seconds()
+    if remaining_seconds is None:
+        return max_attempts
+    return max(1, min(max_attempts, int(remaining_seconds // attempt_seconds)))
+
+
+def get_boto_config(use_deadline: bool = True):
+    """
+    A botocore Config with the AWS timeouts and retries, derived from the
+    deadline unless use_deadline is False (for clients shared across
+    requests).
+    """
+    from botocore.config import Config
+
+    connect_timeout = AWS_CONNECT_TIMEOUT_SECONDS
+    read_timeout = AWS_READ_TIMEOUT_SECONDS
+    max_attempts = AWS_MAX_ATTEMPTS
+    if use_deadline:
+        connect_timeout, read_timeout = get_timeouts(
+            connect_timeout, read_timeout
+        )
+        max_attempts = get_max_attempts(
+            max_attempts, connect_timeout + read_timeout
+        )
+    return Config(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries={'mode': 'standard', 'max_attempts': max_attempts},
+    )
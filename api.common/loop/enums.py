@@ -26,5 +26,15 @@ class FriendRequestType(Enum):
     BOTH = 'both'
 
 
+class UserSearchMode(Enum):
+    FUZZY = 'fuzzy'
+    DATABASE = 'database'
+
+
+class MapMode(Enum):
+    PINS = 'pins'
+    CLUSTERS = 'clusters'
+
+
 class DbType(Enum):
     WRITE = RDS_WRITE
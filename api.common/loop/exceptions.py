@@ -78,6 +78,10 @@ class TooManyRequestsError(LoopException):
     STATUS_CODE = 429
 
 
+class GatewayTimeoutError(LoopException):
+    STATUS_CODE = 504
+
+
 class Error(Exception):
     '''Base class for other exceptions'''
 
@@ -1,32 +1,75 @@
 import math
 import os
-from typing import Dict, List, Union
+from datetime import datetime
+from functools import cached_property
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
-from loop.api_classes import SearchUsers
-from loop.constants import MIN_FUZZ_SCORE, SEARCH_USER_PAGE_COUNT, logger
+from cachetools import TTLCache
+from loop.api_classes import (
+    BoundingBox,
+    NearbyPlaces,
+    PaginatedFriends,
+    SearchUsers,
+)
+from loop.constants import (
+    GEOHASH_PRECISION,
+    LOOP_TIME_FORMAT,
+    MAX_MAP_PINS,
+    MIN_FUZZ_SCORE,
+    NEARBY_PLACES_MIN_RADIUS_KM,
+    NEARBY_PLACES_PAGE_COUNT,
+    NEARBY_PLACES_RADIUS_GROWTH,
+    PLACE_CLUSTER_CACHE_MAX_CELLS,
+    PLACE_CLUSTER_CACHE_TTL_SECONDS,
+    PLACE_CLUSTER_PRECISION_OFFSET,
+    SEARCH_USER_DB_CANDIDATES,
+    SEARCH_USER_PAGE_COUNT,
+    USER_SEARCH_SESSION_MAX_CANDIDATES,
+    USER_SEARCH_SESSION_MAX_USERS,
+    USER_SEARCH_SESSION_TTL_SECONDS,
+    logger,
+)
 from loop.data import (
     DB_SESSION_RETRYABLE,
     DB_TYPE,
     get_all_users,
+    get_friend_status_id,
     get_ratings,
-    update_object_last_updated_time,
 )
 from loop.data_classes import (
+    NULL_NEARBY_PLACES_PAGE_RESULT,
     NULL_USER_SEARCH_PAGE_RESULT,
+    FriendCounts,
+    FriendsPageResults,
     FriendStatus,
+    NearbyPlacesPageResults,
     PaginatedUserSearch,
     UserObject,
+    UserSearchSession,
+)
+from loop.enums import (
+    DbType,
+    FriendRequestType,
+    FriendStatusType,
+    UserSearchMode,
 )
-from loop.enums import DbType, FriendRequestType, FriendStatusType
-from loop.exceptions import (
-    BadRequestError,
-    DbNotInitError,
-    UnknownFriendStatusTypeError,
+from loop.exceptions import BadRequestError, DbNotInitError
+from loop.geo import (
+    MAX_DISTANCE_KM,
+    cluster_points,
+    get_bbox_cells,
+    get_geohash_ranges,
+    get_haversine_distances,
+    get_radius_bbox,
+    get_zoom_precision,
 )
-from pony.orm import Database, commit, select
+from loop.utils import get_search_name
+from pony.orm import Database, avg, count, select
 from pony.orm.core import Query
-from rapidfuzz import fuzz, process
-from rapidfuzz.utils import default_process
+
+if TYPE_CHECKING:
+    import numpy as np
 
 """
 This module deals with the interaction between friends/users. This includes:
@@ -39,14 +82,60 @@ FriendWorker:
 UserSearch:
 - Searching for users with/without search term (using fuzzy search)
 
-- Getting pending requests of a user
-- Getting a user's friends
+- Getting pending requests of a user (optionally paginated)
+- Getting a user's friends (optionally paginated)
+- Counting a user's friends and pending requests
+- Getting a map of friend statuses for a user (friends/pending)
 
 - Getting ratings for places and friends
+- Getting the places (as pins or clusters) in a map view rated by a user and
+  their friends
+- Getting the places rated by a user and their friends nearest a point
+  (paginated)
 - Getting pending requests inbound, outbound and both for a user
 """
 
 
+"""
+Typeahead clients search on every keystroke, so each user's last search is
+kept for a short time (per container) and reused when the next term extends
+it.
+"""
+USER_SEARCH_SESSIONS = TTLCache(
+    maxsize=USER_SEARCH_SESSION_MAX_USERS, ttl=USER_SEARCH_SESSION_TTL_SECONDS
+)
+USER_SEARCH_SESSIONS_LOCK = Lock()
+
+
+def clear_user_search_sessions(*user_ids: int) -> None:
+    """Clears the cached searches of users (e.g. when friendships change)."""
+    with USER_SEARCH_SESSIONS_LOCK:
+        for user_id in user_ids:
+            USER_SEARCH_SESSIONS.pop(user_id, None)
+
+
+"""
+Maps request the clusters of the same cells while panning and zooming, so
+each user's clusters are kept for a short time (per container) by
+(user, zoom, cell). Friends' new ratings show when they expire.
+"""
+PLACE_CLUSTERS = TTLCache(
+    maxsize=PLACE_CLUSTER_CACHE_MAX_CELLS, ttl=PLACE_CLUSTER_CACHE_TTL_SECONDS
+)
+PLACE_CLUSTERS_LOCK = Lock()
+
+
+def clear_place_clusters(*user_ids: int) -> None:
+    """
+    Clears the cached place clusters of users (e.g. when friendships or
+    their ratings change).
+    """
+    with PLACE_CLUSTERS_LOCK:
+        for key in list(PLACE_CLUSTERS.keys()):
+            if key[0] in user_ids:
+                PLACE_CLUSTERS.pop(key, None)
+
+
 class FriendWorker:
     def __init__(self, requestor: UserObject) -> None:
         if not isinstance(DB_TYPE[DbType.WRITE], Database):
@@ -77,14 +166,10 @@ class FriendWorker:
             raise TypeError(
                 'friend_status must be an instance of FriendStatusType.'
             )
-        friend_status_obj = self.db.Friend_status.get(
-            description=friend_status_type.value
+        return FriendStatus(
+            id=get_friend_status_id(friend_status_type),
+            status=friend_status_type,
         )
-        if not friend_status_obj:
-            raise UnknownFriendStatusTypeError(
-                f'Unknown friend status supplied: {friend_status_type.value}'
-            )
-        return FriendStatus(id=friend_status_obj.id, status=friend_status_type)
 
     def _create_friend_entry(self, target_user: UserObject) -> None:
         pending_status = self._get_friend_status(FriendStatusType.PENDING)
@@ -104,7 +189,8 @@ class FriendWorker:
                 f'and {target_user.id}.'
             )
         self._create_friend_entry(target_user)
-        commit()
+        clear_user_search_sessions(self.requestor.id, target_user.id)
+        clear_place_clusters(self.requestor.id, target_user.id)
         logger.info(
             'Successfully created friend entry in rds between users '
             f'{self.requestor.id} and {target_user.id}.'
@@ -129,8 +215,8 @@ class FriendWorker:
                 f'{self.requestor.id}.'
             )
         friend_object.status = friend_status.id
-        update_object_last_updated_time(friend_object)
-        commit()
+        clear_user_search_sessions(self.requestor.id, target_user.id)
+        clear_place_clusters(self.requestor.id, target_user.id)
         logger.info(
             'Successfully accepted friend request between users '
             f'{self.requestor.id} (requestor) and {target_user.id} '
@@ -151,7 +237,8 @@ class FriendWorker:
                 f'{self.requestor.id} and {target_user.id}.'
             )
         friend_object.delete()
-        commit()
+        clear_user_search_sessions(self.requestor.id, target_user.id)
+        clear_place_clusters(self.requestor.id, target_user.id)
         logger.info(
             'Successfully deleted friendship between users '
             f'{self.requestor.id} (requestor) and {target_user.id}'
@@ -159,39 +246,139 @@ class FriendWorker:
         )
 
 
-def _get_friends_from_query(query: Query, user: UserObject) -> List:
+def _get_friendships(
+    user: UserObject,
+    friend_status_type: FriendStatusType,
+    request_type: FriendRequestType = FriendRequestType.BOTH,
+    db_instance_type: DbType = DbType.WRITE,
+) -> Query:
+    """
+    This function returns the query of a user's friendships with a status,
+    filtered on the direction of the request (inbound, outbound or both).
+    """
+    status_id = get_friend_status_id(friend_status_type, db_instance_type)
+    friendships = select(
+        friend
+        for friend in DB_TYPE[db_instance_type].Friend
+        if friend.status.id == status_id
+    )
+    if request_type == FriendRequestType.INBOUND:
+        return friendships.filter(
+            lambda friend: friend.friend_2.id == user.id
+        )
+    elif request_type == FriendRequestType.OUTBOUND:
+        return friendships.filter(
+            lambda friend: friend.friend_1.id == user.id
+        )
+    elif request_type == FriendRequestType.BOTH:
+        return friendships.filter(
+            lambda friend: friend.friend_1.id == user.id
+            or friend.friend_2.id == user.id
+        )
+    raise TypeError('request_type should be of type FriendRequestType.')
+
+
+def _get_friends_query(
+    user: UserObject,
+    friendships: Query,
+    db_instance_type: DbType = DbType.WRITE,
+) -> Query:
+    """
+    This function projects the other user of each friendship to the columns
+    we return (no User entities are loaded), ordered by friendship id:
+
+    (friendship id, id, cognito_user_name, email, first_name, last_name)
+    """
+    return select(
+        (
+            friend.id,
+            other_user.id,
+            other_user.cognito_user_name,
+            other_user.email,
+            other_user.first_name,
+            other_user.last_name,
+        )
+        for friend in friendships
+        for other_user in DB_TYPE[db_instance_type].User
+        if (friend.friend_1 == other_user or friend.friend_2 == other_user)
+        and other_user.id != user.id
+    ).order_by(1)
+
+
+def _get_friends_from_query(query: Query) -> List:
     friends = []
-    for user_1, user_2 in query:
-        if user_1.id == user.id:
-            friend = user_2
-        else:
-            friend = user_1
-        friend_dict = {
-            'id': friend.id,
-            'user_name': friend.cognito_user_name,
-            'email': friend.email,
-            'first_name': friend.first_name,
-            'last_name': friend.last_name,
-        }
-        friends.append(friend_dict)
+    for _, id, user_name, email, first_name, last_name in query:
+        friends.append(
+            {
+                'id': id,
+                'user_name': user_name,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+            }
+        )
     return friends
 
 
+def _get_friends_page(
+    user: UserObject,
+    friendships: Query,
+    paginated_friends: PaginatedFriends,
+) -> FriendsPageResults:
+    """
+    This function returns a page of friends after the cursor (a friendship
+    id) along with the cursor for the next page (None on the last page).
+    """
+    if paginated_friends.cursor:
+        cursor = paginated_friends.cursor
+        friendships = friendships.filter(lambda friend: friend.id > cursor)
+    rows = _get_friends_query(user, friendships).limit(
+        paginated_friends.limit + 1
+    )
+    page_rows = rows[: paginated_friends.limit]
+    return FriendsPageResults(
+        page_data=_get_friends_from_query(page_rows),
+        next_cursor=(
+            page_rows[-1][0] if len(rows) > paginated_friends.limit else None
+        ),
+    )
+
+
 @DB_SESSION_RETRYABLE
 def get_user_friends(
     user: UserObject, db_instance_type: DbType = DbType.WRITE
 ) -> List:
     if not isinstance(user, UserObject):
         raise TypeError('user should be of type UserObject')
-    friends_query = select(
-        (friend.friend_1, friend.friend_2)
-        for friend in DB_TYPE[db_instance_type].Friend
-        if ((friend.friend_1.id == user.id) or (friend.friend_2.id == user.id))
-        and friend.status.description == FriendStatusType.FRIENDS.value
+    friendships = _get_friendships(
+        user, FriendStatusType.FRIENDS, db_instance_type=db_instance_type
+    )
+    return _get_friends_from_query(_get_friends_query(user, friendships))
+
+
+@DB_SESSION_RETRYABLE
+def get_user_friends_paginated(
+    user: UserObject,
+    paginated_friends: PaginatedFriends,
+    db_instance_type: DbType = DbType.WRITE,
+) -> FriendsPageResults:
+    """
+    Gets a page of the user's friends. PaginatedFriends consists of an
+    optional cursor (from the previous page) and a limit.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    if not isinstance(paginated_friends, PaginatedFriends):
+        raise TypeError(
+            'paginated_friends must be an instance of PaginatedFriends.'
+        )
+    friendships = _get_friendships(
+        user, FriendStatusType.FRIENDS, db_instance_type=db_instance_type
     )
-    return _get_friends_from_query(friends_query, user)
+    return _get_friends_page(user, friendships, paginated_friends)
 
 
+@DB_SESSION_RETRYABLE
 def get_user_friend_ids(user: UserObject, include_own_id=True) -> List[int]:
     """
     This function returns a list of user's friend ids.
@@ -200,19 +387,68 @@ def get_user_friend_ids(user: UserObject, include_own_id=True) -> List[int]:
     """
     if not isinstance(user, UserObject):
         raise TypeError('user should be of type UserObject')
-    users = [friend['id'] for friend in get_user_friends(user)]
+    friendships = _get_friendships(user, FriendStatusType.FRIENDS)
+    users = [row[1] for row in _get_friends_query(user, friendships)]
     if include_own_id:
         users.append(user.id)
     return users
 
 
+@DB_SESSION_RETRYABLE
+def get_user_friend_statuses(
+    user: UserObject, db_instance_type: DbType = DbType.WRITE
+) -> Dict[int, FriendStatusType]:
+    """
+    This function returns a map of {user_id: FriendStatusType} for everyone
+    the user is friends with or has a pending request with (either direction)
+    using a single query.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    status_types = {
+        get_friend_status_id(status_type, db_instance_type): status_type
+        for status_type in (FriendStatusType.FRIENDS, FriendStatusType.PENDING)
+    }
+    status_ids = list(status_types)
+    friends_query = select(
+        (friend.friend_1.id, friend.friend_2.id, friend.status.id)
+        for friend in DB_TYPE[db_instance_type].Friend
+        if ((friend.friend_1.id == user.id) or (friend.friend_2.id == user.id))
+        and friend.status.id in status_ids
+    )
+    friend_statuses = dict()
+    for friend_1_id, friend_2_id, status_id in friends_query:
+        friend_id = friend_2_id if friend_1_id == user.id else friend_1_id
+        friend_statuses[friend_id] = status_types[status_id]
+    return friend_statuses
+
+
 class UserSearch:
+    mode = UserSearchMode.FUZZY
+
     def __init__(self, user_object: UserObject) -> None:
         if not isinstance(user_object, UserObject):
             raise TypeError('user should be of type UserObject')
+        self.user_object = user_object
+        self._search_users = list()
+        self.pages = int()
+        self.user_data = list()
+
+    @cached_property
+    def friend_statuses(self) -> Dict[int, FriendStatusType]:
+        return get_user_friend_statuses(self.user_object)
+
+    def _get_users(self, search_term: str) -> Query:
+        """Returns the query of users which are candidates for the search."""
         users = get_all_users()
-        users = users.filter(lambda user: user.id != user_object.id)
-        self.users = select(
+        return users.filter(lambda user: user.id != self.user_object.id)
+
+    def _get_users_query(self, search_term: str) -> Query:
+        return self._select_search_users(self._get_users(search_term))
+
+    @staticmethod
+    def _select_search_users(users: Query) -> Query:
+        return select(
             (
                 user.id,
                 user.cognito_user_name,
@@ -221,30 +457,16 @@ class UserSearch:
             )
             for user in users
         )
-        self.friends = get_user_friend_ids(user_object, include_own_id=False)
-        self.pending_friends = [
-            request['id']
-            for request in get_pending_requests(
-                user_object, FriendRequestType.BOTH
-            )
-        ]
-        self._search_users = self._get_search_users()
-        self.pages = int()
-        self.user_data = list()
 
-    def _get_search_users(self) -> List[Dict[str, Union[int, str]]]:
+    def _get_search_users(
+        self, users_query: Query
+    ) -> List[Dict[str, Union[int, str]]]:
         search_users = list()
-        for user_id, username, first_name, last_name in self.users:
+        for user_id, username, first_name, last_name in users_query:
             name = f'{first_name} {last_name}'
-            friend_status = (
-                FriendStatusType.FRIENDS.value
-                if user_id in self.friends
-                else (
-                    FriendStatusType.PENDING.value
-                    if user_id in self.pending_friends
-                    else FriendStatusType.NOT_FRIENDS.value
-                )
-            )
+            friend_status = self.friend_statuses.get(
+                user_id, FriendStatusType.NOT_FRIENDS
+            ).value
             search_users.append(
                 {
                     'id': user_id,
@@ -255,9 +477,38 @@ class UserSearch:
             )
         return search_users
 
+    def _get_candidates(
+        self, search_term: str
+    ) -> Tuple[List[Dict[str, Union[int, str]]], bool]:
+        """
+        Returns the users which are candidates for the search term, and
+        whether they were cut off by the candidate limit.
+        """
+        users_query = self._get_users_query(search_term)
+        return self._get_search_users(users_query), False
+
+    def _can_narrow(
+        self, session: UserSearchSession, search_term: str
+    ) -> bool:
+        """
+        Whether the candidates of a previous search can be reused for the
+        search term. The candidates here do not depend on the term so they
+        are reused whenever the term extends the previous one (as long as
+        they were all cached).
+        """
+        return not session.truncated and search_term.startswith(session.term)
+
+    def _narrow(
+        self, session: UserSearchSession, search_term: str
+    ) -> List[Dict[str, Union[int, str]]]:
+        return session.search_users
+
     def _refine_users_by_search_term(
         self, search_term: str
     ) -> List[Dict[str, Union[int, str]]]:
+        from rapidfuzz import fuzz, process
+        from rapidfuzz.utils import default_process
+
         names = list(set([user.get('name') for user in self._search_users]))
         response = process.extract(
             search_term,
@@ -265,12 +516,80 @@ class UserSearch:
             scorer=fuzz.WRatio,
             processor=default_process,
         )
-        matches = [item[0] for item in response if item[1] > MIN_FUZZ_SCORE]
+        match_ranks = {
+            item[0]: rank
+            for rank, item in enumerate(response)
+            if item[1] > MIN_FUZZ_SCORE
+        }
         return sorted(
-            [user for user in self._search_users if user['name'] in matches],
-            key=lambda x: matches.index(x['name']),
+            [
+                user
+                for user in self._search_users
+                if user['name'] in match_ranks
+            ],
+            key=lambda x: match_ranks[x['name']],
         )
 
+    def _set_pages(self, count: int, page_count: int) -> bool:
+        """
+        Sets the total number of pages, returning False if there are no
+        results.
+        """
+        if count == 0:
+            return False
+        pages = math.ceil(count / SEARCH_USER_PAGE_COUNT)
+        if page_count > pages:
+            raise BadRequestError(
+                f'Page does not exist for query. (total pages = {pages}).'
+            )
+        self.pages = pages
+        return True
+
+    def _get_ranked_users(
+        self, search_term: str
+    ) -> List[Dict[str, Union[int, str]]]:
+        """
+        Returns the ranked users for the search term, reusing the user's
+        previous search where possible:
+        - The same term (e.g. a later page) reuses the ranking.
+        - A term extending the previous one reuses (and narrows) the
+          previous candidates rather than reading users from the database.
+        At most USER_SEARCH_SESSION_MAX_CANDIDATES users of each are cached,
+        so a cut off list is not reused.
+        """
+        with USER_SEARCH_SESSIONS_LOCK:
+            session: Optional[UserSearchSession] = USER_SEARCH_SESSIONS.get(
+                self.user_object.id
+            )
+        if session and session.mode != self.mode:
+            session = None
+        if (
+            session
+            and session.term == search_term
+            and not session.ranked_truncated
+        ):
+            return session.ranked_users
+        if session and self._can_narrow(session, search_term):
+            self._search_users = self._narrow(session, search_term)
+            truncated = session.truncated
+        else:
+            self._search_users, truncated = self._get_candidates(search_term)
+        if search_term:
+            ranked_users = self._refine_users_by_search_term(search_term)
+        else:
+            ranked_users = self._search_users
+        max_users = USER_SEARCH_SESSION_MAX_CANDIDATES
+        with USER_SEARCH_SESSIONS_LOCK:
+            USER_SEARCH_SESSIONS[self.user_object.id] = UserSearchSession(
+                mode=self.mode,
+                term=search_term,
+                search_users=self._search_users[:max_users],
+                ranked_users=ranked_users[:max_users],
+                truncated=truncated or len(self._search_users) > max_users,
+                ranked_truncated=len(ranked_users) > max_users,
+            )
+        return ranked_users
+
     def refine_search(self, search_users_obj: SearchUsers) -> None:
         if not isinstance(search_users_obj, SearchUsers):
             raise TypeError(
@@ -278,19 +597,9 @@ class UserSearch:
             )
         search_term = search_users_obj.term
         page_count = search_users_obj.page_count
-        if search_term:
-            users = self._refine_users_by_search_term(search_term)
-        else:
-            users = self._search_users
-        count = len(users)
-        if count == 0:
+        users = self._get_ranked_users(search_term)
+        if not self._set_pages(len(users), page_count):
             return
-        pages = math.ceil(count / SEARCH_USER_PAGE_COUNT)
-        if page_count > pages:
-            raise BadRequestError(
-                f'Page does not exist for query. (total pages = {pages}).'
-            )
-        self.pages = pages
         self.user_data = users[
             (page_count - 1)
             * SEARCH_USER_PAGE_COUNT : page_count
@@ -303,11 +612,122 @@ class UserSearch:
         )
 
 
+class DatabaseUserSearch(UserSearch):
+    """
+    Pushes candidate generation into the database using the normalised
+    User.search_name column (see loop.utils.get_search_name).
+
+    At most SEARCH_USER_DB_CANDIDATES users are read for a search term, and
+    only those are fuzzy re-ranked in Python:
+    - Users whose name starts with the longest token of the search term, by
+      a range scan of the search_name index.
+    - Only if there are fewer of those than the limit, users with a later
+      word starting with the token. This is a LIKE '% token%' condition,
+      which cannot use the index, so it scans the user table.
+    Each is ordered by search_name (then id) before the limit, so the same
+    candidates are read every time. Without a search term users are paged
+    in SQL.
+
+    UserSearch remains the reference implementation.
+    """
+
+    mode = UserSearchMode.DATABASE
+
+    @staticmethod
+    def _get_search_token(search_term: str) -> str:
+        tokens = get_search_name(search_term).split()
+        return max(tokens, key=len) if tokens else str()
+
+    @staticmethod
+    def _matches_token(name: str, token: str) -> bool:
+        search_name = get_search_name(name)
+        return search_name.startswith(token) or f' {token}' in search_name
+
+    def _can_narrow(
+        self, session: UserSearchSession, search_term: str
+    ) -> bool:
+        """
+        Candidates match a prefix of the longest search token, so they can be
+        narrowed in Python when that token extends the previous one (as long
+        as the previous candidates were not cut off by the limit).
+        """
+        previous_token = self._get_search_token(session.term)
+        return (
+            bool(previous_token)
+            and not session.truncated
+            and self._get_search_token(search_term).startswith(previous_token)
+        )
+
+    def _narrow(
+        self, session: UserSearchSession, search_term: str
+    ) -> List[Dict[str, Union[int, str]]]:
+        token = self._get_search_token(search_term)
+        return [
+            user
+            for user in session.search_users
+            if self._matches_token(user['name'], token)
+        ]
+
+    def _get_ordered_candidates(
+        self, users: Query, limit: int
+    ) -> List[Dict[str, Union[int, str]]]:
+        return self._get_search_users(
+            self._select_search_users(users)
+            .order_by(lambda: (user.search_name, user.id))
+            .limit(limit)
+        )
+
+    def _get_candidates(
+        self, search_term: str
+    ) -> Tuple[List[Dict[str, Union[int, str]]], bool]:
+        users = self._get_users(search_term)
+        token = self._get_search_token(search_term)
+        if not token:
+            candidates = self._get_ordered_candidates(
+                users, SEARCH_USER_DB_CANDIDATES
+            )
+            return candidates, len(candidates) >= SEARCH_USER_DB_CANDIDATES
+        candidates = self._get_ordered_candidates(
+            users.filter(lambda user: user.search_name.startswith(token)),
+            SEARCH_USER_DB_CANDIDATES,
+        )
+        if len(candidates) < SEARCH_USER_DB_CANDIDATES:
+            word_token = f' {token}'
+            candidates += self._get_ordered_candidates(
+                users.filter(
+                    lambda user: not user.search_name.startswith(token)
+                    and word_token in user.search_name
+                ),
+                SEARCH_USER_DB_CANDIDATES - len(candidates),
+            )
+        return candidates, len(candidates) >= SEARCH_USER_DB_CANDIDATES
+
+    def refine_search(self, search_users_obj: SearchUsers) -> None:
+        if not isinstance(search_users_obj, SearchUsers):
+            raise TypeError(
+                'search_users_obj should be an instance of SearchUsers'
+            )
+        if search_users_obj.term:
+            return super().refine_search(search_users_obj)
+        page_count = search_users_obj.page_count
+        users_query = self._get_users_query(search_users_obj.term)
+        if not self._set_pages(users_query.count(), page_count):
+            return
+        self.user_data = self._get_search_users(
+            users_query.order_by(1).page(page_count, SEARCH_USER_PAGE_COUNT)
+        )
+
+
 @DB_SESSION_RETRYABLE
 def search_for_users(
     user_object: UserObject, search_users: SearchUsers
 ) -> List[Dict]:
-    user_searcher = UserSearch(user_object)
+    if not isinstance(search_users, SearchUsers):
+        raise TypeError('search_users should be an instance of SearchUsers')
+    if search_users.mode == UserSearchMode.DATABASE:
+        user_searcher = DatabaseUserSearch(user_object)
+    else:
+        user_searcher = UserSearch(user_object)
     user_searcher.refine_search(search_users)
     return user_searcher.return_search()
 
@@ -320,6 +740,361 @@ def get_ratings_for_place_and_friends(place_id: str, user: UserObject) -> List:
     return get_ratings(users_friends, place_id=place_id)
 
 
+def _filter_geohash_cells(locations: Query, cells: List[str]) -> Query:
+    """Filters the locations query to those in the geohash cells."""
+    ranges = get_geohash_ranges(cells)
+    in_ranges = ' or '.join(
+        f'(location.geohash >= ranges[{i}][0] and '
+        f'location.geohash < ranges[{i}][1])'
+        for i in range(len(ranges))
+    )
+    return locations.filter(
+        f'lambda location: {in_ranges}', {}, {'ranges': ranges}
+    )
+
+
+def _get_bbox_locations(
+    bbox: BoundingBox, zoom: int, db_instance_type: DbType = DbType.WRITE
+) -> Query:
+    """
+    This function returns the query of locations inside the bounding box.
+    They are prefiltered on the geohash ranges of the cells covering the
+    bounding box at the zoom (which can use the geohash index).
+    """
+    south, west, north, east = bbox.to_tuple()
+    locations = _filter_geohash_cells(
+        select(
+            location
+            for location in DB_TYPE[db_instance_type].Location
+            if location.latitude >= south and location.latitude <= north
+        ),
+        get_bbox_cells(bbox.to_tuple(), get_zoom_precision(zoom)),
+    )
+    if west <= east:
+        return locations.filter(
+            lambda location: location.longitude >= west
+            and location.longitude <= east
+        )
+    return locations.filter(
+        lambda location: location.longitude >= west
+        or location.longitude <= east
+    )
+
+
+def _get_latest_reviewers(
+    location_ids: List[int],
+    user_ids: List[int],
+    db_instance_type: DbType = DbType.WRITE,
+) -> Dict[int, Dict]:
+    """
+    This function returns the latest rating (and its reviewer) among the
+    users' ratings of each location.
+    """
+    ratings_query = select(
+        (
+            rating.location.id,
+            rating.last_updated,
+            rating.id,
+            rating.user.id,
+            rating.user.first_name,
+            rating.user.last_name,
+        )
+        for rating in DB_TYPE[db_instance_type].Rating
+        if rating.location.id in location_ids and rating.user.id in user_ids
+    )
+    latest_ratings = dict()
+    for row in ratings_query:
+        latest_rating = latest_ratings.get(row[0])
+        if latest_rating is None or (row[1] or datetime.min, row[2]) > (
+            latest_rating[1] or datetime.min,
+            latest_rating[2],
+        ):
+            latest_ratings[row[0]] = row
+    return {
+        location_id: {
+            'id': user_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'last_rated': (
+                last_updated.strftime(LOOP_TIME_FORMAT)
+                if last_updated
+                else None
+            ),
+        }
+        for (
+            location_id,
+            last_updated,
+            _,
+            user_id,
+            first_name,
+            last_name,
+        ) in latest_ratings.values()
+    }
+
+
+@DB_SESSION_RETRYABLE
+def get_friend_places_in_bbox(
+    user: UserObject,
+    bbox: BoundingBox,
+    zoom: int,
+    db_instance_type: DbType = DbType.WRITE,
+) -> List[Dict]:
+    """
+    This function returns a pin for each place inside the bounding box
+    rated by the user or their friends, with the number of ratings, the
+    average food, price and vibe and the latest reviewer. At most
+    MAX_MAP_PINS (the most rated) are returned.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    if not isinstance(bbox, BoundingBox):
+        raise TypeError('bbox should be an instance of BoundingBox')
+    if not isinstance(zoom, int):
+        raise TypeError('zoom should be an int')
+    user_ids = get_user_friend_ids(user)
+    pins_query = select(
+        (
+            location.id,
+            location.google_id,
+            location.display_name,
+            location.latitude,
+            location.longitude,
+            count(rating),
+            avg(rating.food),
+            avg(rating.price),
+            avg(rating.vibe),
+        )
+        for location in _get_bbox_locations(bbox, zoom, db_instance_type)
+        for rating in location.ratings
+        if rating.user.id in user_ids
+    ).order_by(-6, 1)
+    pins = pins_query.limit(MAX_MAP_PINS)
+    latest_reviewers = _get_latest_reviewers(
+        [pin[0] for pin in pins], user_ids, db_instance_type
+    )
+    return [
+        {
+            'id': id,
+            'google_id': google_id,
+            'display_name': display_name,
+            'coordinates': {'lat': latitude, 'lng': longitude},
+            'ratings': ratings,
+            'food': round(food, 2),
+            'price': round(price, 2),
+            'vibe': round(vibe, 2),
+            'latest_reviewer': latest_reviewers.get(id),
+        }
+        for (
+            id,
+            google_id,
+            display_name,
+            latitude,
+            longitude,
+            ratings,
+            food,
+            price,
+            vibe,
+        ) in pins
+    ]
+
+
+def _cluster_friend_places(
+    user: UserObject,
+    cells: List[str],
+    db_instance_type: DbType = DbType.WRITE,
+) -> Dict[str, List[Dict]]:
+    """
+    This function returns the clusters of the places in each cell rated by
+    the user or their friends. Clusters are the cells with
+    PLACE_CLUSTER_PRECISION_OFFSET more characters (holding any places).
+    """
+    user_ids = get_user_friend_ids(user)
+    locations = _filter_geohash_cells(
+        select(location for location in DB_TYPE[db_instance_type].Location),
+        cells,
+    )
+    places = select(
+        (location, location.geohash, location.latitude, location.longitude)
+        for location in locations
+        for rating in location.ratings
+        if rating.user.id in user_ids
+    )[:]
+    cell_length = len(cells[0])
+    cluster_cells, counts, latitudes, longitudes = cluster_points(
+        [geohash for _, geohash, _, _ in places],
+        [latitude for _, _, latitude, _ in places],
+        [longitude for _, _, _, longitude in places],
+        min(cell_length + PLACE_CLUSTER_PRECISION_OFFSET, GEOHASH_PRECISION),
+    )
+    clusters = {cell: list() for cell in cells}
+    for cluster_cell, cluster_count, latitude, longitude in zip(
+        cluster_cells.tolist(),
+        counts.tolist(),
+        latitudes.tolist(),
+        longitudes.tolist(),
+    ):
+        clusters[cluster_cell[:cell_length]].append(
+            {
+                'geohash': cluster_cell,
+                'count': cluster_count,
+                'coordinates': {
+                    'lat': round(latitude, 6),
+                    'lng': round(longitude, 6),
+                },
+            }
+        )
+    return clusters
+
+
+@DB_SESSION_RETRYABLE
+def get_friend_place_clusters(
+    user: UserObject,
+    bbox: BoundingBox,
+    zoom: int,
+    db_instance_type: DbType = DbType.WRITE,
+) -> List[Dict]:
+    """
+    This function returns the clusters of the places rated by the user and
+    their friends in the geohash cells covering the bounding box at the
+    zoom, with the number of places and their centroid. Each cell's clusters
+    are cached for the user and zoom.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    if not isinstance(bbox, BoundingBox):
+        raise TypeError('bbox should be an instance of BoundingBox')
+    if not isinstance(zoom, int):
+        raise TypeError('zoom should be an int')
+    cells = get_bbox_cells(bbox.to_tuple(), get_zoom_precision(zoom))
+    clusters = dict()
+    with PLACE_CLUSTERS_LOCK:
+        for cell in cells:
+            cell_clusters = PLACE_CLUSTERS.get((user.id, zoom, cell))
+            if cell_clusters is not None:
+                clusters[cell] = cell_clusters
+    missing_cells = [cell for cell in cells if cell not in clusters]
+    if missing_cells:
+        missing_clusters = _cluster_friend_places(
+            user, missing_cells, db_instance_type
+        )
+        with PLACE_CLUSTERS_LOCK:
+            for cell, cell_clusters in missing_clusters.items():
+                PLACE_CLUSTERS[(user.id, zoom, cell)] = cell_clusters
+        clusters.update(missing_clusters)
+    return [cluster for cell in cells for cluster in clusters[cell]]
+
+
+def _get_places_within_radius(
+    user_ids: List[int],
+    lat: float,
+    lng: float,
+    radius_km: float,
+    db_instance_type: DbType = DbType.WRITE,
+) -> Tuple[List[Tuple], 'np.ndarray']:
+    """
+    This function returns the places rated by the users within the radius
+    of the point, and their distances, ordered by distance.
+    """
+    import numpy as np
+
+    locations = _filter_geohash_cells(
+        select(location for location in DB_TYPE[db_instance_type].Location),
+        get_bbox_cells(
+            get_radius_bbox(lat, lng, radius_km), GEOHASH_PRECISION
+        ),
+    )
+    places = select(
+        (
+            location.id,
+            location.google_id,
+            location.display_name,
+            location.latitude,
+            location.longitude,
+        )
+        for location in locations
+        for rating in location.ratings
+        if rating.user.id in user_ids
+    )[:]
+    distances = get_haversine_distances(
+        lat,
+        lng,
+        [place[3] for place in places],
+        [place[4] for place in places],
+    )
+    # Ordered by distance, then id.
+    order = np.lexsort(([place[0] for place in places], distances))
+    order = order[distances[order] <= radius_km]
+    return [places[index] for index in order], distances[order]
+
+
+@DB_SESSION_RETRYABLE
+def get_nearby_friend_places(
+    user: UserObject,
+    nearby_places: NearbyPlaces,
+    db_instance_type: DbType = DbType.WRITE,
+) -> NearbyPlacesPageResults:
+    """
+    This function returns a page of the places rated by the user and their
+    friends ordered by their distance from the point. Places are searched
+    for within a radius of the point (prefiltered on the geohash cells
+    covering it), which grows until it holds the page.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    if not isinstance(nearby_places, NearbyPlaces):
+        raise TypeError('nearby_places should be an instance of NearbyPlaces')
+    user_ids = get_user_friend_ids(user)
+    places_count = select(
+        rating.location
+        for rating in DB_TYPE[db_instance_type].Rating
+        if rating.user.id in user_ids
+    ).count()
+    if places_count == 0:
+        return NULL_NEARBY_PLACES_PAGE_RESULT
+    pages = math.ceil(places_count / NEARBY_PLACES_PAGE_COUNT)
+    if nearby_places.page_count > pages:
+        raise BadRequestError(
+            f'Page does not exist for query. (total pages = {pages}).'
+        )
+    end = min(
+        nearby_places.page_count * NEARBY_PLACES_PAGE_COUNT, places_count
+    )
+    radius_km = NEARBY_PLACES_MIN_RADIUS_KM
+    while True:
+        places, distances = _get_places_within_radius(
+            user_ids,
+            nearby_places.lat,
+            nearby_places.lng,
+            radius_km,
+            db_instance_type,
+        )
+        if len(places) >= end or radius_km >= MAX_DISTANCE_KM:
+            break
+        radius_km *= NEARBY_PLACES_RADIUS_GROWTH
+    start = (nearby_places.page_count - 1) * NEARBY_PLACES_PAGE_COUNT
+    return NearbyPlacesPageResults(
+        page_data=[
+            {
+                'id': id,
+                'google_id': google_id,
+                'display_name': display_name,
+                'coordinates': {'lat': latitude, 'lng': longitude},
+                'distance_km': round(distance, 3),
+            }
+            for (
+                id,
+                google_id,
+                display_name,
+                latitude,
+                longitude,
+            ), distance in zip(
+                places[start:end], distances[start:end].tolist()
+            )
+        ],
+        total_pages=pages,
+    )
+
+
 @DB_SESSION_RETRYABLE
 def get_pending_requests(
     user: UserObject,
@@ -328,27 +1103,61 @@ def get_pending_requests(
 ) -> List:
     if not isinstance(user, UserObject):
         raise TypeError('user should be of type UserObject')
-    friends_query = select(
-        friend
-        for friend in DB_TYPE[DbType.WRITE].Friend
-        if friend.status.description == FriendStatusType.PENDING.value
+    friendships = _get_friendships(
+        user, FriendStatusType.PENDING, request_type, db_instance_type
     )
-    if request_type == FriendRequestType.INBOUND:
-        friends_query = friends_query.filter(
-            lambda friend: friend.friend_2.id == user.id
-        )
-    elif request_type == FriendRequestType.OUTBOUND:
-        friends_query = friends_query.filter(
-            lambda friend: friend.friend_1.id == user.id
-        )
-    elif request_type == FriendRequestType.BOTH:
-        friends_query = friends_query.filter(
-            lambda friend: friend.friend_1.id == user.id
-            or friend.friend_2.id == user.id
+    return _get_friends_from_query(_get_friends_query(user, friendships))
+
+
+@DB_SESSION_RETRYABLE
+def get_pending_requests_paginated(
+    user: UserObject,
+    request_type: FriendRequestType,
+    paginated_friends: PaginatedFriends,
+    db_instance_type: DbType = DbType.WRITE,
+) -> FriendsPageResults:
+    """
+    Gets a page of the user's pending requests (inbound, outbound or both).
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    if not isinstance(paginated_friends, PaginatedFriends):
+        raise TypeError(
+            'paginated_friends must be an instance of PaginatedFriends.'
         )
-    else:
-        raise TypeError('request_type should be of type FriendRequestType.')
-    friends_query = select(
-        (friend.friend_1, friend.friend_2) for friend in friends_query
+    friendships = _get_friendships(
+        user, FriendStatusType.PENDING, request_type, db_instance_type
+    )
+    return _get_friends_page(user, friendships, paginated_friends)
+
+
+@DB_SESSION_RETRYABLE
+def get_friend_counts(
+    user: UserObject, db_instance_type: DbType = DbType.WRITE
+) -> FriendCounts:
+    """
+    This function counts the user's friends and inbound/outbound pending
+    requests using one grouped query.
+    """
+    if not isinstance(user, UserObject):
+        raise TypeError('user should be of type UserObject')
+    friends_status_id = get_friend_status_id(
+        FriendStatusType.FRIENDS, db_instance_type
+    )
+    pending_status_id = get_friend_status_id(
+        FriendStatusType.PENDING, db_instance_type
+    )
+    counts_query = select(
+        (friend.status.id, friend.friend_1.id == user.id, count(friend))
+        for friend in DB_TYPE[db_instance_type].Friend
+        if friend.friend_1.id == user.id or friend.friend_2.id == user.id
     )
-    return _get_friends_from_query(friends_query, user)
+    friend_counts = FriendCounts()
+    for status_id, is_outbound, status_count in counts_query:
+        if status_id == friends_status_id:
+            friend_counts.friends += status_count
+        elif status_id == pending_status_id and is_outbound:
+            friend_counts.outbound += status_count
+        elif status_id == pending_status_id:
+            friend_counts.inbound += status_count
+    return friend_counts
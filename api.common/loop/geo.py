@@ -0,0 +1,221 @@
+import math
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+from loop.constants import GEOHASH_PRECISION, MAX_BBOX_GEOHASH_CELLS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+"""
+Geohashes for spatial queries on Location coordinates.
+
+A geohash interleaves longitude and latitude bits and base32 encodes them, so
+places in the same cell share a prefix, and the geohashes in a cell are a
+contiguous range. A bounding box can then be prefiltered in SQL with a few
+range conditions on the (indexed) geohash column.
+
+numpy is only imported by the functions that use it: loop.db_entities
+imports this module (for encode_geohash), so every lambda does too.
+"""
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Sorts after every geohash.
+GEOHASH_END = '{'
+# (south, west, north, east) in degrees.
+Bbox = Tuple[float, float, float, float]
+# Mean radius.
+EARTH_RADIUS_KM = 6371.0088
+# Half the circumference (no two points are further apart).
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def encode_geohash(
+    lat: float, lng: float, precision: int = GEOHASH_PRECISION
+) -> str:
+    """Standard geohash (the same as MySQL's ST_GeoHash(lng, lat, n))."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value_range, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def get_cell_size(precision: int) -> Tuple[float, float]:
+    """The (height, width) in degrees of cells with this precision."""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2**lat_bits, 360 / 2**lng_bits
+
+
+def get_zoom_precision(zoom: int) -> int:
+    """
+    The geohash precision with cells about the size of a map tile at the
+    (web map) zoom level.
+    """
+    return min(max(zoom * 2 // 5, 1), GEOHASH_PRECISION)
+
+
+def _get_step_count(start: float, end: float, step: float) -> int:
+    return max(math.ceil((end - start) / step), 0) + 1
+
+
+def _get_steps(start: float, end: float, step: float) -> List[float]:
+    """Points from start to end at most step apart (both included)."""
+    count = _get_step_count(start, end, step) - 1
+    return [start + i * step for i in range(count)] + [end]
+
+
+def _split_antimeridian(bbox: Bbox) -> List[Bbox]:
+    south, west, north, east = bbox
+    if west <= east:
+        return [bbox]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def get_bbox_cells(bbox: Bbox, precision: int) -> List[str]:
+    """
+    The geohash cells of the precision covering the bounding box (which
+    crosses the antimeridian if west > east). The precision is lowered
+    until there are at most MAX_BBOX_GEOHASH_CELLS cells.
+    """
+    for cell_precision in range(precision, 0, -1):
+        height, width = get_cell_size(cell_precision)
+        bboxes = _split_antimeridian(bbox)
+        # Skip (without listing their cells) precisions with far too many.
+        if (
+            sum(
+                _get_step_count(south, north, height)
+                * _get_step_count(west, east, width)
+                for south, west, north, east in bboxes
+            )
+            > 4 * MAX_BBOX_GEOHASH_CELLS
+        ):
+            continue
+        cells = list()
+        for south, west, north, east in bboxes:
+            for lat in _get_steps(south, north, height):
+                for lng in _get_steps(west, east, width):
+                    cells.append(encode_geohash(lat, lng, cell_precision))
+        cells = list(dict.fromkeys(cells))
+        if len(cells) <= MAX_BBOX_GEOHASH_CELLS:
+            return cells
+    return list(GEOHASH_BASE32)
+
+
+def _get_cell_end(cell: str) -> str:
+    """The first geohash (of any length) after those in the cell."""
+    for i in range(len(cell) - 1, -1, -1):
+        index = GEOHASH_BASE32.index(cell[i])
+        if index < len(GEOHASH_BASE32) - 1:
+            return cell[:i] + GEOHASH_BASE32[index + 1]
+    return GEOHASH_END
+
+
+def get_geohash_ranges(cells: List[str]) -> List[Tuple[str, str]]:
+    """
+    The [start, end) geohash ranges covering the cells, with adjacent cells
+    merged into one range.
+    """
+    ranges = list()
+    for cell in sorted(cells):
+        if ranges and ranges[-1][1] >= cell:
+            start, end = ranges[-1]
+            ranges[-1] = (start, max(end, _get_cell_end(cell)))
+        else:
+            ranges.append((cell, _get_cell_end(cell)))
+    return ranges
+
+
+def cluster_points(
+    geohashes: Sequence[str],
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    precision: int,
+) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """
+    Groups the points by the cell (of the precision) containing them.
+    Returns the cells, the number of points in each and their centroids
+    (latitudes and longitudes), ordered by cell.
+    """
+    import numpy as np
+
+    cells, cell_indexes, counts = np.unique(
+        np.asarray(geohashes, dtype=f'U{precision}'),
+        return_inverse=True,
+        return_counts=True,
+    )
+    # A cell never crosses the antimeridian, so its centroid is the mean.
+    latitudes = np.bincount(
+        cell_indexes, weights=latitudes, minlength=len(cells)
+    )
+    longitudes = np.bincount(
+        cell_indexes, weights=longitudes, minlength=len(cells)
+    )
+    return cells, counts, latitudes / counts, longitudes / counts
+
+
+def get_haversine_distances(
+    lat: float,
+    lng: float,
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+) -> 'np.ndarray':
+    """The great circle distances (in km) from the point to each point."""
+    import numpy as np
+
+    lat, lng = math.radians(lat), math.radians(lng)
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+    a = (
+        np.sin((latitudes - lat) / 2) ** 2
+        + math.cos(lat)
+        * np.cos(latitudes)
+        * np.sin((longitudes - lng) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def get_radius_bbox(lat: float, lng: float, radius_km: float) -> Bbox:
+    """
+    A bounding box containing every point within the radius of the point
+    (crossing the antimeridian if it needs to).
+    """
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = lat - lat_delta, lat + lat_delta
+    if south <= -90 or north >= 90:
+        # Every longitude is within the radius across the pole.
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    # The widest point of the circle (at most 90 degrees, as it does not
+    # reach a pole).
+    lng_delta = math.degrees(
+        math.asin(
+            min(
+                math.sin(radius_km / EARTH_RADIUS_KM)
+                / math.cos(math.radians(lat)),
+                1,
+            )
+        )
+    )
+    west, east = lng - lng_delta, lng + lng_delta
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
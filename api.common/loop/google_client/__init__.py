@@ -10,6 +10,7 @@ from .places import (
     PlaceSearcher,
     PlacesSearcher,
     find_location,
+    find_locations,
     get_coordinates_from_result,
     search_place,
 )
@@ -1,11 +1,29 @@
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-import googlemaps
-from googlemaps.exceptions import ApiError
 from loop.api_classes import Coordinates
+from loop.constants import (
+    FIND_LOCATIONS_MAX_WORKERS,
+    GOOGLE_CONNECT_TIMEOUT_SECONDS,
+    GOOGLE_PLACE_TIMEOUT_SECONDS,
+    GOOGLE_READ_TIMEOUT_SECONDS,
+    GOOGLE_RETRY_TIMEOUT_SECONDS,
+    MIN_CALL_BUDGET_SECONDS,
+    logger,
+)
 from loop.data_classes import Location
-from loop.exceptions import BadRequestError, GoogleApiError
+from loop.deadline import (
+    check_budget,
+    get_timeout,
+    get_timeouts,
+    has_budget,
+)
+from loop.exceptions import (
+    BadRequestError,
+    GatewayTimeoutError,
+    GoogleApiError,
+    LoopException,
+)
 from loop.google_client import (
     DEFAULT_RADIUS,
     GOOGLE_API_KEY_SECRET,
@@ -14,6 +32,7 @@ from loop.google_client import (
     TEXTQUERY,
 )
 from loop.secrets import get_secret
+from loop.utils import get_result, submit
 
 
 def get_coordinates_from_result(result: Dict) -> Coordinates:
@@ -53,10 +72,23 @@ class GooglePlaces:
         https://github.com/googlemaps/google-maps-services-python/blob/
         master/googlemaps/places.py
         """
+        # googlemaps (and requests) are imported on first use to keep them
+        # out of the lambda cold start.
+        import googlemaps
+
+        check_budget('Google')
         google_api_key = get_secret(GOOGLE_API_KEY_SECRET)
         if 'key' not in google_api_key:
             raise ValueError('google api secret must have key.')
-        self.gmaps = googlemaps.Client(key=google_api_key['key'])
+        connect_timeout, read_timeout = get_timeouts(
+            GOOGLE_CONNECT_TIMEOUT_SECONDS, GOOGLE_READ_TIMEOUT_SECONDS
+        )
+        self.gmaps = googlemaps.Client(
+            key=google_api_key['key'],
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retry_timeout=get_timeout(GOOGLE_RETRY_TIMEOUT_SECONDS),
+        )
 
 
 class PlaceSearcher(GooglePlaces):
@@ -100,10 +132,7 @@ class PlaceSearcher(GooglePlaces):
         """
         if not isinstance(google_id, str):
             raise TypeError('google_id must be of type str')
-        try:
-            place = self.gmaps.place(google_id)
-        except ApiError as e:
-            raise e
+        place = self.gmaps.place(google_id)
         self._validate_place(place)
         result = place['result']
         coordinates: Coordinates = get_coordinates_from_result(result)
@@ -155,15 +184,12 @@ class PlacesSearcher(GooglePlaces):
             raise TypeError('search_text must be of type str')
         if not isinstance(coordinates, Coordinates):
             raise TypeError('coordinates must be an instance of Coordinates.')
-        try:
-            response = self.gmaps.find_place(
-                search_text,
-                TEXTQUERY,
-                location_bias=self._get_location_bias(coordinates),
-                fields=SEARCH_FIELDS,
-            )
-        except ApiError as e:
-            raise e
+        response = self.gmaps.find_place(
+            search_text,
+            TEXTQUERY,
+            location_bias=self._get_location_bias(coordinates),
+            fields=SEARCH_FIELDS,
+        )
         self._validate_search(response)
         return response['candidates']
 
@@ -197,17 +223,14 @@ class PhotoDownloader(GooglePlaces):
         """
         self._validate(photo_reference, filename, max_width)
         file_path = os.path.join(TEMPDIR, filename)
-        try:
-            f = open(file_path, 'wb')
-            for chunk in self.gmaps.places_photo(
-                photo_reference, max_width=max_width
-            ):
-                if chunk:
-                    f.write(chunk)
-            f.close()
-            return file_path
-        except ApiError as e:
-            raise e
+        f = open(file_path, 'wb')
+        for chunk in self.gmaps.places_photo(
+            photo_reference, max_width=max_width
+        ):
+            if chunk:
+                f.write(chunk)
+        f.close()
+        return file_path
 
 
 def search_place(
@@ -219,6 +242,8 @@ def search_place(
 
 def find_location(google_id: str) -> Location:
     '''Finds location using google API'''
+    from googlemaps.exceptions import ApiError
+
     place_searcher = PlaceSearcher()
     try:
         return place_searcher.get_place(google_id)
@@ -226,3 +251,53 @@ def find_location(google_id: str) -> Location:
         raise BadRequestError(
             f'Could not find google place with ID: {google_id}'
         )
+
+
+def _find_location_or_none(google_id: str) -> Optional[Location]:
+    from googlemaps.exceptions import Timeout, TransportError
+
+    try:
+        return find_location(google_id)
+    except (LoopException, Timeout, TransportError) as e:
+        logger.warning(f'Could not find google place {google_id}: {e!r}')
+        return None
+
+
+def find_locations(
+    google_ids: List[str], max_workers: int = FIND_LOCATIONS_MAX_WORKERS
+) -> Tuple[Dict[str, Location], List[str]]:
+    """
+    Finds many locations using google API, at most max_workers at a time.
+    Returns the locations by google_id and the google_ids that could not be
+    found, including those which timed out or were not looked up because
+    the request ran out of time.
+    """
+    if not google_ids:
+        return dict(), list()
+    locations = dict()
+    # In batches on the shared thread pool, so an import does not take up
+    # all of its workers.
+    for i in range(0, len(google_ids), max_workers):
+        if not has_budget(MIN_CALL_BUDGET_SECONDS):
+            logger.warning(
+                'Not enough time left to find google places, '
+                f'{len(google_ids) - i} were not looked up.'
+            )
+            break
+        futures = {
+            google_id: submit(_find_location_or_none, google_id)
+            for google_id in google_ids[i : i + max_workers]
+        }
+        for google_id, future in futures.items():
+            try:
+                location = get_result(
+                    future, GOOGLE_PLACE_TIMEOUT_SECONDS, 'Google place'
+                )
+            except GatewayTimeoutError as e:
+                logger.warning(f'Could not find google place {google_id}: {e}')
+                continue
+            if location:
+                locations[google_id] = location
+    return locations, [
+        google_id for google_id in google_ids if google_id not in locations
+    ]
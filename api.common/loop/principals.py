@@ -0,0 +1,138 @@
+import hashlib
+import json
+import time
+from threading import Lock
+from typing import Dict, Optional
+
+import jwt
+from cachetools import LRUCache
+from loop import data
+from loop.constants import (
+    COGNITO_JWKS_FILE,
+    COGNITO_JWKS_SECRET_NAME,
+    JWT_ALGORITHM,
+    PRINCIPAL_CACHE_MAX_TOKENS,
+)
+from loop.data_classes import CachedPrincipal, UserObject
+from loop.exceptions import UnauthorizedError
+from loop.secrets import get_secret
+
+"""
+This module resolves the user (principal) making a request from their Cognito
+token:
+
+- Decoding the token, verifying its signature locally when a JWKS document is
+  configured (COGNITO_JWKS_FILE or COGNITO_JWKS_SECRET_NAME)
+- Caching the resolved UserObject by token hash until the token's exp claim,
+  so repeated requests with the same token cost no I/O
+
+A cached principal is not refreshed before the token expires, so changes to
+the user's groups are picked up with their next token.
+"""
+
+PRINCIPAL_CACHE = LRUCache(maxsize=PRINCIPAL_CACHE_MAX_TOKENS)
+PRINCIPAL_CACHE_LOCK = Lock()
+
+JWKS: Optional[Dict[str, jwt.PyJWK]] = None
+JWKS_LOCK = Lock()
+
+
+def _load_jwks_document() -> Optional[Dict]:
+    if COGNITO_JWKS_FILE:
+        with open(COGNITO_JWKS_FILE) as jwks_file:
+            return json.load(jwks_file)
+    if COGNITO_JWKS_SECRET_NAME:
+        return get_secret(COGNITO_JWKS_SECRET_NAME)
+    return None
+
+
+def get_jwks() -> Optional[Dict[str, jwt.PyJWK]]:
+    """
+    Returns the signing keys by key id, or None if local signature
+    verification is not configured. The document is loaded once per
+    container.
+    """
+    global JWKS
+    with JWKS_LOCK:
+        if JWKS is None:
+            jwks_document = _load_jwks_document()
+            if jwks_document is None:
+                return None
+            if 'keys' not in jwks_document:
+                raise ValueError('JWKS document missing keys.')
+            JWKS = {
+                key['kid']: jwt.PyJWK(key, algorithm=JWT_ALGORITHM)
+                for key in jwks_document['keys']
+            }
+        return JWKS
+
+
+def decode_auth_token(auth_token: str) -> Dict:
+    """Decodes the token's claims, verifying it if a JWKS is configured."""
+    jwks = get_jwks()
+    try:
+        if jwks is None:
+            return jwt.decode(auth_token, options={'verify_signature': False})
+        key_id = jwt.get_unverified_header(auth_token).get('kid')
+        if key_id not in jwks:
+            raise UnauthorizedError('Unknown token signing key')
+        return jwt.decode(
+            auth_token,
+            key=jwks[key_id].key,
+            algorithms=[JWT_ALGORITHM],
+            options={'verify_aud': False, 'require': ['exp']},
+        )
+    except UnauthorizedError as e:
+        raise e
+    except jwt.ExpiredSignatureError as e:
+        raise UnauthorizedError('Token has expired')
+    except jwt.InvalidTokenError as e:
+        raise UnauthorizedError(f'Jwt decode error: {e}')
+    except Exception as e:
+        raise UnauthorizedError(f'Unexpected error: {e}')
+
+
+def _get_cached_principal(token_hash: str) -> Optional[UserObject]:
+    with PRINCIPAL_CACHE_LOCK:
+        cached_principal = PRINCIPAL_CACHE.get(token_hash)
+        if not cached_principal:
+            return None
+        if cached_principal.expires_at <= time.time():
+            PRINCIPAL_CACHE.pop(token_hash, None)
+            return None
+        return cached_principal.user
+
+
+def get_user_from_auth_token(auth_token: str) -> UserObject:
+    """
+    Gets the user for a Cognito token, from the principal cache where
+    possible.
+    """
+    if not isinstance(auth_token, str):
+        raise TypeError('auth_token must be of type str')
+    token_hash = hashlib.sha256(auth_token.encode()).hexdigest()
+    user = _get_cached_principal(token_hash)
+    if user:
+        return user
+    cognito_user = decode_auth_token(auth_token)
+    if not cognito_user:
+        raise UnauthorizedError("Could not find cognito user")
+    cognito_user_name = cognito_user.get('sub')
+    if not cognito_user_name:
+        raise UnauthorizedError("Could not find cognito username")
+    user = data.get_user_from_cognito_username(cognito_user_name)
+    expires_at = cognito_user.get('exp')
+    if isinstance(expires_at, (int, float)) and expires_at > time.time():
+        with PRINCIPAL_CACHE_LOCK:
+            PRINCIPAL_CACHE[token_hash] = CachedPrincipal(
+                user=user, expires_at=expires_at
+            )
+    return user
+
+
+def clear_principal_cache() -> None:
+    global JWKS
+    with PRINCIPAL_CACHE_LOCK:
+        PRINCIPAL_CACHE.clear()
+    with JWKS_LOCK:
+        JWKS = None
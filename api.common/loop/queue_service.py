@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
 
-import boto3
 from botocore.exceptions import ClientError
 from loop.constants import SQS_BATCH_SIZE, logger
+from loop.deadline import check_budget, get_boto_config
 from loop.utils import conditional_dump
 
 
@@ -14,8 +14,13 @@ class SqsClient:
     def __init__(self, queue_name: str) -> None:
         if not isinstance(queue_name, str):
             raise TypeError('queue_name must be of type str')
+        import boto3
+
+        check_budget('SQS')
         try:
-            self.queue = boto3.resource('sqs').get_queue_by_name(
+            self.queue = boto3.resource(
+                'sqs', config=get_boto_config()
+            ).get_queue_by_name(
                 QueueName=queue_name
             )
         except ClientError as e:
@@ -1,7 +1,6 @@
 from typing import Dict, Optional
 
-import boto3
-from botocore.exceptions import ClientError
+from loop.deadline import check_budget, get_boto_config
 from loop.exceptions import BucketNotFoundError
 
 
@@ -16,7 +15,10 @@ class S3Service:
         '''
         if not isinstance(bucket_name, str):
             raise TypeError('bucket_name must be of type str')
-        self.s3 = boto3.client("s3")
+        import boto3
+
+        check_budget('S3')
+        self.s3 = boto3.client("s3", config=get_boto_config())
         if bucket_name not in [
             b['Name'] for b in self.s3.list_buckets().get('Buckets', list())
         ]:
@@ -34,9 +36,6 @@ class S3Service:
     def upload_file(
         self, filename: str, key: str, extra_args: Optional[Dict] = None
     ) -> None:
-        try:
-            self.s3.upload_file(
-                filename, self.bucket_name, key, ExtraArgs=extra_args
-            )
-        except boto3.exceptions.S3UploadFailedError as e:
-            raise e
+        self.s3.upload_file(
+            filename, self.bucket_name, key, ExtraArgs=extra_args
+        )
@@ -1,56 +1,145 @@
+import copy
 import json
 import logging
 import os
-from typing import Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, Optional
 
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+from loop.constants import (
+    BATCH_GET_SECRET_MAX_IDS,
+    SECRET_CACHE_TTL_SECONDS,
+    SECRET_PREFETCH_MAX_WORKERS,
+    SECRET_STALE_GRACE_SECONDS,
+)
+from loop.data_classes import CachedSecret
 from loop.local_secrets import LocalSecretsManager
 
 logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get("LOGLEVEL", "INFO"))
 
-# Handle region control.
-REGION = boto3.session.Session().region_name
+# Optional override container for development, loaded on first use.
+SECRET_OVERRIDES: Optional[Dict] = None
 
-# Optional override container for development.
-SECRET_OVERRIDES = {}
+# Secrets are cached per container for SECRET_CACHE_TTL_SECONDS so Secrets
+# Manager latency and throttling is not paid on every request. Expired entries
+# are fetched again (picking up any rotation); if that refresh fails the stale
+# value is served for a short grace period rather than failing the request.
+SECRET_CACHE: Dict[str, CachedSecret] = {}
+SECRET_CACHE_LOCK = Lock()
+SECRETS_CLIENTS: Dict[str, object] = {}
 
-SECRET_OVERRIDES = LocalSecretsManager.unmarshall().secrets_lookup_by_name_map
-assert isinstance(SECRET_OVERRIDES, dict)
 
+@lru_cache(maxsize=None)
+def get_region() -> Optional[str]:
+    """
+    Lambda sets the region in the environment, so we only fall back to a
+    boto3 session (which reads the AWS config files) when running elsewhere.
+    """
+    region = os.environ.get('AWS_REGION') or os.environ.get(
+        'AWS_DEFAULT_REGION'
+    )
+    if region:
+        return region
+    import boto3
+
+    return boto3.session.Session().region_name
+
+
+def get_secret_overrides() -> Dict:
+    global SECRET_OVERRIDES
+    if SECRET_OVERRIDES is None:
+        secret_overrides = (
+            LocalSecretsManager.unmarshall().secrets_lookup_by_name_map
+        )
+        assert isinstance(secret_overrides, dict)
+        SECRET_OVERRIDES = secret_overrides
+    return SECRET_OVERRIDES
 
-def get_secret(secret_name: str, add_environment=False, region=REGION):
 
+def _get_secret_name(secret_name: str, add_environment=False) -> str:
     if add_environment:
-        secret_name = '{}-{}'.format(secret_name, os.environ["ENVIRONMENT"])
+        return '{}-{}'.format(secret_name, os.environ["ENVIRONMENT"])
+    return secret_name
 
-    if secret_name in SECRET_OVERRIDES:
-        return SECRET_OVERRIDES[secret_name]
 
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region)
+def _get_secrets_client(region: str):
+    """Secrets Manager clients are thread safe so one is shared per region."""
+    import boto3
+
+    with SECRET_CACHE_LOCK:
+        if region not in SECRETS_CLIENTS:
+            session = boto3.session.Session()
+            SECRETS_CLIENTS[region] = session.client(
+                service_name='secretsmanager', region_name=region
+            )
+        return SECRETS_CLIENTS[region]
+
+
+def _cache_secret(
+    secret_name: str, secret: Dict, version_id: Optional[str]
+) -> None:
+    with SECRET_CACHE_LOCK:
+        cached_secret = SECRET_CACHE.get(secret_name)
+        if cached_secret and cached_secret.version_id != version_id:
+            logger.info(f'Secret {secret_name} has been rotated.')
+        SECRET_CACHE[secret_name] = CachedSecret(
+            value=secret,
+            version_id=version_id,
+            expires_at=time.monotonic() + SECRET_CACHE_TTL_SECONDS,
+        )
 
+
+def _get_cached_secret(
+    secret_name: str, allow_expired=False
+) -> Optional[CachedSecret]:
+    cached_secret = SECRET_CACHE.get(secret_name)
+    if not cached_secret:
+        return None
+    if allow_expired or cached_secret.expires_at > time.monotonic():
+        return cached_secret
+    return None
+
+
+def _serve_stale_secret(secret_name: str) -> Optional[Dict]:
+    """
+    Returns an expired secret (and extends it by the grace period) when
+    refreshing it has failed.
+    """
+    with SECRET_CACHE_LOCK:
+        cached_secret = _get_cached_secret(secret_name, allow_expired=True)
+        if not cached_secret:
+            return None
+        logger.warning(
+            f'Could not refresh secret {secret_name}, serving cached value.'
+        )
+        cached_secret.expires_at = (
+            time.monotonic() + SECRET_STALE_GRACE_SECONDS
+        )
+        return cached_secret.value
+
+
+def _fetch_secret(secret_name: str, region: str) -> Optional[Dict]:
+    client = _get_secrets_client(region)
     try:
         get_secret_value_response = client.get_secret_value(
             SecretId=secret_name
         )
     except ClientError as e:
         logger.error(f'Error getting secret {secret_name}: {str(e)}')
-        if e.response['Error']['Code'] == 'DecryptionFailureException':
-            raise e
-        elif e.response['Error']['Code'] == 'InternalServiceErrorException':
-            raise e
-        elif e.response['Error']['Code'] == 'InvalidParameterException':
-            raise e
-        elif e.response['Error']['Code'] == 'InvalidRequestException':
-            raise e
-        elif e.response['Error']['Code'] == 'ResourceNotFoundException':
-            raise e
+        raise
     else:
         if 'SecretString' in get_secret_value_response:
             secret = get_secret_value_response['SecretString']
             secret = json.loads(secret)
+            _cache_secret(
+                secret_name,
+                secret,
+                get_secret_value_response.get('VersionId'),
+            )
             return secret
         else:
             # Dead code disabling for now
@@ -60,6 +149,120 @@ def get_secret(secret_name: str, add_environment=False, region=REGION):
             pass
 
 
+def _get_secret(
+    secret_name: str, region: Optional[str], refresh: bool
+) -> Optional[Dict]:
+    secret_overrides = get_secret_overrides()
+
+    if secret_name in secret_overrides:
+        return secret_overrides[secret_name]
+
+    if not refresh:
+        cached_secret = _get_cached_secret(secret_name)
+        if cached_secret:
+            return cached_secret.value
+
+    try:
+        return _fetch_secret(secret_name, region or get_region())
+    except (ClientError, BotoCoreError):
+        stale_secret = _serve_stale_secret(secret_name)
+        if stale_secret is None:
+            raise
+        return stale_secret
+
+
+def get_secret(
+    secret_name: str, add_environment=False, region=None, refresh=False
+):
+    """
+    Gets a secret, from the container cache where possible. Pass refresh to
+    bypass the cache, e.g. after a credential has been rejected because it
+    was rotated.
+
+    The cached secrets are shared by the container, so callers get a copy
+    they are free to change.
+    """
+    secret_name = _get_secret_name(secret_name, add_environment)
+    return copy.deepcopy(_get_secret(secret_name, region, refresh))
+
+
+def _batch_get_secrets(secret_names: List[str], region: str) -> List[str]:
+    """
+    Loads secrets with BatchGetSecretValue (where the installed botocore
+    supports it), returning the names that still need fetching.
+    """
+    client = _get_secrets_client(region)
+    if not hasattr(client, 'batch_get_secret_value'):
+        return secret_names
+    remaining_secret_names = set(secret_names)
+    for i in range(0, len(secret_names), BATCH_GET_SECRET_MAX_IDS):
+        batch = secret_names[i : i + BATCH_GET_SECRET_MAX_IDS]
+        try:
+            response = client.batch_get_secret_value(SecretIdList=batch)
+        except ClientError as e:
+            logger.warning(f'Could not batch get secrets {batch}: {str(e)}')
+            continue
+        for secret_value in response.get('SecretValues', []):
+            if 'SecretString' not in secret_value:
+                continue
+            _cache_secret(
+                secret_value['Name'],
+                json.loads(secret_value['SecretString']),
+                secret_value.get('VersionId'),
+            )
+            remaining_secret_names.discard(secret_value['Name'])
+        for error in response.get('Errors', []):
+            logger.warning(
+                f'Error batch getting secret {error.get("SecretId")}: '
+                f'{error.get("Message")}'
+            )
+    return [name for name in secret_names if name in remaining_secret_names]
+
+
+def _prefetch_secret(secret_name: str, region: str) -> None:
+    try:
+        _fetch_secret(secret_name, region)
+    except (ClientError, BotoCoreError, ValueError) as e:
+        logger.warning(f'Could not prefetch secret {secret_name}: {str(e)}')
+
+
+def prefetch_secrets(
+    secret_names: List[str], add_environment=False, region=None
+) -> None:
+    """
+    Loads secrets into the cache at cold start so they are not fetched on
+    user requests. This is best effort: failures are logged and the secret
+    is fetched again when it is first used.
+    """
+    secret_names = [
+        _get_secret_name(secret_name, add_environment)
+        for secret_name in secret_names
+    ]
+    secret_overrides = get_secret_overrides()
+    secret_names = [
+        secret_name
+        for secret_name in dict.fromkeys(secret_names)
+        if secret_name not in secret_overrides
+        and not _get_cached_secret(secret_name)
+    ]
+    if not secret_names:
+        return
+    region = region or get_region()
+    secret_names = _batch_get_secrets(secret_names, region)
+    if not secret_names:
+        return
+    max_workers = min(len(secret_names), SECRET_PREFETCH_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for secret_name in secret_names:
+            executor.submit(_prefetch_secret, secret_name, region)
+
+
+def clear_secret_cache() -> None:
+    with SECRET_CACHE_LOCK:
+        SECRET_CACHE.clear()
+        SECRETS_CLIENTS.clear()
+
+
 def get_db_dict(secret_name: str) -> Dict:
     db_dict = get_secret(secret_name)
     db_dict.update(
@@ -0,0 +1,260 @@
+import json
+import logging
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional
+
+from loop.constants import (
+    SLOW_QUERY_THRESHOLD_MS,
+    SQL_METRICS_NAMESPACE,
+    logger,
+)
+from loop.data_classes import SqlMetrics
+from pony.orm import Database
+
+"""
+This module provides opt-in per-request SQL instrumentation:
+
+- Counting the statements executed and the time spent executing them
+- Counting db_session retries (by function) and the time spent backing off
+- Grouping statements by fingerprint (the statement with literals and
+  parameters normalised) to spot N+1 queries
+- Emitting the metrics as a CloudWatch embedded metric format (EMF) log
+- Logging statements slower than SLOW_QUERY_THRESHOLD_MS with the loop
+  functions that issued them, and their query plan in debug mode
+
+Statements are only recorded inside collect_sql_metrics(), so this costs a
+context variable lookup per statement when it is not in use.
+"""
+
+CURRENT_SQL_METRICS: ContextVar[Optional[SqlMetrics]] = ContextVar(
+    'current_sql_metrics', default=None
+)
+
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERALS = re.compile(r'(?<![\w-])\d+(?:\.\d+)?\b')
+_PARAMETERS = re.compile(r'%s|\?|:p\d+|\$\d+')
+_PARAMETER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+EXPLAIN_PREFIXES = {'SQLite': 'EXPLAIN QUERY PLAN ', 'MySQL': 'EXPLAIN '}
+EXPLAINABLE_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+# Wrappers that are not callers in their own right.
+IGNORED_CALLER_MODULES = (__name__, 'loop.db_session')
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Normalises a statement so that statements differing only by their values
+    share a fingerprint, e.g.
+
+    SELECT "u"."id" FROM "user" "u" WHERE "u"."id" IN (?, ?, ?) AND x = 'a'
+    -> SELECT "u"."id" FROM "user" "u" WHERE "u"."id" IN (...) AND x = ?
+    """
+    sql = _STRING_LITERALS.sub('?', sql)
+    sql = _NUMBER_LITERALS.sub('?', sql)
+    sql = _PARAMETERS.sub('?', sql)
+    sql = _PARAMETER_LISTS.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def record_statement(sql: str, duration_seconds: float) -> None:
+    metrics = CURRENT_SQL_METRICS.get()
+    if metrics is None:
+        return
+    metrics.statements += 1
+    metrics.db_time_ms += duration_seconds * 1000
+    fingerprint = fingerprint_sql(sql)
+    metrics.fingerprints[fingerprint] = (
+        metrics.fingerprints.get(fingerprint, 0) + 1
+    )
+
+
+def record_retry(function: str, delay_seconds: float) -> None:
+    """Counts a db_session retry (see loop.db_session.retryable_db_session)."""
+    metrics = CURRENT_SQL_METRICS.get()
+    if metrics is None:
+        return
+    metrics.retries += 1
+    metrics.retry_delay_ms += delay_seconds * 1000
+    metrics.retries_by_function[function] = (
+        metrics.retries_by_function.get(function, 0) + 1
+    )
+
+
+def get_parameter_shapes(arguments: Any) -> str:
+    """
+    Describes a statement's bound parameters by type only, so that slow
+    query logs never contain user data, e.g. (int, str) or 3 x (int, str)
+    for an executemany.
+    """
+    if arguments is None:
+        return '()'
+    if isinstance(arguments, dict):
+        return str(
+            {key: type(value).__name__ for key, value in arguments.items()}
+        )
+    if isinstance(arguments, list) and all(
+        isinstance(row, (list, tuple)) for row in arguments
+    ):
+        row_shape = get_parameter_shapes(arguments[0]) if arguments else '()'
+        return f'{len(arguments)} x {row_shape}'
+    return f'({", ".join(type(value).__name__ for value in arguments)})'
+
+
+def get_calling_functions() -> str:
+    """
+    Returns the loop functions on the current stack, outermost first, e.g.
+    loop.friends.get_pending_requests > loop.friends._get_friends_from_query
+    """
+    callers = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        caller = f'{module}.{frame.f_code.co_name}'
+        if (
+            module.startswith('loop.')
+            and module not in IGNORED_CALLER_MODULES
+            and not module.startswith('loop.tests')
+            # pony's db_session wrapper shares the wrapped function's name
+            and not (callers and callers[-1] == caller)
+        ):
+            callers.append(caller)
+        frame = frame.f_back
+    return ' > '.join(reversed(callers)) or 'unknown'
+
+
+class InstrumentedDatabase(Database):
+    """
+    Pony Database that reports every executed statement to the current
+    request's SqlMetrics and logs slow statements. Pony calls
+    _update_local_stat after executing each statement with the statement and
+    its start time.
+    """
+
+    def _update_local_stat(self, sql, query_start_time):
+        super()._update_local_stat(sql, query_start_time)
+        record_statement(sql, time.time() - query_start_time)
+
+    def _exec_sql(
+        self, sql, arguments=None, returning_id=False, start_transaction=False
+    ):
+        start_time = time.time()
+        result = super()._exec_sql(
+            sql, arguments, returning_id, start_transaction
+        )
+        duration_ms = (time.time() - start_time) * 1000
+        if 0 <= SLOW_QUERY_THRESHOLD_MS <= duration_ms:
+            self._log_slow_query(sql, arguments, duration_ms)
+        return result
+
+    def _log_slow_query(self, sql: str, arguments: Any, duration_ms: float):
+        logger.warning(
+            f'Slow query ({duration_ms:.1f}ms) from '
+            f'{get_calling_functions()} with parameters '
+            f'{get_parameter_shapes(arguments)}: {fingerprint_sql(sql)}'
+        )
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        try:
+            query_plan = self.explain(sql, arguments)
+        except Exception as e:
+            logger.debug(f'Could not explain slow query: {e}')
+            return
+        if query_plan is not None:
+            logger.debug(f'Slow query plan: {query_plan}')
+
+    def explain(self, sql: str, arguments: Any = None) -> Optional[List]:
+        """
+        Returns the query plan of a SELECT, UPDATE or DELETE statement (None
+        for other statements or providers), run on the current db_session's
+        connection. Neither provider executes an explained statement.
+        """
+        prefix = EXPLAIN_PREFIXES.get(self.provider.dialect)
+        if (
+            prefix is None
+            or isinstance(arguments, list)
+            or not sql.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS)
+        ):
+            return None
+        connection = self._get_cache().prepare_connection_for_query_execution()
+        cursor = connection.cursor()
+        self.provider.execute(cursor, prefix + sql, arguments)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+@contextmanager
+def collect_sql_metrics() -> Iterator[SqlMetrics]:
+    metrics = SqlMetrics()
+    token = CURRENT_SQL_METRICS.set(metrics)
+    try:
+        yield metrics
+    finally:
+        CURRENT_SQL_METRICS.reset(token)
+
+
+def emit_sql_metrics(metrics: SqlMetrics, route: str) -> None:
+    """
+    Prints the metrics in CloudWatch embedded metric format, which lambda
+    turns into metrics (dimensioned by route) from the log line.
+    """
+    print(
+        json.dumps(
+            {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [
+                        {
+                            'Namespace': SQL_METRICS_NAMESPACE,
+                            'Dimensions': [['Route']],
+                            'Metrics': [
+                                {'Name': 'Statements', 'Unit': 'Count'},
+                                {'Name': 'DbTime', 'Unit': 'Milliseconds'},
+                                {'Name': 'Retries', 'Unit': 'Count'},
+                                {'Name': 'RetryDelay', 'Unit': 'Milliseconds'},
+                            ],
+                        }
+                    ],
+                },
+                'Route': route,
+                'Statements': metrics.statements,
+                'DbTime': round(metrics.db_time_ms, 3),
+                'Retries': metrics.retries,
+                'RetryDelay': round(metrics.retry_delay_ms, 3),
+                'Fingerprints': metrics.fingerprints,
+                'RetriesByFunction': metrics.retries_by_function,
+            }
+        ),
+        flush=True,
+    )
+    for function, retries in metrics.retries_by_function.items():
+        _emit_function_retries(route, function, retries)
+
+
+def _emit_function_retries(route: str, function: str, retries: int) -> None:
+    """Retries of a function, dimensioned by route and function."""
+    print(
+        json.dumps(
+            {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [
+                        {
+                            'Namespace': SQL_METRICS_NAMESPACE,
+                            'Dimensions': [['Route', 'Function']],
+                            'Metrics': [
+                                {'Name': 'FunctionRetries', 'Unit': 'Count'}
+                            ],
+                        }
+                    ],
+                },
+                'Route': route,
+                'Function': function,
+                'FunctionRetries': retries,
+            }
+        ),
+        flush=True,
+    )
@@ -1 +1,6 @@
-from .common import setup_rds, unbind_rds
+from .common import (
+    assert_no_full_scans,
+    assert_query_budget,
+    setup_rds,
+    unbind_rds,
+)
@@ -0,0 +1,255 @@
+import platform
+import statistics
+import time
+from copy import deepcopy
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from loop import data, friends
+from loop.api_classes import PaginatedRatings, SearchUsers
+from loop.constants import logger
+from loop.data_classes import Rating, UserObject
+from loop.enums import DbType, FriendRequestType, UserSearchMode
+from loop.test_setup.dataset import (
+    DatasetConfig,
+    delete_dataset,
+    generate_dataset,
+)
+from pony.orm import Database, count, db_session, desc, select
+
+"""
+Benchmarks the hot data layer paths (loop.data and loop.friends) over
+synthetic datasets (see loop.test_setup.dataset) at several scales, and
+compares results to a baseline to flag regressions. Run with
+scripts/benchmark.py.
+
+Each benchmark is run as the best connected user (the worst case for
+friends and feed queries). Results are keyed "<benchmark>[<scale>]".
+"""
+
+BENCHMARK_RESULTS_VERSION = 1
+SQLITE_MEMORY_DB = {'provider': 'sqlite', 'filename': ':memory:'}
+SEARCH_TERM = 'john'
+# Changes below this (e.g. timer noise on sub-millisecond calls) are never
+# regressions.
+MIN_REGRESSION_MS = 0.1
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    scale: int
+    iterations: int
+    min_ms: float
+    median_ms: float
+    mean_ms: float
+    p95_ms: float
+    max_ms: float
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+@dataclass
+class BenchmarkComparison:
+    key: str
+    baseline_ms: float
+    current_ms: float
+    change: float
+    regression: bool = False
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+def get_dataset_config(scale: int) -> DatasetConfig:
+    return DatasetConfig(
+        users=scale,
+        locations=max(scale // 5, 1),
+        ratings=scale * 5,
+        tag=f'benchmark_{scale}',
+    )
+
+
+def _get_benchmark_user(db: Database, tag: str) -> UserObject:
+    """The user with the most friendships (requested or received)."""
+    with db_session:
+        user_id, _ = (
+            select(
+                (friend.friend_2.id, count(friend))
+                for friend in db.Friend
+                if friend.friend_2.cognito_user_name.startswith(f'{tag}:')
+            )
+            .order_by(lambda user_id, friendships: desc(friendships))
+            .first()
+        )
+        user = db.User[user_id]
+        return UserObject(id=user.id, cognito_user_name=user.cognito_user_name)
+
+
+def _get_benchmarks(
+    db: Database, user: UserObject
+) -> Dict[str, Dict[str, Callable]]:
+    """Benchmarked calls (and optional per call setup) by name."""
+    feed_users = friends.get_user_friend_ids(user)
+    with db_session:
+        location_id = select(location.id for location in db.Location).first()
+
+    def _clear_user_search():
+        friends.clear_user_search_sessions(user.id)
+
+    return {
+        'get_user_from_cognito_username': {
+            'run': lambda: data.get_user_from_cognito_username(
+                user.cognito_user_name
+            )
+        },
+        'get_user_friends': {'run': lambda: friends.get_user_friends(user)},
+        'get_pending_requests': {
+            'run': lambda: friends.get_pending_requests(
+                user, FriendRequestType.BOTH
+            )
+        },
+        'get_ratings': {'run': lambda: data.get_ratings(users=feed_users)},
+        'get_ratings_paginated': {
+            'run': lambda: data.get_ratings_paginated(
+                PaginatedRatings(page_count=1, users=feed_users)
+            )
+        },
+        'search_for_users_fuzzy': {
+            'setup': _clear_user_search,
+            'run': lambda: friends.search_for_users(
+                user, SearchUsers(term=SEARCH_TERM, page_count=1)
+            ),
+        },
+        'search_for_users_database': {
+            'setup': _clear_user_search,
+            'run': lambda: friends.search_for_users(
+                user,
+                SearchUsers(
+                    term=SEARCH_TERM,
+                    page_count=1,
+                    mode=UserSearchMode.DATABASE,
+                ),
+            ),
+        },
+        'create_rating': {
+            'run': lambda: data.create_rating(
+                Rating(
+                    location=location_id,
+                    user=user.id,
+                    price=3,
+                    food=4,
+                    vibe=5,
+                )
+            )
+        },
+    }
+
+
+def _percentile(timings: List[float], percentile: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+
+def run_benchmark(
+    name: str,
+    scale: int,
+    run: Callable,
+    iterations: int,
+    warmup: int = 1,
+    setup: Optional[Callable] = None,
+) -> BenchmarkResult:
+    timings = []
+    for iteration in range(warmup + iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        if iteration >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return BenchmarkResult(
+        name=name,
+        scale=scale,
+        iterations=iterations,
+        min_ms=round(min(timings), 4),
+        median_ms=round(statistics.median(timings), 4),
+        mean_ms=round(statistics.mean(timings), 4),
+        p95_ms=round(_percentile(timings, 0.95), 4),
+        max_ms=round(max(timings), 4),
+    )
+
+
+def run_benchmarks(
+    scales: Sequence[int],
+    iterations: int = 20,
+    db_dict: Optional[Dict[str, Union[str, int, bool]]] = None,
+    names: Optional[Sequence[str]] = None,
+) -> Dict:
+    """
+    Runs the benchmarks at each scale, each over a freshly generated
+    dataset (in memory SQLite unless db_dict is given), and returns the
+    results document.
+    """
+    results = {}
+    for scale in scales:
+        db = data.init_db(
+            db_dict or SQLITE_MEMORY_DB, check_tables=True, create_tables=True
+        )
+        data.DB_TYPE[DbType.WRITE] = db
+        config = get_dataset_config(scale)
+        generate_dataset(db, config)
+        try:
+            user = _get_benchmark_user(db, config.tag)
+            for name, benchmark in _get_benchmarks(db, user).items():
+                if names and name not in names:
+                    continue
+                result = run_benchmark(
+                    name,
+                    scale,
+                    benchmark['run'],
+                    iterations,
+                    setup=benchmark.get('setup'),
+                )
+                logger.info(f'Benchmark: {result.to_dict()}')
+                results[f'{name}[{scale}]'] = result.to_dict()
+            friends.clear_user_search_sessions(user.id)
+        finally:
+            delete_dataset(db, config.tag)
+            db.disconnect()
+    return {
+        'version': BENCHMARK_RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def compare_results(
+    baseline: Dict, current: Dict, threshold: float = 0.2
+) -> List[BenchmarkComparison]:
+    """
+    Compares the median time of benchmarks in both results documents. A
+    benchmark regresses if it is more than threshold (a fraction) and
+    MIN_REGRESSION_MS slower than the baseline.
+    """
+    comparisons = []
+    for key, current_result in current['results'].items():
+        baseline_result = baseline['results'].get(key)
+        if not baseline_result:
+            continue
+        baseline_ms = baseline_result['median_ms']
+        current_ms = current_result['median_ms']
+        change = (current_ms - baseline_ms) / baseline_ms if baseline_ms else 0
+        comparisons.append(
+            BenchmarkComparison(
+                key=key,
+                baseline_ms=baseline_ms,
+                current_ms=current_ms,
+                change=round(change, 4),
+                regression=change > threshold
+                and current_ms - baseline_ms > MIN_REGRESSION_MS,
+            )
+        )
+    return comparisons
@@ -1,12 +1,23 @@
+import re
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Tuple
+from unittest import TestCase
 
 import mock
 from loop import data
 from loop.enums import DbType
+from loop.sql_metrics import InstrumentedDatabase, collect_sql_metrics
 from pony.orm import db_session
 from pony.orm.core import BindingError
 
-INSTANCE = {'provider': 'sqlite', 'filename': ':memory:'}
+# Shared, so that code running on the thread pool sees the same database.
+INSTANCE = {'provider': 'sqlite', 'filename': ':sharedmemory:'}
+
+# Whole table or whole index scans, e.g. SCAN rating or
+# SCAN rating USING INDEX idx_rating__last_updated (but not SEARCH rating ...)
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)')
+MYSQL_FULL_SCANS = ('ALL', 'index')
 
 
 @mock.patch('loop.secrets.get_db_dict')
@@ -163,9 +174,80 @@ def setup_rds(mock_get_db_dict: mock.MagicMock):
                 friend_2=user,
                 status=pending_status,
             )
+    # The ratings above are created directly, so their stats are built.
+    for db_instance_type in DbType:
+        data.rebuild_location_stats(db_instance_type=db_instance_type)
 
 
 def unbind_rds():
     for db_instance_type in DbType:
         data.DB_TYPE[db_instance_type].provider = None
         data.DB_TYPE[db_instance_type].schema = None
+
+
+@contextmanager
+def assert_query_budget(test_case: TestCase, max_statements: int):
+    """
+    Fails the test if the block executes more than max_statements SQL
+    statements, e.g.
+
+    with assert_query_budget(self, 2):
+        get_user_friends(user)
+    """
+    with collect_sql_metrics() as metrics:
+        yield metrics
+    fingerprints = '\n'.join(
+        f'{count} x {fingerprint}'
+        for fingerprint, count in metrics.fingerprints.items()
+    )
+    test_case.assertLessEqual(
+        metrics.statements,
+        max_statements,
+        f'Executed {metrics.statements} statements (budget '
+        f'{max_statements}):\n{fingerprints}',
+    )
+
+
+def _get_full_scan_table(dialect: str, query_plan_row: Tuple):
+    if dialect == 'SQLite':
+        full_scan = SQLITE_FULL_SCAN.match(query_plan_row[-1])
+        return full_scan.group(1) if full_scan else None
+    # MySQL: (id, select_type, table, partitions, type, ...)
+    if query_plan_row[4] in MYSQL_FULL_SCANS:
+        return query_plan_row[2]
+    return None
+
+
+@contextmanager
+def assert_no_full_scans(test_case: TestCase):
+    """
+    Fails the test if any statement executed in the block scans a whole
+    table (or a whole index), by explaining each statement after the block,
+    e.g.
+
+    with assert_no_full_scans(self):
+        get_ratings(users=[1, 2])
+    """
+    statements = []
+    exec_sql = InstrumentedDatabase._exec_sql
+
+    def _record_statement(db, sql, arguments=None, *args, **kwargs):
+        statements.append((db, sql, arguments))
+        return exec_sql(db, sql, arguments, *args, **kwargs)
+
+    with mock.patch.object(
+        InstrumentedDatabase, '_exec_sql', _record_statement
+    ):
+        yield statements
+    full_scans = []
+    with db_session:
+        for db, sql, arguments in statements:
+            for query_plan_row in db.explain(sql, arguments) or []:
+                table = _get_full_scan_table(
+                    db.provider.dialect, query_plan_row
+                )
+                if table:
+                    full_scans.append(f'{table}: {" ".join(sql.split())}')
+    test_case.assertFalse(
+        full_scans, 'Full table scans:\n' + '\n'.join(full_scans)
+    )
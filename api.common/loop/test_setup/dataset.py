@@ -0,0 +1,466 @@
+import random
+import re
+import uuid
+from copy import deepcopy
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+from loop import data
+from loop.constants import logger
+from loop.enums import FriendStatusType
+from loop.geo import encode_geohash
+from loop.utils import get_search_name
+from pony.orm import Database, commit, db_session, select
+
+"""
+Generates reproducible synthetic datasets (for load, scale and benchmark
+testing) in SQLite or MySQL:
+
+- Users with random names
+- A power law friend graph (preferential attachment), mostly friends with
+  some pending requests
+- Locations clustered around UK cities
+- Ratings by users (weighted by their number of friends) of locations
+  (Zipf distributed popularity) over the last year
+
+Rows are written with batched inserts and tagged (cognito_user_name and
+google_id are prefixed with "<tag>:") so that a dataset can be deleted
+without touching other data.
+"""
+
+TAG_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+FIRST_NAMES = [
+    'John',
+    'Alice',
+    'Robert',
+    'Mary',
+    'Michael',
+    'Linda',
+    'William',
+    'Elizabeth',
+    'James',
+    'Patricia',
+    'Aisha',
+    'Mohammed',
+    'Priya',
+    'Wei',
+    'Sofia',
+    'Oliver',
+]
+SURNAMES = [
+    'Smith',
+    'Johnson',
+    'Williams',
+    'Brown',
+    'Jones',
+    'Garcia',
+    'Miller',
+    'Davis',
+    'Patel',
+    'Khan',
+    'Nguyen',
+    "O'Neil",
+    'Taylor',
+    'Wilson',
+]
+PLACE_ADJECTIVES = ['Golden', 'Little', 'Blue', 'Old', 'Green', 'Royal']
+PLACE_NOUNS = ['Kitchen', 'Bistro', 'Dumpling', 'Taverna', 'Cafe', 'Grill']
+RATING_MESSAGES = [
+    None,
+    None,
+    'Food was incredible.',
+    'Place had a great atmosphere.',
+    'Slow service but worth the wait.',
+    'Would not go back.',
+]
+
+# (city, latitude, longitude, spread in degrees, weight)
+CITY_CLUSTERS = [
+    ('London', 51.5072, -0.1276, 0.08, 10),
+    ('Manchester', 53.4808, -2.2426, 0.04, 3),
+    ('Birmingham', 52.4862, -1.8904, 0.04, 3),
+    ('Edinburgh', 55.9533, -3.1883, 0.03, 2),
+    ('Bristol', 51.4545, -2.5879, 0.03, 2),
+    ('Leeds', 53.8008, -1.5491, 0.03, 2),
+]
+RATINGS_TIME_RANGE = timedelta(days=365)
+
+
+@dataclass
+class DatasetConfig:
+    """Sizes and shape of a synthetic dataset"""
+
+    users: int = 1000
+    locations: int = 500
+    ratings: int = 5000
+    friends_per_user: int = 5
+    pending_fraction: float = 0.1
+    seed: int = 0
+    tag: str = 'synthetic'
+    batch_size: int = 1000
+
+
+@dataclass
+class DatasetSummary:
+    tag: str
+    users: int = 0
+    friendships: int = 0
+    locations: int = 0
+    ratings: int = 0
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+def parse_db_url(db_url: str) -> Dict[str, Union[str, int, bool]]:
+    """
+    Parses sqlite:///<path> or mysql://<user>:<password>@<host>:<port>/<db>
+    into the arguments for data.init_db.
+    """
+    url = urlparse(db_url)
+    if url.scheme == 'sqlite':
+        return {'provider': 'sqlite', 'filename': url.path, 'create_db': True}
+    if url.scheme == 'mysql':
+        return {
+            'provider': 'mysql',
+            'host': url.hostname or 'localhost',
+            'port': url.port or 3306,
+            'user': unquote(url.username or 'root'),
+            'password': unquote(url.password or ''),
+            'database': url.path.lstrip('/') or 'loop',
+        }
+    raise ValueError(f'Unsupported database url: {db_url}')
+
+
+def _validate_tag(tag: str) -> None:
+    if not isinstance(tag, str):
+        raise TypeError('tag must be of type str')
+    if not TAG_PATTERN.match(tag):
+        raise ValueError('tag may only contain letters, digits, - and _')
+
+
+def _get_tag_prefix(tag: str) -> str:
+    return f'{tag}:'
+
+
+def _batches(rows: Sequence, batch_size: int) -> Iterable[Sequence]:
+    for start in range(0, len(rows), batch_size):
+        yield rows[start : start + batch_size]
+
+
+def _bulk_insert(
+    db: Database,
+    entity,
+    columns: List[str],
+    rows: List[Tuple],
+    batch_size: int,
+) -> None:
+    """Inserts rows with one executemany (and commit) per batch."""
+    provider = db.provider
+    placeholder = '?' if provider.paramstyle == 'qmark' else '%s'
+    sql = (
+        f'INSERT INTO {provider.quote_name(entity._table_)} '
+        f'({", ".join(provider.quote_name(column) for column in columns)}) '
+        f'VALUES ({", ".join([placeholder] * len(columns))})'
+    )
+    for batch in _batches(rows, batch_size):
+        db.get_connection().cursor().executemany(sql, list(batch))
+        commit()
+
+
+def _ensure_lookup_tables(db: Database) -> None:
+    """Adds the friend statuses and groups the migrations would create."""
+    for friend_status in (
+        FriendStatusType.FRIENDS,
+        FriendStatusType.PENDING,
+        FriendStatusType.BLOCKED,
+    ):
+        if not db.Friend_status.exists(description=friend_status.value):
+            db.Friend_status(description=friend_status.value)
+    commit()
+    data.load_lookup_tables(db)
+
+
+def _get_user_rows(
+    config: DatasetConfig, rng: random.Random, now: datetime
+) -> List[Tuple]:
+    prefix = _get_tag_prefix(config.tag)
+    rows = []
+    for i in range(config.users):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(SURNAMES)
+        cognito_user_name = (
+            f'{prefix}{uuid.UUID(int=rng.getrandbits(128), version=4)}'
+        )
+        rows.append(
+            (
+                cognito_user_name,
+                f'{config.tag}.user{i}@example.com',
+                first_name,
+                last_name,
+                get_search_name(first_name, last_name),
+                now,
+                now,
+            )
+        )
+    return rows
+
+
+def _get_friend_edges(
+    config: DatasetConfig, rng: random.Random, users: int
+) -> List[Tuple[int, int]]:
+    """
+    Builds a preferential attachment (Barabasi-Albert) graph over user
+    indexes: each user befriends friends_per_user earlier users, chosen in
+    proportion to their number of friends, giving a power law degree
+    distribution.
+    """
+    edges = []
+    # Each user appears once per friendship (plus once so new users can be
+    # chosen), so choosing uniformly from it is preferential attachment.
+    attachment = []
+    for user in range(users):
+        friends = set()
+        candidates = min(config.friends_per_user, user)
+        while len(friends) < candidates:
+            friends.add(rng.choice(attachment))
+        for friend in sorted(friends):
+            edges.append((user, friend))
+            attachment.append(friend)
+        attachment.extend([user] * (len(friends) + 1))
+    return edges
+
+
+def _get_location_rows(
+    config: DatasetConfig, rng: random.Random, now: datetime
+) -> List[Tuple]:
+    prefix = _get_tag_prefix(config.tag)
+    cities = rng.choices(
+        CITY_CLUSTERS,
+        weights=[city[4] for city in CITY_CLUSTERS],
+        k=config.locations,
+    )
+    rows = []
+    for i, (city, latitude, longitude, spread, _) in enumerate(cities):
+        place_latitude = round(rng.gauss(latitude, spread), 6)
+        place_longitude = round(rng.gauss(longitude, spread), 6)
+        rows.append(
+            (
+                f'{prefix}place-{i}',
+                f'{i} Synthetic Street, {city}',
+                f'{rng.choice(PLACE_ADJECTIVES)} {rng.choice(PLACE_NOUNS)}',
+                place_latitude,
+                place_longitude,
+                encode_geohash(place_latitude, place_longitude),
+                now,
+                now,
+            )
+        )
+    return rows
+
+
+def _get_rating_rows(
+    config: DatasetConfig,
+    rng: random.Random,
+    now: datetime,
+    user_ids: List[int],
+    user_weights: List[int],
+    location_ids: List[int],
+) -> List[Tuple]:
+    """
+    Ratings by users weighted by their number of friends, of locations with
+    Zipf distributed popularity (at most one rating per user and location).
+    """
+    if not user_ids or not location_ids:
+        return []
+    user_cum_weights = list(accumulate(user_weights))
+    location_cum_weights = list(
+        accumulate(1 / rank for rank in range(1, len(location_ids) + 1))
+    )
+    max_ratings = min(config.ratings, len(user_ids) * len(location_ids))
+    rated = set()
+    rows = []
+    for _ in range(config.ratings * 3):
+        if len(rows) == max_ratings:
+            break
+        user_id = rng.choices(user_ids, cum_weights=user_cum_weights)[0]
+        location_id = rng.choices(
+            location_ids, cum_weights=location_cum_weights
+        )[0]
+        if (user_id, location_id) in rated:
+            continue
+        rated.add((user_id, location_id))
+        last_updated = now - timedelta(
+            seconds=rng.randint(0, int(RATINGS_TIME_RANGE.total_seconds()))
+        )
+        rows.append(
+            (
+                rng.randint(1, 5),
+                rng.randint(1, 5),
+                rng.randint(1, 5),
+                rng.choice(RATING_MESSAGES),
+                location_id,
+                user_id,
+                last_updated,
+                last_updated,
+            )
+        )
+    return rows
+
+
+def _get_tagged_ids(entity, column: str, tag: str) -> List[int]:
+    prefix = _get_tag_prefix(tag)
+    return select(
+        row.id for row in entity if getattr(row, column).startswith(prefix)
+    ).order_by(1)[:]
+
+
+@db_session
+def generate_dataset(db: Database, config: DatasetConfig) -> DatasetSummary:
+    """
+    Generates a synthetic dataset in the (mapped) database. The same seed
+    and sizes generate the same data.
+    """
+    if not isinstance(config, DatasetConfig):
+        raise TypeError('config must be an instance of DatasetConfig')
+    _validate_tag(config.tag)
+    rng = random.Random(config.seed)
+    now = datetime.now().replace(microsecond=0)
+    _ensure_lookup_tables(db)
+
+    _bulk_insert(
+        db,
+        db.User,
+        [
+            'cognito_user_name',
+            'email',
+            'first_name',
+            'last_name',
+            'search_name',
+            'created',
+            'last_updated',
+        ],
+        _get_user_rows(config, rng, now),
+        config.batch_size,
+    )
+    user_ids = _get_tagged_ids(db.User, 'cognito_user_name', config.tag)
+
+    edges = _get_friend_edges(config, rng, len(user_ids))
+    friends_status_id = data.get_friend_status_id(FriendStatusType.FRIENDS)
+    pending_status_id = data.get_friend_status_id(FriendStatusType.PENDING)
+    degrees: Dict[int, int] = {user_id: 0 for user_id in user_ids}
+    friend_rows = []
+    for user, friend in edges:
+        status_id = (
+            pending_status_id
+            if rng.random() < config.pending_fraction
+            else friends_status_id
+        )
+        friend_rows.append(
+            (user_ids[user], user_ids[friend], status_id, now, now)
+        )
+        degrees[user_ids[user]] += 1
+        degrees[user_ids[friend]] += 1
+    _bulk_insert(
+        db,
+        db.Friend,
+        ['friend_1', 'friend_2', 'status', 'created', 'last_updated'],
+        friend_rows,
+        config.batch_size,
+    )
+
+    _bulk_insert(
+        db,
+        db.Location,
+        [
+            'google_id',
+            'address',
+            'display_name',
+            'latitude',
+            'longitude',
+            'geohash',
+            'created',
+            'last_updated',
+        ],
+        _get_location_rows(config, rng, now),
+        config.batch_size,
+    )
+    location_ids = _get_tagged_ids(db.Location, 'google_id', config.tag)
+
+    rating_rows = _get_rating_rows(
+        config,
+        rng,
+        now,
+        user_ids,
+        [degrees[user_id] + 1 for user_id in user_ids],
+        location_ids,
+    )
+    _bulk_insert(
+        db,
+        db.Rating,
+        [
+            'price',
+            'vibe',
+            'food',
+            'message',
+            'location',
+            'user',
+            'created',
+            'last_updated',
+        ],
+        rating_rows,
+        config.batch_size,
+    )
+    # The ratings are inserted directly, so the stats are built after.
+    data.rebuild_db_location_stats(db, location_ids)
+    summary = DatasetSummary(
+        tag=config.tag,
+        users=len(user_ids),
+        friendships=len(friend_rows),
+        locations=len(location_ids),
+        ratings=len(rating_rows),
+    )
+    logger.info(f'Generated dataset: {summary.to_dict()}')
+    return summary
+
+
+@db_session
+def delete_dataset(db: Database, tag: str) -> None:
+    """Deletes everything generated with the tag."""
+    _validate_tag(tag)
+    prefix = _get_tag_prefix(tag)
+    ratings = select(
+        rating
+        for rating in db.Rating
+        if rating.user.cognito_user_name.startswith(prefix)
+        or rating.location.google_id.startswith(prefix)
+    )
+    # Untagged locations rated by tagged users keep their (rebuilt) stats.
+    location_ids = select(rating.location.id for rating in ratings)[:]
+    ratings.delete(bulk=True)
+    select(
+        friend
+        for friend in db.Friend
+        if friend.friend_1.cognito_user_name.startswith(prefix)
+        or friend.friend_2.cognito_user_name.startswith(prefix)
+    ).delete(bulk=True)
+    select(
+        user for user in db.User if user.cognito_user_name.startswith(prefix)
+    ).delete(bulk=True)
+    select(
+        stats
+        for stats in db.Location_stats
+        if stats.location.google_id.startswith(prefix)
+    ).delete(bulk=True)
+    select(
+        location
+        for location in db.Location
+        if location.google_id.startswith(prefix)
+    ).delete(bulk=True)
+    data.rebuild_db_location_stats(db, location_ids)
+    commit()
+    logger.info(f'Deleted dataset: {tag}')
@@ -6,8 +6,9 @@ from loop.admin_utils import (
     delete_rating,
     delete_user,
     delete_user_from_rds,
+    import_ratings,
 )
-from loop.api_classes import UserCredentials
+from loop.api_classes import CreateRating, ImportRatings, UserCredentials
 from loop.data import DB_SESSION_RETRYABLE
 from loop.data_classes import UserObject
 from loop.exceptions import BadRequestError
@@ -77,6 +78,23 @@ class TestAdminUtils(unittest.TestCase):
         user_credentials = 'some_email@hotmail.com'
         self.assertRaises(TypeError, delete_user_from_rds, user_credentials)
 
+    @patch('loop.admin_utils.create_ratings')
+    @patch('loop.admin_utils.get_user_from_email')
+    def test_import_ratings(self, mock_user, mock_create_ratings):
+        user = UserObject(id=2, cognito_user_name='user_name')
+        mock_user.return_value = user
+        ratings = [
+            CreateRating(google_id='test_google_id_1', price=1, vibe=2, food=3)
+        ]
+        import_ratings(
+            ImportRatings(email='some_email@hotmail.com', ratings=ratings)
+        )
+        mock_user.assert_called_once_with('some_email@hotmail.com')
+        mock_create_ratings.assert_called_once_with(ratings, user)
+
+    def test_import_ratings_type_error(self):
+        self.assertRaises(TypeError, import_ratings, {'ratings': []})
+
 
 if __name__ == '__main__':
     unittest.main()
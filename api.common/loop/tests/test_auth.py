@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock, call, patch
+from unittest.mock import ANY, Mock, call, patch
 
 import boto3
 from loop.api_classes import (
@@ -9,7 +9,7 @@ from loop.api_classes import (
     UserCredentials,
     VerifyUser,
 )
-from loop.auth import CognitoAuth
+from loop.auth import CognitoAuth, clear_cognito_cache
 from loop.exceptions import (
     BadRequestError,
     ConflictError,
@@ -44,6 +44,12 @@ TEST_FORGOT_PASSWORD = ForgotPassword(
 
 
 class TestCognitoAuthInit(unittest.TestCase):
+    def setUp(self):
+        clear_cognito_cache()
+
+    def tearDown(self):
+        clear_cognito_cache()
+
     @patch('loop.auth.get_secret')
     @patch.object(boto3, 'client')
     def test_cognito_auth_init(self, mock_boto, mock_secret):
@@ -53,7 +59,7 @@ class TestCognitoAuthInit(unittest.TestCase):
         }
         auth = CognitoAuth()
         self.assertTrue(mock_secret.called)
-        self.assertEqual(mock_boto.call_args, call('cognito-idp'))
+        self.assertEqual(mock_boto.call_args, call('cognito-idp', config=ANY))
 
     @patch('loop.auth.get_secret')
     @patch.object(boto3, 'client')
@@ -71,11 +77,25 @@ class TestCognitoAuthInit(unittest.TestCase):
         mock_secret.return_value = {'client_id': 'test_client_id'}
         self.assertRaises(ValueError, CognitoAuth)
 
+    @patch('loop.auth.get_secret')
+    @patch.object(boto3, 'client')
+    def test_cognito_auth_init_shared_config(self, mock_boto, mock_secret):
+        mock_secret.return_value = {
+            'user_pool_id': 'test_user_pool_id',
+            'client_id': 'test_client_id',
+        }
+        auth = CognitoAuth()
+        admin_auth = CognitoAuth(is_admin=True)
+        self.assertIs(auth._auth_client, admin_auth._auth_client)
+        self.assertEqual(mock_boto.call_count, 1)
+        self.assertEqual(mock_secret.call_count, 1)
+
 
 class TestCognitoAuth(unittest.TestCase):
     @patch('loop.auth.get_secret')
     @patch.object(boto3, 'client')
     def setUp(self, mock_boto, mock_secret):
+        clear_cognito_cache()
         mock_secret.return_value = {
             'user_pool_id': 'test_user_pool_id',
             'client_id': 'test_client_id',
@@ -109,6 +129,7 @@ class TestCognitoAuth(unittest.TestCase):
 
     def tearDown(self):
         self.cognito_auth = None
+        clear_cognito_cache()
 
     def test_initiate_auth(self):
         self.cognito_auth._initiate_auth(TEST_LOGIN_CREDS)
@@ -475,6 +496,7 @@ class TestCognitoAuthAdmin(unittest.TestCase):
     @patch('loop.auth.get_secret')
     @patch.object(boto3, 'client')
     def setUp(self, mock_boto, mock_secret):
+        clear_cognito_cache()
         mock_secret.return_value = {
             'user_pool_id': 'test_user_pool_id',
             'client_id': 'test_client_id',
@@ -508,6 +530,7 @@ class TestCognitoAuthAdmin(unittest.TestCase):
 
     def tearDown(self):
         self.cognito_auth = None
+        clear_cognito_cache()
 
     def test_login_fail(self):
         self.mock_boto.return_value.admin_initiate_auth.return_value = {
@@ -519,6 +542,8 @@ class TestCognitoAuthAdmin(unittest.TestCase):
         self.assertRaises(
             UnauthorizedError, self.cognito_auth.login_user, TEST_LOGIN_CREDS
         )
+        # Non admins are not logged in.
+        self.mock_boto.return_value.admin_initiate_auth.assert_not_called()
 
     def test_login(self):
         self.mock_boto.return_value.admin_initiate_auth.return_value = {
@@ -530,6 +555,49 @@ class TestCognitoAuthAdmin(unittest.TestCase):
         response = self.cognito_auth.login_user(TEST_LOGIN_CREDS)
         self.assertEqual(response, {})
 
+    def test_login_fail_incorrect_password(self):
+        # The admin check comes before the login
+        self.mock_boto.return_value.admin_initiate_auth.side_effect = (
+            COGNITO_CLIENT.exceptions.NotAuthorizedException(**ERROR_RESPONSE)
+        )
+        self.mock_boto.return_value.admin_list_groups_for_user.return_value = {
+            'Groups': []
+        }
+        self.assertRaises(
+            UnauthorizedError, self.cognito_auth.login_user, TEST_LOGIN_CREDS
+        )
+        self.mock_boto.return_value.admin_initiate_auth.assert_not_called()
+
+    def test_login_incorrect_password(self):
+        self.mock_boto.return_value.admin_initiate_auth.side_effect = (
+            COGNITO_CLIENT.exceptions.NotAuthorizedException(**ERROR_RESPONSE)
+        )
+        self.mock_boto.return_value.admin_list_groups_for_user.return_value = {
+            'Groups': [{'GroupName': 'admin'}]
+        }
+        self.assertRaises(
+            BadRequestError, self.cognito_auth.login_user, TEST_LOGIN_CREDS
+        )
+
+    def test_login_user_not_exists(self):
+        self.mock_boto.return_value.admin_list_groups_for_user.side_effect = (
+            COGNITO_CLIENT.exceptions.UserNotFoundException(**ERROR_RESPONSE)
+        )
+        self.assertRaises(
+            ConflictError, self.cognito_auth.login_user, TEST_LOGIN_CREDS
+        )
+
+    def test_admin_group_membership_cached(self):
+        self.mock_boto.return_value.admin_list_groups_for_user.return_value = {
+            'Groups': [{'GroupName': 'admin'}]
+        }
+        self.cognito_auth.sign_up_user(TEST_SIGNUP_CREDENTIALS)
+        self.cognito_auth.resend_code(TEST_USER_CREDENTIALS)
+        self.assertEqual(
+            self.mock_boto.return_value.admin_list_groups_for_user.call_count,
+            1,
+        )
+
     def test_sign_up_fail(self):
         self.mock_boto.return_value.admin_list_groups_for_user.return_value = {
             'Groups': []
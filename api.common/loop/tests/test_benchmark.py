@@ -0,0 +1,58 @@
+import unittest
+
+from loop.test_setup import unbind_rds
+from loop.test_setup.benchmark import compare_results, run_benchmarks
+
+
+def get_results(**median_ms):
+    return {
+        'version': 1,
+        'results': {
+            key: {'median_ms': median} for key, median in median_ms.items()
+        },
+    }
+
+
+class TestRunBenchmarks(unittest.TestCase):
+    def tearDown(self):
+        unbind_rds()
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(
+            [30], iterations=2, names=['get_user_friends', 'create_rating']
+        )
+        self.assertEqual(
+            list(results['results']),
+            ['get_user_friends[30]', 'create_rating[30]'],
+        )
+        result = results['results']['get_user_friends[30]']
+        self.assertEqual(result['scale'], 30)
+        self.assertEqual(result['iterations'], 2)
+        self.assertLessEqual(result['min_ms'], result['max_ms'])
+
+
+class TestCompareResults(unittest.TestCase):
+    def test_compare_results(self):
+        comparisons = compare_results(
+            get_results(a=10.0, b=10.0, c=10.0, removed=1.0),
+            get_results(a=10.5, b=15.0, c=5.0, added=1.0),
+            threshold=0.2,
+        )
+        self.assertEqual(
+            [comparison.key for comparison in comparisons], ['a', 'b', 'c']
+        )
+        self.assertEqual(
+            [comparison.regression for comparison in comparisons],
+            [False, True, False],
+        )
+        self.assertEqual(comparisons[1].change, 0.5)
+
+    def test_compare_results_noise(self):
+        comparisons = compare_results(
+            get_results(a=0.01), get_results(a=0.05), threshold=0.2
+        )
+        self.assertFalse(comparisons[0].regression)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,26 @@ import unittest
 from datetime import datetime
 from unittest.mock import call, patch
 
-from loop import data, exceptions
-from loop.api_classes import Coordinates, PaginatedRatings, UpdateRating
-from loop.data_classes import Location, Rating, RatingsPageResults, UserObject
-from loop.enums import DbType
+from loop import admin_utils, data, exceptions
+from loop.api_classes import (
+    Coordinates,
+    CreateRating,
+    PaginatedRatings,
+    UpdateRating,
+)
+from loop.data_classes import (
+    Location,
+    LocationStats,
+    Rating,
+    RatingsImportResults,
+    RatingsPageResults,
+    UserObject,
+)
+from loop.enums import DbType, FriendStatusType
 from loop.friends import get_user_friends
 from loop.test_setup.common import setup_rds, unbind_rds
 from loop.utils import get_admin_user
-from pony.orm import Database
+from pony.orm import Database, db_session, flush, select
 
 TEST_DB_SECRET = {
     'user': 'admin',
@@ -103,19 +115,6 @@ class LoopTestGetRatings(unittest.TestCase):
         users = [1, 3, 4]
         ratings = data.get_ratings(users)
         expected_ratings = [
-            {
-                'id': 3,
-                'first_name': 'Test',
-                'last_name': 'User',
-                'place_id': 'test_google_id_1',
-                'latitude': 1.5,
-                'longitude': -0.7,
-                'food': 3,
-                'price': 4,
-                'vibe': 4,
-                'message': 'Food was incredible.',
-                'time_created': '2000-01-01 00:00:00',
-            },
             {
                 'id': 4,
                 'first_name': 'Test',
@@ -129,6 +128,19 @@ class LoopTestGetRatings(unittest.TestCase):
                 'message': 'Place had a great atmosphere.',
                 'time_created': '2000-01-01 00:00:00',
             },
+            {
+                'id': 3,
+                'first_name': 'Test',
+                'last_name': 'User',
+                'place_id': 'test_google_id_1',
+                'latitude': 1.5,
+                'longitude': -0.7,
+                'food': 3,
+                'price': 4,
+                'vibe': 4,
+                'message': 'Food was incredible.',
+                'time_created': '2000-01-01 00:00:00',
+            },
         ]
         self.assertEqual(ratings, expected_ratings)
 
@@ -170,16 +182,29 @@ class LoopTestGetRatings(unittest.TestCase):
         ratings = data.get_ratings()
         expected_ratings = [
             {
-                'id': 1,
-                'first_name': 'Admin',
+                'id': 4,
+                'first_name': 'Test',
+                'last_name': 'User',
+                'place_id': 'test_google_id_2',
+                'latitude': 1.2,
+                'longitude': -0.9,
+                'food': 5,
+                'price': 4,
+                'vibe': 5,
+                'message': 'Place had a great atmosphere.',
+                'time_created': '2000-01-01 00:00:00',
+            },
+            {
+                'id': 3,
+                'first_name': 'Test',
                 'last_name': 'User',
                 'place_id': 'test_google_id_1',
                 'latitude': 1.5,
                 'longitude': -0.7,
                 'food': 3,
                 'price': 4,
-                'vibe': 5,
-                'message': None,
+                'vibe': 4,
+                'message': 'Food was incredible.',
                 'time_created': '2000-01-01 00:00:00',
             },
             {
@@ -196,29 +221,16 @@ class LoopTestGetRatings(unittest.TestCase):
                 'time_created': '2000-01-01 00:00:00',
             },
             {
-                'id': 3,
-                'first_name': 'Test',
+                'id': 1,
+                'first_name': 'Admin',
                 'last_name': 'User',
                 'place_id': 'test_google_id_1',
                 'latitude': 1.5,
                 'longitude': -0.7,
                 'food': 3,
                 'price': 4,
-                'vibe': 4,
-                'message': 'Food was incredible.',
-                'time_created': '2000-01-01 00:00:00',
-            },
-            {
-                'id': 4,
-                'first_name': 'Test',
-                'last_name': 'User',
-                'place_id': 'test_google_id_2',
-                'latitude': 1.2,
-                'longitude': -0.9,
-                'food': 5,
-                'price': 4,
                 'vibe': 5,
-                'message': 'Place had a great atmosphere.',
+                'message': None,
                 'time_created': '2000-01-01 00:00:00',
             },
         ]
@@ -339,6 +351,11 @@ class LoopTestUserFromCognito(unittest.TestCase):
         assert isinstance(user, UserObject)
         self.assertEqual(user.id, 1)
 
+    @data.DB_SESSION_RETRYABLE
+    def test_user_search_name(self):
+        user = data.DB_TYPE[DbType.WRITE].User.get(id=4)
+        self.assertEqual(user.search_name, 'random persons mate')
+
     def test_get_user_from_email_error(self):
         email = 'unknown_email'
         self.assertRaises(
@@ -526,6 +543,8 @@ class TestCreateUserRatings(unittest.TestCase):
         user = UserObject(id=2, cognito_user_name='user_name')
         update_rating = UpdateRating(id=1, message='hello')
         data.update_rating(update_rating, user)
+        # last_updated is set by before_update, when the change is flushed.
+        flush()
         rating = data._get_rating(
             1, UserObject(id=2, cognito_user_name='user_name')
         )
@@ -557,8 +576,11 @@ class TestCreateUserRatings(unittest.TestCase):
             exceptions.BadRequestError, data._get_rating, rating_id, user
         )
 
+    @patch('loop.data._update_location_stats')
     @patch('loop.data._get_rating')
-    def test_delete_rating_works_with_str_int(self, mock_get_rating):
+    def test_delete_rating_works_with_str_int(
+        self, mock_get_rating, mock_update_location_stats
+    ):
         rating_id = '2'
         user = UserObject(id=2, cognito_user_name='user_name')
         data.delete_rating(rating_id, user)
@@ -620,9 +642,9 @@ class TestCreateLocation(unittest.TestCase):
         self.assertEqual(location_id, 6)
 
 
-class TestUpdateObject(unittest.TestCase):
+class TestCreatePlaceRating(unittest.TestCase):
     """
-    Tests the updating of DB objects.
+    Tests creating a rating of a place (and its location) in one transaction.
     """
 
     @classmethod
@@ -633,16 +655,460 @@ class TestUpdateObject(unittest.TestCase):
     def tearDownClass(cls):
         unbind_rds()
 
-    @data.DB_SESSION_RETRYABLE
-    def test_updating_last_updated_time_error(self):
-        pending_status = data.DB_TYPE[data.DbType.WRITE].Friend_status.get(
-            description='Pending'
+    def setUp(self):
+        provider = data.DB_TYPE[DbType.WRITE].provider
+        patcher = patch.object(provider, 'commit', wraps=provider.commit)
+        self.mock_commit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('loop.data.find_location')
+    def test_create_place_rating_new_place(self, mock_location):
+        mock_location.return_value = Location(
+            google_id='test_google_id_new',
+            address='1 New Street, London',
+            display_name='New Place',
+            coordinates=TEST_COORDINATES,
+        )
+        user = UserObject(id=2, cognito_user_name='user_name')
+        data.create_place_rating(
+            CreateRating(
+                google_id='test_google_id_new', price=2, vibe=3, food=4
+            ),
+            user,
+        )
+        self.assertEqual(self.mock_commit.call_count, 1)
+        self.assertIn(
+            'test_google_id_new',
+            [rating['google_id'] for rating in data.get_user_ratings(user)],
+        )
+
+    @patch('loop.data.create_rating', side_effect=exceptions.LoopException)
+    @patch('loop.data.find_location')
+    def test_create_place_rating_rolled_back(
+        self, mock_location, mock_create_rating
+    ):
+        mock_location.return_value = Location(
+            google_id='test_google_id_rolled_back',
+            address='2 New Street, London',
+            display_name='Rolled Back',
+            coordinates=TEST_COORDINATES,
         )
         self.assertRaises(
-            AttributeError,
-            data.update_object_last_updated_time,
-            pending_status,
+            exceptions.LoopException,
+            data.create_place_rating,
+            CreateRating(
+                google_id='test_google_id_rolled_back', price=2, vibe=3, food=4
+            ),
+            UserObject(id=2, cognito_user_name='user_name'),
         )
+        self.assertFalse(self.mock_commit.called)
+        with db_session:
+            self.assertIsNone(
+                data.DB_TYPE[DbType.WRITE].Location.get(
+                    google_id='test_google_id_rolled_back'
+                )
+            )
+
+    @patch('loop.data.find_location')
+    def test_create_place_rating_known_place(self, mock_location):
+        user = UserObject(id=2, cognito_user_name='user_name')
+        data.create_place_rating(
+            CreateRating(
+                google_id='test_google_id_2', price=2, vibe=3, food=4
+            ),
+            user,
+        )
+        self.assertFalse(mock_location.called)
+        self.assertEqual(self.mock_commit.call_count, 1)
+
+    @patch('loop.db_session.record_retry')
+    @patch('loop.data.get_location_ids', return_value={})
+    @patch('loop.data.find_location')
+    def test_create_place_rating_lost_insert_race(
+        self, mock_location, mock_get_location_ids, mock_record_retry
+    ):
+        mock_location.return_value = Location(
+            google_id='test_google_id_3',
+            address='3 New Street, London',
+            display_name='Raced',
+            coordinates=TEST_COORDINATES,
+        )
+        db = data.DB_TYPE[DbType.WRITE]
+        location_get = db.Location.get
+
+        def _get(**kwargs):
+            # The place is inserted by another request after it is read.
+            if mock_get.call_count == 1:
+                return None
+            return location_get(**kwargs)
+
+        with patch.object(db.Location, 'get', side_effect=_get) as mock_get:
+            data.create_place_rating(
+                CreateRating(
+                    google_id='test_google_id_3', price=2, vibe=3, food=4
+                ),
+                UserObject(id=2, cognito_user_name='user_name'),
+            )
+        self.assertEqual(mock_location.call_count, 1)
+        self.assertFalse(mock_record_retry.called)
+        with db_session:
+            location = db.Location.get(google_id='test_google_id_3')
+            self.assertNotEqual(location.display_name, 'Raced')
+            self.assertTrue(
+                db.Rating.exists(
+                    lambda rating: rating.location == location
+                    and rating.user.id == 2
+                    and rating.food == 4
+                )
+            )
+
+    def test_create_place_rating_type_error(self):
+        self.assertRaises(
+            TypeError,
+            data.create_place_rating,
+            {'google_id': 'test_google_id_1', 'price': 2},
+            UserObject(id=2, cognito_user_name='user_name'),
+        )
+
+    def test_update_rating_one_commit(self):
+        user = UserObject(id=2, cognito_user_name='user_name')
+        data.update_rating(UpdateRating(id=1, price=2), user)
+        self.assertEqual(self.mock_commit.call_count, 1)
+
+
+class TestCreateRatings(unittest.TestCase):
+    """
+    Tests creating many ratings (an import) in one transaction.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        setup_rds()
+
+    @classmethod
+    def tearDownClass(cls):
+        unbind_rds()
+
+    @patch('loop.data.find_locations')
+    def test_create_ratings(self, mock_find_locations):
+        mock_find_locations.return_value = (
+            {
+                'test_google_id_import': Location(
+                    google_id='test_google_id_import',
+                    address='4 New Street, London',
+                    display_name='Imported',
+                    coordinates=TEST_COORDINATES,
+                )
+            },
+            ['test_google_id_missing'],
+        )
+        user = UserObject(id=3, cognito_user_name='user_name')
+        ratings = [
+            CreateRating(google_id=google_id, price=2, vibe=3, food=4)
+            for google_id in (
+                'test_google_id_1',
+                'test_google_id_import',
+                'test_google_id_missing',
+                'test_google_id_import',
+            )
+        ]
+        provider = data.DB_TYPE[DbType.WRITE].provider
+        with patch.object(
+            provider, 'commit', wraps=provider.commit
+        ) as mock_commit:
+            results = data.create_ratings(ratings, user)
+        self.assertEqual(mock_commit.call_count, 1)
+        mock_find_locations.assert_called_once_with(
+            ['test_google_id_import', 'test_google_id_missing']
+        )
+        self.assertEqual(
+            results,
+            RatingsImportResults(
+                created=3, failed_google_ids=['test_google_id_missing']
+            ),
+        )
+        google_ids = [
+            rating['google_id'] for rating in data.get_user_ratings(user)
+        ]
+        self.assertEqual(google_ids.count('test_google_id_import'), 2)
+        self.assertEqual(google_ids.count('test_google_id_1'), 1)
+        self.assertNotIn('test_google_id_missing', google_ids)
+
+    def test_get_location_ids(self):
+        self.assertEqual(
+            data.get_location_ids(['test_google_id_1', 'test_google_id_x']),
+            {'test_google_id_1': 1},
+        )
+        self.assertEqual(data.get_location_ids([]), {})
+
+    def test_get_locations_by_google_ids(self):
+        self.assertEqual(
+            data.get_locations_by_google_ids(
+                ['test_google_id_2', 'test_google_id_x']
+            ),
+            {
+                'test_google_id_2': {
+                    'id': 2,
+                    'google_id': 'test_google_id_2',
+                    'display_name': "Baggins'",
+                    'address': '15 Noel Road, London, N1 8HQ',
+                    'coordinates': {'lat': 1.2, 'lng': -0.9},
+                }
+            },
+        )
+        self.assertEqual(data.get_locations_by_google_ids([]), {})
+        self.assertRaises(
+            TypeError, data.get_locations_by_google_ids, 'test_google_id_2'
+        )
+
+    def test_create_ratings_type_error(self):
+        user = UserObject(id=3, cognito_user_name='user_name')
+        self.assertRaises(
+            TypeError,
+            data.create_ratings,
+            [{'google_id': 'test_google_id_1', 'price': 2}],
+            user,
+        )
+
+
+class TestLocationStats(unittest.TestCase):
+    """
+    Tests the location stats are kept up to date as ratings change, and can
+    be rebuilt.
+    """
+
+    def setUp(self):
+        setup_rds()
+
+    def tearDown(self):
+        unbind_rds()
+
+    @db_session
+    def _get_stats(self, location_id: int):
+        stats = data.DB_TYPE[DbType.WRITE].Location_stats[location_id]
+        return (
+            stats.count,
+            stats.food_sum,
+            stats.price_sum,
+            stats.vibe_sum,
+            stats.last_rated,
+        )
+
+    def test_create_rating(self):
+        self.assertEqual(self._get_stats(4), (0, 0, 0, 0, None))
+        data.create_rating(
+            Rating(location=4, user=1, price=3, food=4, vibe=5)
+        )
+        *sums, last_rated = self._get_stats(4)
+        self.assertEqual(sums, [1, 4, 3, 5])
+        self.assertGreater(last_rated, datetime(2000, 1, 1))
+
+    def test_update_rating(self):
+        user = UserObject(id=1, cognito_user_name='test_cognito_user_name')
+        data.update_rating(UpdateRating(id=3, price=2, food=5, vibe=1), user)
+        *sums, last_rated = self._get_stats(1)
+        self.assertEqual(sums, [2, 8, 6, 6])
+        self.assertGreater(last_rated, datetime(2000, 1, 1))
+
+    def test_update_rating_message(self):
+        user = UserObject(id=1, cognito_user_name='test_cognito_user_name')
+        stats = self._get_stats(1)
+        data.update_rating(UpdateRating(id=3, message='Changed'), user)
+        # The same scores (e.g. re-submitted) do not re-rate the place.
+        data.update_rating(UpdateRating(id=3, price=4, food=3, vibe=4), user)
+        self.assertEqual(self._get_stats(1), stats)
+
+    def test_delete_rating(self):
+        user = UserObject(id=1, cognito_user_name='test_cognito_user_name')
+        data.create_rating(
+            Rating(location=1, user=1, price=1, food=1, vibe=1)
+        )
+        with db_session:
+            rating_id = select(
+                rating.id for rating in data.DB_TYPE[DbType.WRITE].Rating
+            ).max()
+        data.delete_rating(rating_id, user)
+        self.assertEqual(
+            self._get_stats(1), (2, 6, 8, 9, datetime(2000, 1, 1))
+        )
+        data.delete_rating(3, user)
+        self.assertEqual(
+            self._get_stats(1), (1, 3, 4, 5, datetime(2000, 1, 1))
+        )
+        # The rating left has not been updated, so it was rated when created.
+        data.create_rating(
+            Rating(location=1, user=1, price=1, food=1, vibe=1)
+        )
+        admin_utils.delete_rating(1)
+        *sums, last_rated = self._get_stats(1)
+        self.assertEqual(sums, [1, 1, 1, 1])
+        self.assertGreater(last_rated, datetime(2000, 1, 1))
+
+    def test_admin_delete_rating(self):
+        admin_utils.delete_rating(2)
+        self.assertEqual(self._get_stats(3), (0, 0, 0, 0, None))
+
+    def test_delete_user_ratings(self):
+        data.delete_user_ratings(UserObject(id=2, cognito_user_name='admin'))
+        self.assertEqual(
+            self._get_stats(1), (1, 3, 4, 4, datetime(2000, 1, 1))
+        )
+        self.assertEqual(self._get_stats(3), (0, 0, 0, 0, None))
+
+    @patch('loop.data.find_locations')
+    def test_create_ratings(self, mock_find_locations):
+        mock_find_locations.return_value = (
+            {
+                'test_google_id_import': Location(
+                    google_id='test_google_id_import',
+                    address='4 New Street, London',
+                    display_name='Imported',
+                    coordinates=TEST_COORDINATES,
+                )
+            },
+            [],
+        )
+        ratings = [
+            CreateRating(google_id=google_id, price=2, vibe=3, food=4)
+            for google_id in (
+                'test_google_id_1',
+                'test_google_id_import',
+                'test_google_id_import',
+            )
+        ]
+        data.create_ratings(
+            ratings, UserObject(id=3, cognito_user_name='user_name')
+        )
+        self.assertEqual(self._get_stats(1)[:4], (3, 10, 10, 12))
+        stats = data.get_location_stats('test_google_id_import')
+        self.assertEqual(
+            (stats.ratings, stats.food, stats.price, stats.vibe),
+            (2, 4.0, 2.0, 3.0),
+        )
+        self.assertIsNotNone(stats.last_rated)
+
+    def test_rebuild_location_stats(self):
+        with db_session:
+            db = data.DB_TYPE[DbType.WRITE]
+            db.Location_stats[1].count = 10
+            db.Location_stats[1].last_rated = None
+            db.Location_stats[2].delete()
+        self.assertEqual(data.rebuild_location_stats([1]), 1)
+        self.assertEqual(
+            self._get_stats(1), (2, 6, 8, 9, datetime(2000, 1, 1))
+        )
+        self.assertEqual(data.rebuild_location_stats(), 4)
+        self.assertEqual(
+            self._get_stats(2), (1, 5, 4, 5, datetime(2000, 1, 1))
+        )
+
+    def test_get_location_stats(self):
+        self.assertEqual(
+            data.get_location_stats('test_google_id_1'),
+            LocationStats(
+                ratings=2,
+                food=3.0,
+                price=4.0,
+                vibe=4.5,
+                last_rated='2000-01-01 00:00:00',
+            ),
+        )
+        self.assertEqual(
+            data.get_location_stats('ChIJobyn_rQcdkgRE042NxgeR1k'),
+            LocationStats(ratings=0),
+        )
+        self.assertIsNone(data.get_location_stats('test_google_id_x'))
+        self.assertRaises(TypeError, data.get_location_stats, 1)
+
+
+class TestLastUpdated(unittest.TestCase):
+    """
+    Tests last_updated is set by the entities' before_update hooks.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        setup_rds()
+
+    @classmethod
+    def tearDownClass(cls):
+        unbind_rds()
+
+    def test_last_updated_on_update(self):
+        with db_session:
+            location = data.DB_TYPE[DbType.WRITE].Location[1]
+            location.display_name = 'Renamed'
+        with db_session:
+            location = data.DB_TYPE[DbType.WRITE].Location[1]
+            self.assertNotEqual(location.last_updated, datetime(2000, 1, 1))
+
+    def test_last_updated_not_set_on_insert(self):
+        with db_session:
+            location = data.DB_TYPE[DbType.WRITE].Location(
+                google_id='test_google_id_insert',
+                address='3 New Street, London',
+                display_name='Inserted',
+                latitude=1.0,
+                longitude=1.0,
+                last_updated=datetime(2000, 1, 1),
+            )
+        with db_session:
+            location = data.DB_TYPE[DbType.WRITE].Location.get(
+                google_id='test_google_id_insert'
+            )
+            self.assertEqual(location.last_updated, datetime(2000, 1, 1))
+
+
+class TestLookupTables(unittest.TestCase):
+    """
+    Tests the friend status and group lookup maps.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        setup_rds()
+
+    @classmethod
+    def tearDownClass(cls):
+        unbind_rds()
+
+    def test_load_lookup_tables(self):
+        data.load_lookup_tables(data.DB_TYPE[DbType.WRITE])
+        self.assertEqual(
+            data.FRIEND_STATUS_IDS,
+            {
+                FriendStatusType.FRIENDS: 1,
+                FriendStatusType.PENDING: 2,
+                FriendStatusType.BLOCKED: 3,
+            },
+        )
+        self.assertEqual(data.GROUP_DESCRIPTIONS, {1: 'loop_admin'})
+
+    def test_load_lookup_tables_swaps_maps(self):
+        friend_status_ids = data.FRIEND_STATUS_IDS
+        group_descriptions = data.GROUP_DESCRIPTIONS
+        data.load_lookup_tables(data.DB_TYPE[DbType.WRITE])
+        # Readers holding the old maps never see them emptied.
+        self.assertIsNot(data.FRIEND_STATUS_IDS, friend_status_ids)
+        self.assertIsNot(data.GROUP_DESCRIPTIONS, group_descriptions)
+        self.assertEqual(friend_status_ids, data.FRIEND_STATUS_IDS)
+        self.assertEqual(group_descriptions, data.GROUP_DESCRIPTIONS)
+
+    def test_get_friend_status_id_reloads_missing_status(self):
+        data.FRIEND_STATUS_IDS.clear()
+        self.assertEqual(
+            data.get_friend_status_id(FriendStatusType.PENDING), 2
+        )
+
+    def test_get_friend_status_id_unknown(self):
+        self.assertRaises(
+            exceptions.UnknownFriendStatusTypeError,
+            data.get_friend_status_id,
+            FriendStatusType.UNKNOWN,
+        )
+
+    def test_get_friend_status_id_type_error(self):
+        self.assertRaises(TypeError, data.get_friend_status_id, 'Pending')
 
 
 class TestDeleteUser(unittest.TestCase):
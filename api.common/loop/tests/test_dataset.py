@@ -0,0 +1,136 @@
+import unittest
+
+from loop import data
+from loop.enums import DbType
+from loop.test_setup import setup_rds, unbind_rds
+from loop.test_setup.dataset import (
+    DatasetConfig,
+    delete_dataset,
+    generate_dataset,
+)
+from pony.orm import count, db_session, select
+
+TEST_CONFIG = DatasetConfig(
+    users=50,
+    locations=20,
+    ratings=200,
+    friends_per_user=3,
+    seed=1,
+    tag='test_dataset',
+    batch_size=16,
+)
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        setup_rds()
+        self.db = data.DB_TYPE[DbType.WRITE]
+
+    def tearDown(self):
+        unbind_rds()
+
+    @db_session
+    def _get_dataset(self):
+        users = select(
+            (user.email, user.first_name, user.last_name)
+            for user in self.db.User
+            if user.cognito_user_name.startswith('test_dataset:')
+        ).order_by(1)[:]
+        friendships = select(
+            (friend.friend_1.email, friend.friend_2.email, friend.status.id)
+            for friend in self.db.Friend
+            if friend.friend_1.cognito_user_name.startswith('test_dataset:')
+        ).order_by(1, 2)[:]
+        ratings = select(
+            (
+                rating.user.email,
+                rating.location.google_id,
+                rating.food,
+                rating.message,
+            )
+            for rating in self.db.Rating
+            if rating.user.cognito_user_name.startswith('test_dataset:')
+        ).order_by(1, 2)[:]
+        return users, friendships, ratings
+
+    @db_session
+    def _count_rows(self):
+        return (
+            count(user for user in self.db.User),
+            count(friend for friend in self.db.Friend),
+            count(location for location in self.db.Location),
+            count(rating for rating in self.db.Rating),
+        )
+
+    def test_generate_dataset(self):
+        seed_counts = self._count_rows()
+        summary = generate_dataset(self.db, TEST_CONFIG)
+        self.assertEqual(summary.users, 50)
+        self.assertEqual(summary.locations, 20)
+        self.assertEqual(summary.ratings, 200)
+        # Every user after the first three befriends three earlier users.
+        self.assertEqual(summary.friendships, 0 + 1 + 2 + 47 * 3)
+        self.assertEqual(
+            self._count_rows(),
+            (
+                seed_counts[0] + summary.users,
+                seed_counts[1] + summary.friendships,
+                seed_counts[2] + summary.locations,
+                seed_counts[3] + summary.ratings,
+            ),
+        )
+        with db_session:
+            self.assertEqual(
+                select(stats.count for stats in self.db.Location_stats).sum(),
+                self.db.Rating.select().count(),
+            )
+
+    def test_generate_dataset_other_db(self):
+        db = data.init_db(
+            {'provider': 'sqlite', 'filename': ':memory:'},
+            create_tables=True,
+        )
+        generate_dataset(db, TEST_CONFIG)
+        with db_session:
+            self.assertEqual(
+                select(stats.count for stats in db.Location_stats).sum(),
+                TEST_CONFIG.ratings,
+            )
+
+    def test_generate_dataset_search_name(self):
+        generate_dataset(self.db, TEST_CONFIG)
+        with db_session:
+            self.assertFalse(
+                self.db.User.exists(
+                    lambda user: user.cognito_user_name.startswith(
+                        'test_dataset:'
+                    )
+                    and user.search_name is None
+                )
+            )
+
+    def test_generate_dataset_reproducible(self):
+        generate_dataset(self.db, TEST_CONFIG)
+        dataset = self._get_dataset()
+        delete_dataset(self.db, TEST_CONFIG.tag)
+        generate_dataset(self.db, TEST_CONFIG)
+        self.assertEqual(self._get_dataset(), dataset)
+
+    def test_delete_dataset(self):
+        seed_counts = self._count_rows()
+        generate_dataset(self.db, TEST_CONFIG)
+        delete_dataset(self.db, TEST_CONFIG.tag)
+        self.assertEqual(self._count_rows(), seed_counts)
+
+    def test_generate_dataset_invalid_tag(self):
+        self.assertRaises(
+            ValueError,
+            generate_dataset,
+            self.db,
+            DatasetConfig(tag='bad tag%'),
+        )
+        self.assertRaises(TypeError, generate_dataset, self.db, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
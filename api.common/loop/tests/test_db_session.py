@@ -1,10 +1,11 @@
 import unittest
 from unittest.mock import Mock, call, patch
 
-from loop.db_session import DBSession
+from loop.db_session import DBSession, get_retry_delay, retryable_db_session
 from loop.enums import DbType
 from loop.exceptions import DbDisconnectFailedError
-from pony.orm import Database
+from loop.sql_metrics import collect_sql_metrics
+from pony.orm import Database, OperationalError, TransactionError, db_session
 
 
 class TestDbSession(unittest.TestCase):
@@ -67,6 +68,94 @@ class TestDbSession(unittest.TestCase):
         db_session = DBSession()
         self.assertEqual(len(db_session), 1)
 
+    def test_initialiser_db_session(self):
+        # The initialiser is only called on first access
+        db_session = DBSession()
+        database = Database()
+
+        def initialiser():
+            db_session[DbType.WRITE] = database
+
+        mock_initialiser = Mock(side_effect=initialiser)
+        db_session.set_initialiser(DbType.WRITE, mock_initialiser)
+        self.assertFalse(mock_initialiser.called)
+        self.assertIs(db_session[DbType.WRITE], database)
+        self.assertIs(db_session[DbType.WRITE], database)
+        self.assertEqual(mock_initialiser.call_count, 1)
+
+    def test_initialiser_db_session_error(self):
+        db_session = DBSession()
+        with self.assertRaises(TypeError):
+            db_session.set_initialiser('write', Mock())
+
+
+def get_flaky(failures: int, exception: Exception = TransactionError('test')):
+    attempts = []
+
+    @retryable_db_session((TransactionError,))
+    def flaky():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise exception
+        return len(attempts)
+
+    return flaky, attempts
+
+
+@patch('loop.db_session.time.sleep')
+class TestRetryableDbSession(unittest.TestCase):
+    def test_retries(self, mock_sleep):
+        flaky, attempts = get_flaky(2)
+        with collect_sql_metrics() as metrics:
+            self.assertEqual(flaky(), 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertEqual(metrics.retries, 2)
+        self.assertEqual(
+            metrics.retries_by_function,
+            {'loop.tests.test_db_session.get_flaky.<locals>.flaky': 2},
+        )
+        self.assertAlmostEqual(
+            metrics.retry_delay_ms,
+            sum(call.args[0] for call in mock_sleep.call_args_list) * 1000,
+        )
+
+    def test_max_retries(self, mock_sleep):
+        flaky, attempts = get_flaky(10)
+        self.assertRaises(TransactionError, flaky)
+        # The first attempt and 5 retries.
+        self.assertEqual(len(attempts), 6)
+
+    @patch('loop.db_session.time.monotonic')
+    @patch('loop.db_session.get_retry_delay', return_value=2)
+    def test_max_elapsed_time(self, mock_delay, mock_monotonic, mock_sleep):
+        clock = [0.0]
+        mock_monotonic.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds
+        )
+        flaky, attempts = get_flaky(10)
+        self.assertRaises(TransactionError, flaky)
+        # Retrying again would take more than 5 seconds in all.
+        self.assertEqual(len(attempts), 3)
+
+    def test_not_retryable(self, mock_sleep):
+        flaky, attempts = get_flaky(1, OperationalError('test'))
+        self.assertRaises(OperationalError, flaky)
+        self.assertEqual(len(attempts), 1)
+        self.assertFalse(mock_sleep.called)
+
+    def test_nested_not_retried(self, mock_sleep):
+        flaky, attempts = get_flaky(1)
+        with db_session:
+            self.assertRaises(TransactionError, flaky)
+        self.assertEqual(len(attempts), 1)
+
+    def test_get_retry_delay(self, mock_sleep):
+        for retry in range(10):
+            delay = get_retry_delay(retry)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(1, 0.05 * 2**retry))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from loop.deadline import (
+    check_budget,
+    get_boto_config,
+    get_max_attempts,
+    get_remaining_seconds,
+    get_timeout,
+    get_timeouts,
+    has_budget,
+    request_deadline,
+)
+from loop.exceptions import GatewayTimeoutError
+from loop.db_session import retryable_db_session
+from loop.utils import get_result, submit
+from pony.orm import TransactionError
+
+
+class TestNoDeadline(unittest.TestCase):
+    def test_defaults(self):
+        self.assertIsNone(get_remaining_seconds())
+        self.assertTrue(has_budget(1000))
+        check_budget('Google')
+        self.assertEqual(get_timeout(10), 10)
+        self.assertEqual(get_timeouts(2, 5), (2, 5))
+        self.assertEqual(get_max_attempts(3, 7), 3)
+
+
+class TestRequestDeadline(unittest.TestCase):
+    def test_request_deadline(self):
+        with request_deadline(remaining_ms=6000):
+            remaining_seconds = get_remaining_seconds()
+            # Less the safety margin.
+            self.assertTrue(4.5 < remaining_seconds <= 5)
+            self.assertTrue(has_budget(4))
+            self.assertFalse(has_budget(6))
+            self.assertEqual(get_timeout(2), 2)
+            self.assertLessEqual(get_timeout(10), 5)
+            self.assertEqual(get_max_attempts(3, 2), 2)
+            self.assertEqual(get_max_attempts(3, 10), 1)
+        self.assertIsNone(get_remaining_seconds())
+
+    def test_request_deadline_api_gateway_limit(self):
+        with request_deadline(remaining_ms=900000):
+            self.assertTrue(27 < get_remaining_seconds() <= 28)
+        with request_deadline():
+            self.assertTrue(27 < get_remaining_seconds() <= 28)
+
+    def test_check_budget(self):
+        with request_deadline(remaining_ms=500):
+            self.assertEqual(get_remaining_seconds(), 0)
+            with self.assertRaises(GatewayTimeoutError) as e:
+                check_budget('S3')
+            self.assertIn('S3', str(e.exception))
+
+    def test_get_boto_config(self):
+        config = get_boto_config()
+        self.assertEqual(config.connect_timeout, 2)
+        self.assertEqual(config.read_timeout, 5)
+        self.assertEqual(config.retries['max_attempts'], 3)
+        with request_deadline(remaining_ms=4000):
+            config = get_boto_config()
+            self.assertEqual(config.connect_timeout, 2)
+            self.assertLessEqual(config.read_timeout, 3)
+            self.assertEqual(config.retries['max_attempts'], 1)
+            config = get_boto_config(use_deadline=False)
+            self.assertEqual(config.read_timeout, 5)
+            self.assertEqual(config.retries['max_attempts'], 3)
+
+    def test_submit_shares_deadline(self):
+        with request_deadline(remaining_ms=6000):
+            remaining_seconds = get_result(
+                submit(get_remaining_seconds), 1, 'remaining time'
+            )
+        self.assertTrue(4.5 < remaining_seconds <= 5)
+
+    def test_no_db_retry_near_deadline(self):
+        attempts = []
+
+        @retryable_db_session((TransactionError,))
+        def flaky():
+            attempts.append(1)
+            raise TransactionError('test')
+
+        with request_deadline(remaining_ms=1500):
+            self.assertRaises(TransactionError, flaky)
+        self.assertEqual(len(attempts), 1)
@@ -1,21 +1,51 @@
 import unittest
+from datetime import datetime
 from unittest.mock import Mock, call, patch
 
-from loop.api_classes import SearchUsers
-from loop.data import DB_SESSION_RETRYABLE, DB_TYPE
-from loop.data_classes import FriendStatus, PaginatedUserSearch, UserObject
-from loop.enums import DbType, FriendRequestType, FriendStatusType
+from loop import friends
+from loop.api_classes import (
+    BoundingBox,
+    NearbyPlaces,
+    PaginatedFriends,
+    SearchUsers,
+)
+from loop.data import DB_SESSION_RETRYABLE, DB_TYPE, get_all_users
+from loop.data_classes import (
+    NULL_NEARBY_PLACES_PAGE_RESULT,
+    FriendCounts,
+    FriendsPageResults,
+    FriendStatus,
+    NearbyPlacesPageResults,
+    PaginatedUserSearch,
+    UserObject,
+)
+from loop.enums import (
+    DbType,
+    FriendRequestType,
+    FriendStatusType,
+    UserSearchMode,
+)
 from loop.exceptions import (
     BadRequestError,
     DbNotInitError,
     UnknownFriendStatusTypeError,
 )
 from loop.friends import (
+    PLACE_CLUSTERS,
+    USER_SEARCH_SESSIONS,
+    DatabaseUserSearch,
     FriendWorker,
+    get_friend_counts,
+    get_friend_place_clusters,
+    get_friend_places_in_bbox,
+    get_nearby_friend_places,
     get_pending_requests,
+    get_pending_requests_paginated,
     get_ratings_for_place_and_friends,
     get_user_friend_ids,
+    get_user_friend_statuses,
     get_user_friends,
+    get_user_friends_paginated,
     search_for_users,
 )
 from loop.test_setup import setup_rds, unbind_rds
@@ -47,6 +77,8 @@ class TestInitFriendWorker(unittest.TestCase):
 class TestFriends(unittest.TestCase):
     def setUp(self):
         setup_rds()
+        USER_SEARCH_SESSIONS.clear()
+        PLACE_CLUSTERS.clear()
 
     def tearDown(self):
         unbind_rds()
@@ -243,6 +275,179 @@ class TestFriends(unittest.TestCase):
             users, PaginatedUserSearch(user_data=[], total_pages=0)
         )
 
+    def test_search_for_users_database_mode(self):
+        expected_users = PaginatedUserSearch(
+            user_data=[
+                {
+                    'id': 4,
+                    'user_name': '67ce7049-109f-420f-861b-3f1e7d6824b5',
+                    'name': 'Random Persons-Mate',
+                    'friend_status': 'Pending',
+                },
+                {
+                    'id': 3,
+                    'user_name': '60c1f02b-f758-4458-8c41-3b5c9fa20ae0',
+                    'name': 'Random Person',
+                    'friend_status': 'Friends',
+                },
+            ],
+            total_pages=1,
+        )
+        search_term = SearchUsers(
+            term='random mate', page_count=1, mode=UserSearchMode.DATABASE
+        )
+        users = search_for_users(USER_2, search_term)
+        self.assertEqual(users, expected_users)
+
+    def test_search_for_users_database_mode_later_word(self):
+        search_term = SearchUsers(
+            term='mate', page_count=1, mode=UserSearchMode.DATABASE
+        )
+        users = search_for_users(USER_2, search_term)
+        self.assertEqual([user['id'] for user in users.user_data], [4])
+
+    @DB_SESSION_RETRYABLE
+    def test_database_user_search_candidates(self):
+        search = DatabaseUserSearch(USER_2)
+        candidates, truncated = search._get_candidates('random')
+        self.assertEqual([user['id'] for user in candidates], [3, 4])
+        self.assertFalse(truncated)
+        # Later word matches are read after the name prefix matches, each in
+        # search_name order.
+        candidates, _ = search._get_candidates('user')
+        self.assertEqual([user['id'] for user in candidates], [1])
+        with patch('loop.friends.SEARCH_USER_DB_CANDIDATES', 1):
+            candidates, truncated = search._get_candidates('person')
+        self.assertEqual([user['id'] for user in candidates], [3])
+        self.assertTrue(truncated)
+
+    def test_search_for_users_database_mode_no_candidates(self):
+        search_term = SearchUsers(
+            term='Pippa', page_count=1, mode=UserSearchMode.DATABASE
+        )
+        users = search_for_users(USER_2, search_term)
+        self.assertEqual(
+            users, PaginatedUserSearch(user_data=[], total_pages=0)
+        )
+
+    def test_search_for_all_users_database_mode(self):
+        search_term = SearchUsers(
+            term='', page_count=1, mode=UserSearchMode.DATABASE
+        )
+        users = search_for_users(USER_2, search_term)
+        self.assertEqual(
+            [
+                (user['id'], user['friend_status'])
+                for user in users.user_data
+            ],
+            [(1, 'Not friends'), (3, 'Friends'), (4, 'Pending')],
+        )
+        self.assertEqual(users.total_pages, 1)
+
+    def test_search_for_all_users_database_mode_page_error(self):
+        search_term = SearchUsers(
+            term='', page_count=2, mode=UserSearchMode.DATABASE
+        )
+        self.assertRaises(
+            BadRequestError, search_for_users, USER_2, search_term
+        )
+
+    @patch('loop.friends.get_all_users', wraps=get_all_users)
+    def test_search_for_users_reuses_session(self, mock_get_all_users):
+        for term in ['r', 'ra', 'random mate']:
+            search_for_users(USER_2, SearchUsers(term=term, page_count=1))
+        self.assertEqual(mock_get_all_users.call_count, 1)
+        self.assertEqual(USER_SEARCH_SESSIONS[USER_2.id].term, 'random mate')
+        # Going back (not extending the term) reads the users again.
+        users = search_for_users(
+            USER_2, SearchUsers(term='rand', page_count=1)
+        )
+        self.assertEqual(mock_get_all_users.call_count, 2)
+        self.assertCountEqual(
+            [user['id'] for user in users.user_data], [3, 4]
+        )
+
+    @patch('loop.friends.get_all_users', wraps=get_all_users)
+    def test_search_for_users_database_mode_narrows_session(
+        self, mock_get_all_users
+    ):
+        for term in ['ra', 'random', 'random mate']:
+            users = search_for_users(
+                USER_2,
+                SearchUsers(
+                    term=term, page_count=1, mode=UserSearchMode.DATABASE
+                ),
+            )
+        self.assertEqual(mock_get_all_users.call_count, 1)
+        self.assertEqual([user['id'] for user in users.user_data], [4, 3])
+        # The longest token changes so the candidates are read again.
+        users = search_for_users(
+            USER_2,
+            SearchUsers(
+                term='random persons',
+                page_count=1,
+                mode=UserSearchMode.DATABASE,
+            ),
+        )
+        self.assertEqual(mock_get_all_users.call_count, 2)
+        self.assertEqual([user['id'] for user in users.user_data], [4])
+
+    @patch('loop.friends.UserSearch._refine_users_by_search_term')
+    def test_search_for_users_page_reuses_ranking(self, mock_refine):
+        mock_refine.return_value = [{'id': i} for i in range(30)]
+        search_for_users(USER_2, SearchUsers(term='random', page_count=1))
+        users = search_for_users(
+            USER_2, SearchUsers(term='random', page_count=2)
+        )
+        self.assertEqual(mock_refine.call_count, 1)
+        self.assertEqual(users.user_data, [{'id': i} for i in range(20, 30)])
+        self.assertEqual(users.total_pages, 2)
+
+    @patch('loop.friends.USER_SEARCH_SESSION_MAX_CANDIDATES', 2)
+    @patch('loop.friends.get_all_users', wraps=get_all_users)
+    def test_search_for_users_session_capped(self, mock_get_all_users):
+        search_for_users(USER_2, SearchUsers(term='r', page_count=1))
+        session = USER_SEARCH_SESSIONS[USER_2.id]
+        self.assertEqual(len(session.search_users), 2)
+        self.assertTrue(session.truncated)
+        # The cut off candidates are not narrowed, so the users are read.
+        users = search_for_users(
+            USER_2, SearchUsers(term='ra', page_count=1)
+        )
+        self.assertEqual(mock_get_all_users.call_count, 2)
+        self.assertCountEqual(
+            [user['id'] for user in users.user_data], [1, 3, 4]
+        )
+
+    @patch('loop.friends.USER_SEARCH_SESSION_MAX_CANDIDATES', 20)
+    @patch('loop.friends.UserSearch._refine_users_by_search_term')
+    def test_search_for_users_page_capped_ranking(self, mock_refine):
+        mock_refine.return_value = [{'id': i} for i in range(30)]
+        search_for_users(USER_2, SearchUsers(term='random', page_count=1))
+        self.assertTrue(USER_SEARCH_SESSIONS[USER_2.id].ranked_truncated)
+        users = search_for_users(
+            USER_2, SearchUsers(term='random', page_count=2)
+        )
+        self.assertEqual(mock_refine.call_count, 2)
+        self.assertEqual(users.user_data, [{'id': i} for i in range(20, 30)])
+
+    def test_search_for_users_session_cleared_by_friend_change(self):
+        search_for_users(USER_1, SearchUsers(term='random', page_count=1))
+        FriendWorker(USER_1).create_friend_entry(USER_3)
+        self.assertNotIn(USER_1.id, USER_SEARCH_SESSIONS)
+        users = search_for_users(
+            USER_1, SearchUsers(term='random', page_count=1)
+        )
+        self.assertIn(
+            {
+                'id': 3,
+                'user_name': '60c1f02b-f758-4458-8c41-3b5c9fa20ae0',
+                'name': 'Random Person',
+                'friend_status': 'Pending',
+            },
+            users.user_data,
+        )
+
     def test_search_for_users_type_error_1(self):
         search_term = SearchUsers(term='Henry', page_count=1)
         self.assertRaises(TypeError, search_for_users, 'USER_2', search_term)
@@ -259,6 +464,20 @@ class TestFriends(unittest.TestCase):
         users = get_user_friend_ids(USER_2, include_own_id=False)
         self.assertEqual(users, [3])
 
+    def test_get_user_friend_statuses(self):
+        self.assertEqual(
+            get_user_friend_statuses(USER_2),
+            {3: FriendStatusType.FRIENDS, 4: FriendStatusType.PENDING},
+        )
+
+    def test_get_user_friend_statuses_no_friends(self):
+        self.assertEqual(
+            get_user_friend_statuses(USER_1), {4: FriendStatusType.PENDING}
+        )
+
+    def test_get_user_friend_statuses_type_error(self):
+        self.assertRaises(TypeError, get_user_friend_statuses, 'User 1')
+
     def test_get_user_friend_ids_type_error(self):
         self.assertRaises(TypeError, get_user_friend_ids, 'User 1')
 
@@ -332,13 +551,6 @@ class TestFriends(unittest.TestCase):
         self.assertEqual(
             both_requests,
             [
-                {
-                    'id': 1,
-                    'user_name': 'test_cognito_user_name',
-                    'email': 'test_email',
-                    'first_name': 'Test',
-                    'last_name': 'User',
-                },
                 {
                     'id': 3,
                     'user_name': '60c1f02b-f758-4458-8c41-3b5c9fa20ae0',
@@ -353,9 +565,319 @@ class TestFriends(unittest.TestCase):
                     'first_name': 'Admin',
                     'last_name': 'User',
                 },
+                {
+                    'id': 1,
+                    'user_name': 'test_cognito_user_name',
+                    'email': 'test_email',
+                    'first_name': 'Test',
+                    'last_name': 'User',
+                },
+            ],
+        )
+
+    def test_get_inbound_pending_requests_paginated(self):
+        first_page = get_pending_requests_paginated(
+            USER_4, FriendRequestType.INBOUND, PaginatedFriends(limit=1)
+        )
+        self.assertEqual(
+            first_page,
+            FriendsPageResults(
+                page_data=[
+                    {
+                        'id': 3,
+                        'user_name': '60c1f02b-f758-4458-8c41-3b5c9fa20ae0',
+                        'email': 'test_person_email',
+                        'first_name': 'Random',
+                        'last_name': 'Person',
+                    }
+                ],
+                next_cursor=2,
+            ),
+        )
+        second_page = get_pending_requests_paginated(
+            USER_4,
+            FriendRequestType.INBOUND,
+            PaginatedFriends(cursor=first_page.next_cursor, limit=1),
+        )
+        self.assertEqual(
+            second_page,
+            FriendsPageResults(
+                page_data=[
+                    {
+                        'id': 2,
+                        'user_name': '86125274-40a1-70ec-da28-f779360f7c07',
+                        'email': 'admin_test_email',
+                        'first_name': 'Admin',
+                        'last_name': 'User',
+                    }
+                ],
+                next_cursor=None,
+            ),
+        )
+
+    def test_get_pending_requests_paginated_type_error(self):
+        self.assertRaises(
+            TypeError,
+            get_pending_requests_paginated,
+            USER_4,
+            FriendRequestType.INBOUND,
+            {'limit': 1},
+        )
+
+    def test_get_user_friends_paginated(self):
+        friends_page = get_user_friends_paginated(USER_2, PaginatedFriends())
+        self.assertEqual(
+            friends_page.to_dict(),
+            {
+                'page_data': get_user_friends(USER_2),
+                'next_cursor': None,
+            },
+        )
+
+    def test_get_user_friends_paginated_past_last_page(self):
+        friends_page = get_user_friends_paginated(
+            USER_2, PaginatedFriends(cursor=1)
+        )
+        self.assertEqual(friends_page, FriendsPageResults(page_data=[]))
+
+    def test_paginated_friends_limit_error(self):
+        self.assertRaises(ValueError, PaginatedFriends, limit=101)
+
+    def test_get_friend_counts(self):
+        self.assertEqual(
+            get_friend_counts(USER_4),
+            FriendCounts(friends=0, inbound=2, outbound=1),
+        )
+        self.assertEqual(
+            get_friend_counts(USER_2),
+            FriendCounts(friends=1, inbound=0, outbound=1),
+        )
+
+    def test_get_friend_counts_type_error(self):
+        self.assertRaises(TypeError, get_friend_counts, 'user')
+
+    @DB_SESSION_RETRYABLE
+    def _create_rating(self, **kwargs):
+        DB_TYPE[DbType.WRITE].Rating(
+            created=datetime(2001, 1, 1),
+            last_updated=datetime(2001, 1, 1),
+            **kwargs,
+        )
+
+    def test_get_friend_places_in_bbox(self):
+        self._create_rating(user=3, location=1, price=2, vibe=3, food=5)
+        places = get_friend_places_in_bbox(
+            USER_3, BoundingBox(south=0, west=-1, north=2, east=0), 8
+        )
+        self.assertEqual(
+            places,
+            [
+                {
+                    'id': 1,
+                    'google_id': 'test_google_id_1',
+                    'display_name': 'Home',
+                    'coordinates': {'lat': 1.5, 'lng': -0.7},
+                    'ratings': 2,
+                    'food': 4.0,
+                    'price': 3.0,
+                    'vibe': 4.0,
+                    'latest_reviewer': {
+                        'id': 3,
+                        'first_name': 'Random',
+                        'last_name': 'Person',
+                        'last_rated': '2001-01-01 00:00:00',
+                    },
+                },
+                {
+                    'id': 3,
+                    'google_id': 'test_google_id_3',
+                    'display_name': 'JFs',
+                    'coordinates': {'lat': 1.9, 'lng': -0.8},
+                    'ratings': 1,
+                    'food': 5.0,
+                    'price': 5.0,
+                    'vibe': 5.0,
+                    'latest_reviewer': {
+                        'id': 2,
+                        'first_name': 'Admin',
+                        'last_name': 'User',
+                        'last_rated': '2000-01-01 00:00:00',
+                    },
+                },
             ],
         )
 
+    def test_get_friend_places_in_bbox_outside_bbox(self):
+        places = get_friend_places_in_bbox(
+            USER_1, BoundingBox(south=1.3, west=-1, north=2, east=0), 12
+        )
+        self.assertEqual([place['id'] for place in places], [1])
+        places = get_friend_places_in_bbox(
+            USER_1, BoundingBox(south=10, west=10, north=20, east=20), 5
+        )
+        self.assertEqual(places, [])
+
+    def test_get_friend_places_in_bbox_antimeridian(self):
+        places = get_friend_places_in_bbox(
+            USER_1, BoundingBox(south=0, west=170, north=2, east=-0.8), 3
+        )
+        self.assertEqual([place['id'] for place in places], [2])
+
+    def test_get_friend_places_in_bbox_type_error(self):
+        bbox = BoundingBox(south=0, west=-1, north=2, east=0)
+        self.assertRaises(
+            TypeError, get_friend_places_in_bbox, 'user', bbox, 8
+        )
+        self.assertRaises(
+            TypeError, get_friend_places_in_bbox, USER_1, bbox.to_tuple(), 8
+        )
+        self.assertRaises(
+            TypeError, get_friend_places_in_bbox, USER_1, bbox, '8'
+        )
+
+    def test_get_friend_place_clusters(self):
+        self._create_rating(user=3, location=2, price=2, vibe=3, food=5)
+        bbox = BoundingBox(south=0, west=-1, north=2, east=0)
+        self.assertEqual(
+            get_friend_place_clusters(USER_3, bbox, 3),
+            [
+                {
+                    'geohash': 'eb',
+                    'count': 3,
+                    'coordinates': {'lat': 1.533333, 'lng': -0.8},
+                }
+            ],
+        )
+        self.assertEqual(
+            get_friend_place_clusters(USER_3, bbox, 8),
+            [
+                {
+                    'geohash': 'ebpq',
+                    'count': 1,
+                    'coordinates': {'lat': 1.2, 'lng': -0.9},
+                },
+                {
+                    'geohash': 'ebr6',
+                    'count': 1,
+                    'coordinates': {'lat': 1.9, 'lng': -0.8},
+                },
+                {
+                    'geohash': 'ebr8',
+                    'count': 1,
+                    'coordinates': {'lat': 1.5, 'lng': -0.7},
+                },
+            ],
+        )
+
+    def test_get_friend_place_clusters_outside_bbox(self):
+        bbox = BoundingBox(south=10, west=10, north=20, east=20)
+        self.assertEqual(get_friend_place_clusters(USER_3, bbox, 5), [])
+
+    @patch(
+        'loop.friends._cluster_friend_places',
+        wraps=friends._cluster_friend_places,
+    )
+    def test_get_friend_place_clusters_cached(self, mock_cluster):
+        bbox = BoundingBox(south=0, west=-1, north=2, east=0)
+        clusters = get_friend_place_clusters(USER_3, bbox, 8)
+        self.assertEqual(get_friend_place_clusters(USER_3, bbox, 8), clusters)
+        mock_cluster.assert_called_once()
+        # Only the cells not already cached are clustered.
+        get_friend_place_clusters(
+            USER_3, BoundingBox(south=0, west=-1, north=2, east=3), 8
+        )
+        self.assertEqual(mock_cluster.call_count, 2)
+        self.assertEqual(
+            mock_cluster.call_args_list[1].args[1],
+            ['s01', 's04', 's03', 's06'],
+        )
+        get_friend_place_clusters(USER_3, bbox, 9)
+        self.assertEqual(mock_cluster.call_count, 3)
+
+    def test_get_friend_place_clusters_cleared_by_friend_change(self):
+        bbox = BoundingBox(south=0, west=-1, north=2, east=0)
+        for user in (USER_1, USER_2, USER_3):
+            get_friend_place_clusters(user, bbox, 8)
+        FriendWorker(USER_3).delete_friend(USER_2)
+        self.assertEqual(get_friend_place_clusters(USER_3, bbox, 8), [])
+        self.assertTrue(all(key[0] != 2 for key in PLACE_CLUSTERS))
+        self.assertTrue(any(key[0] == 1 for key in PLACE_CLUSTERS))
+
+    def test_get_friend_place_clusters_type_error(self):
+        bbox = BoundingBox(south=0, west=-1, north=2, east=0)
+        self.assertRaises(
+            TypeError, get_friend_place_clusters, 'user', bbox, 8
+        )
+        self.assertRaises(
+            TypeError, get_friend_place_clusters, USER_1, bbox.to_tuple(), 8
+        )
+        self.assertRaises(
+            TypeError, get_friend_place_clusters, USER_1, bbox, '8'
+        )
+
+    def test_get_nearby_friend_places(self):
+        self._create_rating(user=3, location=1, price=2, vibe=3, food=5)
+        self.assertEqual(
+            get_nearby_friend_places(USER_3, NearbyPlaces(lat=1.9, lng=-0.8)),
+            NearbyPlacesPageResults(
+                page_data=[
+                    {
+                        'id': 3,
+                        'google_id': 'test_google_id_3',
+                        'display_name': 'JFs',
+                        'coordinates': {'lat': 1.9, 'lng': -0.8},
+                        'distance_km': 0.0,
+                    },
+                    {
+                        'id': 1,
+                        'google_id': 'test_google_id_1',
+                        'display_name': 'Home',
+                        'coordinates': {'lat': 1.5, 'lng': -0.7},
+                        'distance_km': 45.846,
+                    },
+                ],
+                total_pages=1,
+            ),
+        )
+
+    def test_get_nearby_friend_places_far_away(self):
+        results = get_nearby_friend_places(
+            USER_1, NearbyPlaces(lat=-40, lng=170)
+        )
+        self.assertEqual(
+            [place['id'] for place in results.page_data], [2, 1]
+        )
+
+    @patch('loop.friends.NEARBY_PLACES_PAGE_COUNT', 1)
+    def test_get_nearby_friend_places_pages(self):
+        nearby_places = NearbyPlaces(lat=1.2, lng=-0.9, page_count=2)
+        results = get_nearby_friend_places(USER_1, nearby_places)
+        self.assertEqual(results.total_pages, 2)
+        self.assertEqual(
+            [place['id'] for place in results.page_data], [1]
+        )
+        nearby_places.page_count = 3
+        self.assertRaises(
+            BadRequestError, get_nearby_friend_places, USER_1, nearby_places
+        )
+
+    def test_get_nearby_friend_places_no_places(self):
+        self.assertEqual(
+            get_nearby_friend_places(USER_4, NearbyPlaces(lat=0, lng=0)),
+            NULL_NEARBY_PLACES_PAGE_RESULT,
+        )
+
+    def test_get_nearby_friend_places_type_error(self):
+        self.assertRaises(
+            TypeError,
+            get_nearby_friend_places,
+            'user',
+            NearbyPlaces(lat=0, lng=0),
+        )
+        self.assertRaises(
+            TypeError, get_nearby_friend_places, USER_1, (0, 0)
+        )
+
     def test_get_pending_requests_type_error_1(self):
         """Incorrect user type"""
         self.assertRaises(TypeError, get_pending_requests, USER_4)
@@ -0,0 +1,116 @@
+import subprocess
+import sys
+import unittest
+
+from loop.constants import MAX_BBOX_GEOHASH_CELLS
+from loop.geo import (
+    GEOHASH_END,
+    cluster_points,
+    encode_geohash,
+    get_bbox_cells,
+    get_geohash_ranges,
+    get_haversine_distances,
+    get_radius_bbox,
+    get_zoom_precision,
+)
+
+
+class TestGeo(unittest.TestCase):
+    def test_encode_geohash(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(51.5072, -0.1276, 5), 'gcpvj')
+        self.assertEqual(encode_geohash(-90, -180, 3), '000')
+
+    def test_get_zoom_precision(self):
+        self.assertEqual(get_zoom_precision(0), 1)
+        self.assertEqual(get_zoom_precision(10), 4)
+        self.assertEqual(get_zoom_precision(21), 8)
+
+    def test_get_bbox_cells(self):
+        cells = get_bbox_cells((51.5, -0.13, 51.51, -0.12), 6)
+        self.assertTrue(all(len(cell) == 6 for cell in cells))
+        self.assertIn(encode_geohash(51.505, -0.125, 6), cells)
+
+    def test_get_bbox_cells_lowers_precision(self):
+        cells = get_bbox_cells((40, -10, 60, 10), 9)
+        self.assertLessEqual(len(cells), MAX_BBOX_GEOHASH_CELLS)
+        self.assertIn(encode_geohash(51.5072, -0.1276, len(cells[0])), cells)
+
+    def test_get_bbox_cells_antimeridian(self):
+        cells = get_bbox_cells((-10, 170, 10, -170), 2)
+        self.assertIn(encode_geohash(0, 175, 2), cells)
+        self.assertIn(encode_geohash(0, -175, 2), cells)
+        self.assertNotIn(encode_geohash(0, 0, 2), cells)
+
+    def test_get_geohash_ranges(self):
+        self.assertEqual(
+            get_geohash_ranges(['gcpv', 'gcpu', 'gcpz', 'gcp']),
+            [('gcp', 'gcq')],
+        )
+        self.assertEqual(
+            get_geohash_ranges(['gcpv', 'gcpu', 'u10']),
+            [('gcpu', 'gcpw'), ('u10', 'u11')],
+        )
+        self.assertEqual(get_geohash_ranges(['zz']), [('zz', GEOHASH_END)])
+
+    def test_cluster_points(self):
+        cells, counts, latitudes, longitudes = cluster_points(
+            ['gcpvj0', 'u10abc', 'gcpvk1', 'gcpvj2'],
+            [51.0, 52.0, 51.2, 51.1],
+            [-0.1, 0.5, -0.3, -0.2],
+            4,
+        )
+        self.assertEqual(cells.tolist(), ['gcpv', 'u10a'])
+        self.assertEqual(counts.tolist(), [3, 1])
+        self.assertEqual(latitudes.round(6).tolist(), [51.1, 52.0])
+        self.assertEqual(longitudes.round(6).tolist(), [-0.2, 0.5])
+
+    def test_cluster_points_no_points(self):
+        cells, counts, latitudes, longitudes = cluster_points([], [], [], 4)
+        self.assertEqual(cells.tolist(), [])
+        self.assertEqual(counts.tolist(), [])
+
+    def test_get_haversine_distances(self):
+        distances = get_haversine_distances(
+            51.5072,
+            -0.1276,
+            [51.5072, 48.8566, -51.5072],
+            [-0.1276, 2.3522, 179.8724],
+        )
+        self.assertEqual(distances.round(1).tolist(), [0.0, 343.5, 20015.1])
+
+    def test_get_radius_bbox(self):
+        south, west, north, east = get_radius_bbox(51.5, -0.1, 10)
+        self.assertAlmostEqual(north - 51.5, 0.0899, places=4)
+        self.assertAlmostEqual(51.5 - south, 0.0899, places=4)
+        # Longitudes are closer together away from the equator.
+        self.assertAlmostEqual(east + 0.1, 0.1445, places=4)
+        self.assertAlmostEqual(-0.1 - west, 0.1445, places=4)
+
+    def test_get_radius_bbox_antimeridian(self):
+        south, west, north, east = get_radius_bbox(0, 179.9, 50)
+        self.assertGreater(west, east)
+        self.assertAlmostEqual(east, -179.65, places=2)
+
+    def test_get_radius_bbox_pole(self):
+        self.assertEqual(
+            get_radius_bbox(89, 10, 500)[1:], (-180.0, 90.0, 180.0)
+        )
+
+    def test_numpy_not_imported_with_data(self):
+        # Every lambda imports loop.data (and so loop.geo).
+        output = subprocess.run(
+            [
+                sys.executable,
+                '-c',
+                "import sys, loop.data; print('numpy' in sys.modules)",
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        self.assertEqual(output.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,21 @@
+import time
 import unittest
 from unittest.mock import Mock, call, patch
 
 import googlemaps
-from googlemaps.exceptions import ApiError
+from googlemaps.exceptions import ApiError, Timeout
 from loop.api_classes import Coordinates
 from loop.data_classes import Location
-from loop.exceptions import GoogleApiError
+from loop.deadline import request_deadline
+from loop.exceptions import (
+    BadRequestError,
+    GatewayTimeoutError,
+    GoogleApiError,
+)
 from loop.google_client import (
     PlaceSearcher,
     PlacesSearcher,
+    find_locations,
     get_coordinates_from_result,
 )
 
@@ -131,6 +138,34 @@ class TestSearchPlace(unittest.TestCase):
         google_id = 'Test_google_id'
         self.assertRaises(ApiError, self.place_searcher.get_place, google_id)
 
+    @patch('loop.google_client.places.get_secret')
+    @patch.object(googlemaps, 'Client')
+    def test_client_timeouts(self, mock_googlemaps, mock_secret):
+        mock_secret.return_value = {'key': 'mock_secret'}
+        PlaceSearcher()
+        self.assertEqual(
+            mock_googlemaps.call_args,
+            call(
+                key='mock_secret',
+                connect_timeout=2,
+                read_timeout=5,
+                retry_timeout=10,
+            ),
+        )
+        with request_deadline(remaining_ms=4000):
+            PlaceSearcher()
+        kwargs = mock_googlemaps.call_args.kwargs
+        self.assertEqual(kwargs['connect_timeout'], 2)
+        self.assertLessEqual(kwargs['read_timeout'], 3)
+        self.assertLessEqual(kwargs['retry_timeout'], 3)
+
+    @patch('loop.google_client.places.get_secret')
+    @patch.object(googlemaps, 'Client')
+    def test_no_call_near_deadline(self, mock_googlemaps, mock_secret):
+        with request_deadline(remaining_ms=1000):
+            self.assertRaises(GatewayTimeoutError, PlaceSearcher)
+        self.assertFalse(mock_googlemaps.called)
+
 
 class TestSearchPlaces(unittest.TestCase):
     @patch('loop.google_client.places.get_secret')
@@ -244,5 +279,70 @@ class TestSearchPlaces(unittest.TestCase):
         )
 
 
+class TestFindLocations(unittest.TestCase):
+    @patch('loop.google_client.places.find_location')
+    def test_find_locations(self, mock_find_location):
+        def _find_location(google_id):
+            if google_id == 'missing':
+                raise BadRequestError(f'Could not find {google_id}')
+            if google_id == 'slow':
+                raise Timeout()
+            return Location(
+                google_id=google_id,
+                address='Test Address',
+                display_name='Test Name',
+                coordinates=TEST_COORDINATES,
+            )
+
+        mock_find_location.side_effect = _find_location
+        locations, failed_google_ids = find_locations(
+            ['place_1', 'missing', 'place_2', 'slow'], max_workers=2
+        )
+        self.assertEqual(list(locations), ['place_1', 'place_2'])
+        self.assertEqual(locations['place_2'].google_id, 'place_2')
+        self.assertEqual(failed_google_ids, ['missing', 'slow'])
+
+    @patch('loop.google_client.places.find_location')
+    def test_find_locations_none(self, mock_find_location):
+        self.assertEqual(find_locations([]), ({}, []))
+        self.assertFalse(mock_find_location.called)
+
+    @patch('loop.google_client.places.GOOGLE_PLACE_TIMEOUT_SECONDS', 0.05)
+    @patch('loop.google_client.places.find_location')
+    def test_find_locations_timeout(self, mock_find_location):
+        def _find_location(google_id):
+            if google_id == 'slow':
+                time.sleep(0.5)
+            return Location(
+                google_id=google_id,
+                address='Test Address',
+                display_name='Test Name',
+                coordinates=TEST_COORDINATES,
+            )
+
+        mock_find_location.side_effect = _find_location
+        locations, failed_google_ids = find_locations(
+            ['place_1', 'slow', 'place_2'], max_workers=2
+        )
+        self.assertEqual(list(locations), ['place_1', 'place_2'])
+        self.assertEqual(failed_google_ids, ['slow'])
+
+    @patch('loop.google_client.places.find_location')
+    def test_find_locations_out_of_time(self, mock_find_location):
+        mock_find_location.side_effect = lambda google_id: time.sleep(0.2)
+        with request_deadline(0):
+            locations, failed_google_ids = find_locations(
+                ['place_1', 'place_2']
+            )
+        self.assertEqual(locations, {})
+        self.assertEqual(failed_google_ids, ['place_1', 'place_2'])
+        self.assertFalse(mock_find_location.called)
+
+    @patch('loop.google_client.places.find_location')
+    def test_find_locations_unexpected_error(self, mock_find_location):
+        mock_find_location.side_effect = ValueError('secret')
+        self.assertRaises(ValueError, find_locations, ['place_1'])
+
+
 if __name__ == '__main__':
     unittest.main()
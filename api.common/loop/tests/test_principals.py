@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from loop.data_classes import UserObject
+from loop.exceptions import BadRequestError, UnauthorizedError
+from loop.principals import (
+    PRINCIPAL_CACHE,
+    clear_principal_cache,
+    decode_auth_token,
+    get_user_from_auth_token,
+)
+from loop.test_setup import setup_rds, unbind_rds
+
+TEST_COGNITO_USER_NAME = 'test_cognito_user_name'
+TEST_KEY_ID = 'test_key_id'
+TEST_PRIVATE_KEY = rsa.generate_private_key(
+    public_exponent=65537, key_size=2048
+)
+TEST_USER = UserObject(
+    id=1, cognito_user_name=TEST_COGNITO_USER_NAME, groups=[]
+)
+
+
+def get_token(
+    sub=TEST_COGNITO_USER_NAME,
+    exp_in_seconds=3600,
+    private_key=TEST_PRIVATE_KEY,
+    key_id=TEST_KEY_ID,
+) -> str:
+    return jwt.encode(
+        {'sub': sub, 'exp': int(time.time()) + exp_in_seconds},
+        private_key,
+        algorithm='RS256',
+        headers={'kid': key_id},
+    )
+
+
+def get_jwks_document() -> dict:
+    jwk = json.loads(RSAAlgorithm.to_jwk(TEST_PRIVATE_KEY.public_key()))
+    jwk.update({'kid': TEST_KEY_ID, 'alg': 'RS256', 'use': 'sig'})
+    return {'keys': [jwk]}
+
+
+class TestPrincipals(unittest.TestCase):
+    def setUp(self):
+        setup_rds()
+        clear_principal_cache()
+
+    def tearDown(self):
+        unbind_rds()
+        clear_principal_cache()
+
+    def test_get_user_from_auth_token(self):
+        user = get_user_from_auth_token(get_token())
+        self.assertEqual(user, TEST_USER)
+
+    @patch('loop.data.get_user_from_cognito_username')
+    def test_get_user_from_auth_token_cached(self, mock_get_user):
+        mock_get_user.return_value = TEST_USER
+        auth_token = get_token()
+        get_user_from_auth_token(auth_token)
+        user = get_user_from_auth_token(auth_token)
+        self.assertEqual(user, TEST_USER)
+        self.assertEqual(mock_get_user.call_count, 1)
+        get_user_from_auth_token(get_token(exp_in_seconds=1800))
+        self.assertEqual(mock_get_user.call_count, 2)
+
+    @patch('loop.data.get_user_from_cognito_username')
+    def test_get_user_from_auth_token_cache_expires(self, mock_get_user):
+        mock_get_user.return_value = TEST_USER
+        auth_token = get_token()
+        get_user_from_auth_token(auth_token)
+        for cached_principal in PRINCIPAL_CACHE.values():
+            cached_principal.expires_at = time.time() - 1
+        get_user_from_auth_token(auth_token)
+        self.assertEqual(mock_get_user.call_count, 2)
+
+    @patch('loop.data.get_user_from_cognito_username')
+    def test_get_user_from_auth_token_expired_not_cached(
+        self, mock_get_user
+    ):
+        # Without a JWKS the token is not verified, but is not cached either
+        mock_get_user.return_value = TEST_USER
+        get_user_from_auth_token(get_token(exp_in_seconds=-60))
+        self.assertEqual(len(PRINCIPAL_CACHE), 0)
+
+    def test_get_user_from_auth_token_unknown_user(self):
+        self.assertRaises(
+            BadRequestError,
+            get_user_from_auth_token,
+            get_token(sub='unknown_user'),
+        )
+
+    def test_get_user_from_auth_token_missing_sub(self):
+        auth_token = jwt.encode({'exp': int(time.time()) + 60}, 'secret')
+        self.assertRaises(
+            UnauthorizedError, get_user_from_auth_token, auth_token
+        )
+
+    def test_get_user_from_auth_token_decode_error(self):
+        self.assertRaises(
+            UnauthorizedError, get_user_from_auth_token, 'not_a_token'
+        )
+
+    def test_get_user_from_auth_token_type_error(self):
+        self.assertRaises(TypeError, get_user_from_auth_token, None)
+
+
+class TestDecodeAuthTokenWithJwks(unittest.TestCase):
+    def setUp(self):
+        clear_principal_cache()
+        jwks_file = tempfile.NamedTemporaryFile(
+            'w', suffix='.json', delete=False
+        )
+        json.dump(get_jwks_document(), jwks_file)
+        jwks_file.close()
+        self.addCleanup(os.remove, jwks_file.name)
+        patcher = patch('loop.principals.COGNITO_JWKS_FILE', jwks_file.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clear_principal_cache()
+
+    def test_decode_auth_token(self):
+        claims = decode_auth_token(get_token())
+        self.assertEqual(claims['sub'], TEST_COGNITO_USER_NAME)
+
+    def test_decode_auth_token_expired(self):
+        self.assertRaises(
+            UnauthorizedError,
+            decode_auth_token,
+            get_token(exp_in_seconds=-60),
+        )
+
+    def test_decode_auth_token_invalid_signature(self):
+        private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        self.assertRaises(
+            UnauthorizedError,
+            decode_auth_token,
+            get_token(private_key=private_key),
+        )
+
+    def test_decode_auth_token_unknown_key(self):
+        self.assertRaises(
+            UnauthorizedError,
+            decode_auth_token,
+            get_token(key_id='unknown_key_id'),
+        )
+
+    @patch('loop.principals.COGNITO_JWKS_FILE', None)
+    @patch('loop.principals.COGNITO_JWKS_SECRET_NAME', 'test_jwks_secret')
+    @patch('loop.principals.get_secret')
+    def test_decode_auth_token_jwks_secret(self, mock_get_secret):
+        mock_get_secret.return_value = get_jwks_document()
+        decode_auth_token(get_token())
+        decode_auth_token(get_token())
+        mock_get_secret.assert_called_once_with('test_jwks_secret')
+
+
+if __name__ == '__main__':
+    unittest.main()
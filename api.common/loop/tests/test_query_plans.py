@@ -0,0 +1,85 @@
+import unittest
+
+from loop import data, friends
+from loop.api_classes import BoundingBox, NearbyPlaces, PaginatedRatings
+from loop.data_classes import UserObject
+from loop.enums import FriendRequestType
+from loop.test_setup import assert_no_full_scans, setup_rds, unbind_rds
+
+USER_2 = UserObject(
+    id=2,
+    cognito_user_name='86125274-40a1-70ec-da28-f779360f7c07',
+)
+USER_4 = UserObject(
+    id=4,
+    cognito_user_name='67ce7049-109f-420f-861b-3f1e7d6824b5',
+)
+
+
+class TestHotQueryPlans(unittest.TestCase):
+    """
+    Explains the statements of the hot data layer queries against the
+    seeded test schema, failing on any full table scan.
+    """
+
+    def setUp(self):
+        setup_rds()
+        # Load the lookup tables (seeded after the db is initialised)
+        friends.get_user_friends(USER_2)
+
+    def tearDown(self):
+        unbind_rds()
+
+    def test_user_queries(self):
+        with assert_no_full_scans(self):
+            data.get_user_from_cognito_username(USER_2.cognito_user_name)
+            data.get_user_from_email('admin_test_email')
+
+    def test_rating_queries(self):
+        with assert_no_full_scans(self):
+            data.get_user_ratings(USER_2)
+            data.get_ratings(users=[2, 3])
+            data.get_ratings(place_id='test_google_id_1')
+            data.get_ratings_paginated(
+                PaginatedRatings(page_count=1, users=[2, 3])
+            )
+            data.get_ratings_paginated(
+                PaginatedRatings(page_count=1, place_id='test_google_id_1')
+            )
+
+    def test_friend_queries(self):
+        with assert_no_full_scans(self):
+            friends.get_user_friends(USER_2)
+            friends.get_user_friend_ids(USER_2)
+            friends.get_pending_requests(USER_4, FriendRequestType.BOTH)
+            friends.get_friend_counts(USER_2)
+            friends.get_friend_places_in_bbox(
+                USER_2, BoundingBox(south=0, west=-1, north=2, east=0), 10
+            )
+            friends.get_friend_place_clusters(
+                USER_2, BoundingBox(south=0, west=-1, north=2, east=0), 10
+            )
+            friends.get_nearby_friend_places(
+                USER_2, NearbyPlaces(lat=1.5, lng=-0.7)
+            )
+
+    def test_location_stats_queries(self):
+        user = UserObject(id=1, cognito_user_name='test_cognito_user_name')
+        with assert_no_full_scans(self):
+            data.get_location_stats('test_google_id_1')
+            data.delete_rating(3, user)
+            data.delete_user_ratings(USER_2)
+
+    def test_delete_queries(self):
+        with assert_no_full_scans(self):
+            data.delete_user_ratings(USER_4)
+            data.delete_user_friendships(USER_4)
+
+    def test_full_scan_detected(self):
+        with self.assertRaises(AssertionError):
+            with assert_no_full_scans(self):
+                data.get_ratings()
+
+
+if __name__ == '__main__':
+    unittest.main()
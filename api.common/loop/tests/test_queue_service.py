@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock, call, patch
+from unittest.mock import ANY, Mock, call, patch
 
 import boto3
 from botocore.exceptions import ClientError
@@ -16,7 +16,7 @@ class TestSqsService(unittest.TestCase):
         self.assertEqual(
             mock_boto3.mock_calls,
             [
-                call('sqs'),
+                call('sqs', config=ANY),
                 call().get_queue_by_name(QueueName='test_queue_name'),
                 call().get_queue_by_name().send_message(MessageBody='hello'),
             ],
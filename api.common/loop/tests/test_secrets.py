@@ -1,12 +1,26 @@
+import json
+import time
 import unittest
 from unittest.mock import Mock, call, patch
 
 import boto3
 from botocore.exceptions import ClientError
-from loop.secrets import get_db_dict, get_secret
+from loop.secrets import (
+    SECRET_CACHE,
+    clear_secret_cache,
+    get_db_dict,
+    get_secret,
+    prefetch_secrets,
+)
 
 
 class TestSecrets(unittest.TestCase):
+    def setUp(self):
+        clear_secret_cache()
+
+    def tearDown(self):
+        clear_secret_cache()
+
     @patch('loop.secrets.get_secret')
     def test_get_db_secret(self, mock_get_secret):
         mock_get_secret.return_value = {
@@ -127,5 +141,123 @@ class TestSecrets(unittest.TestCase):
         self.assertRaises(ClientError, get_secret, secret_name)
 
 
+class TestSecretCache(unittest.TestCase):
+    def setUp(self):
+        clear_secret_cache()
+        self.mock_client = Mock()
+        self.mock_client.get_secret_value.return_value = {
+            'SecretString': json.dumps({'key': 'value'}),
+            'VersionId': 'version_1',
+        }
+        del self.mock_client.batch_get_secret_value
+        patcher = patch.object(boto3, 'session')
+        mock_boto = patcher.start()
+        mock_boto.Session.return_value.client.return_value = self.mock_client
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clear_secret_cache()
+
+    def test_get_secret_cached(self):
+        self.assertEqual(get_secret('test_secret'), {'key': 'value'})
+        self.assertEqual(get_secret('test_secret'), {'key': 'value'})
+        self.assertEqual(self.mock_client.get_secret_value.call_count, 1)
+
+    def test_get_secret_returns_copy(self):
+        get_secret('test_secret')['key'] = 'changed'
+        self.assertEqual(get_secret('test_secret'), {'key': 'value'})
+        self.assertEqual(SECRET_CACHE['test_secret'].value, {'key': 'value'})
+
+    def test_get_secret_refresh(self):
+        get_secret('test_secret')
+        self.mock_client.get_secret_value.return_value = {
+            'SecretString': json.dumps({'key': 'rotated'}),
+            'VersionId': 'version_2',
+        }
+        self.assertEqual(
+            get_secret('test_secret', refresh=True), {'key': 'rotated'}
+        )
+        self.assertEqual(SECRET_CACHE['test_secret'].version_id, 'version_2')
+
+    def test_get_secret_expired(self):
+        get_secret('test_secret')
+        SECRET_CACHE['test_secret'].expires_at = time.monotonic() - 1
+        get_secret('test_secret')
+        self.assertEqual(self.mock_client.get_secret_value.call_count, 2)
+
+    def test_get_secret_expired_serves_stale_on_error(self):
+        get_secret('test_secret')
+        SECRET_CACHE['test_secret'].expires_at = time.monotonic() - 1
+        self.mock_client.get_secret_value.side_effect = ClientError(
+            {'Error': {'Code': 'InternalServiceErrorException'}}, 'test'
+        )
+        self.assertEqual(get_secret('test_secret'), {'key': 'value'})
+        self.assertGreater(
+            SECRET_CACHE['test_secret'].expires_at, time.monotonic()
+        )
+
+    def test_get_secret_expired_serves_stale_on_throttling(self):
+        get_secret('test_secret')
+        SECRET_CACHE['test_secret'].expires_at = time.monotonic() - 1
+        self.mock_client.get_secret_value.side_effect = ClientError(
+            {'Error': {'Code': 'ThrottlingException'}}, 'test'
+        )
+        self.assertEqual(get_secret('test_secret'), {'key': 'value'})
+
+    def test_get_secret_throttling_without_cache(self):
+        self.mock_client.get_secret_value.side_effect = ClientError(
+            {'Error': {'Code': 'ThrottlingException'}}, 'test'
+        )
+        self.assertRaises(ClientError, get_secret, 'test_secret')
+
+    def test_prefetch_secrets(self):
+        prefetch_secrets(['secret_1', 'secret_2', 'secret_1'])
+        self.assertCountEqual(
+            self.mock_client.get_secret_value.mock_calls,
+            [call(SecretId='secret_1'), call(SecretId='secret_2')],
+        )
+        get_secret('secret_1')
+        get_secret('secret_2')
+        self.assertEqual(self.mock_client.get_secret_value.call_count, 2)
+
+    def test_prefetch_secrets_batch(self):
+        self.mock_client.batch_get_secret_value = Mock(
+            return_value={
+                'SecretValues': [
+                    {
+                        'Name': 'secret_1',
+                        'SecretString': json.dumps({'key': 'value_1'}),
+                        'VersionId': 'version_1',
+                    }
+                ],
+                'Errors': [
+                    {'SecretId': 'secret_2', 'Message': 'Access denied'}
+                ],
+            }
+        )
+        prefetch_secrets(['secret_1', 'secret_2'])
+        self.mock_client.batch_get_secret_value.assert_called_once_with(
+            SecretIdList=['secret_1', 'secret_2']
+        )
+        self.assertEqual(
+            self.mock_client.get_secret_value.mock_calls,
+            [call(SecretId='secret_2')],
+        )
+        self.assertEqual(get_secret('secret_1'), {'key': 'value_1'})
+
+    def test_prefetch_secrets_error_logged(self):
+        self.mock_client.get_secret_value.side_effect = ClientError(
+            {'Error': {'Code': 'ResourceNotFoundException'}}, 'test'
+        )
+        prefetch_secrets(['secret_1'])
+        self.assertNotIn('secret_1', SECRET_CACHE)
+
+    @patch('loop.secrets.SECRET_OVERRIDES', {'secret_1': {'key': 'local'}})
+    def test_prefetch_secrets_overrides(self):
+        prefetch_secrets(['secret_1'])
+        self.assertFalse(self.mock_client.get_secret_value.called)
+        self.assertEqual(get_secret('secret_1'), {'key': 'local'})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,221 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from loop import data
+from loop.data import get_user_from_cognito_username
+from loop.data_classes import SqlMetrics, UserObject
+from loop.db_session import retryable_db_session
+from loop.enums import DbType, FriendRequestType
+from loop.friends import get_pending_requests, get_user_friends
+from loop.sql_metrics import (
+    collect_sql_metrics,
+    emit_sql_metrics,
+    fingerprint_sql,
+    get_parameter_shapes,
+)
+from loop.test_setup import assert_query_budget, setup_rds, unbind_rds
+from pony.orm import TransactionError, db_session
+
+USER_2 = UserObject(
+    id=2,
+    cognito_user_name='86125274-40a1-70ec-da28-f779360f7c07',
+)
+USER_4 = UserObject(
+    id=4,
+    cognito_user_name='67ce7049-109f-420f-861b-3f1e7d6824b5',
+)
+
+
+class TestFingerprintSql(unittest.TestCase):
+    def test_fingerprint_sql(self):
+        self.assertEqual(
+            fingerprint_sql(
+                'SELECT "u"."id"\nFROM "user" "u"\n'
+                'WHERE "u"."id" IN (?, ?, ?)\n  AND "u"."email" = \'a\''
+            ),
+            'SELECT "u"."id" FROM "user" "u" WHERE "u"."id" IN (...) '
+            'AND "u"."email" = ?',
+        )
+
+    def test_fingerprint_sql_parameters(self):
+        self.assertEqual(
+            fingerprint_sql('SELECT * FROM `rating` WHERE `id` = %s LIMIT 5'),
+            fingerprint_sql('SELECT * FROM `rating` WHERE `id` = %s LIMIT 20'),
+        )
+
+    def test_fingerprint_sql_keeps_aliases(self):
+        self.assertEqual(
+            fingerprint_sql('SELECT "friend-1"."id" FROM "friend" "friend-1"'),
+            'SELECT "friend-1"."id" FROM "friend" "friend-1"',
+        )
+
+
+class TestSqlMetrics(unittest.TestCase):
+    def setUp(self):
+        setup_rds()
+
+    def tearDown(self):
+        unbind_rds()
+
+    def test_collect_sql_metrics(self):
+        with collect_sql_metrics() as metrics:
+            get_user_friends(USER_2)
+            get_user_friends(USER_2)
+        self.assertGreater(metrics.statements, 0)
+        self.assertGreater(metrics.db_time_ms, 0)
+        self.assertEqual(
+            sum(metrics.fingerprints.values()), metrics.statements
+        )
+        self.assertIn(2, metrics.fingerprints.values())
+
+    def test_collect_sql_metrics_not_collecting(self):
+        with collect_sql_metrics() as metrics:
+            pass
+        get_user_friends(USER_2)
+        self.assertEqual(metrics, SqlMetrics())
+
+    def test_query_budget(self):
+        # Load the lookup tables (seeded after the db is initialised)
+        get_user_friends(USER_2)
+        with assert_query_budget(self, 1):
+            get_user_friends(USER_2)
+        with assert_query_budget(self, 1):
+            get_pending_requests(USER_4, FriendRequestType.BOTH)
+        with assert_query_budget(self, 2):
+            get_user_from_cognito_username(USER_2.cognito_user_name)
+
+    def test_query_budget_exceeded(self):
+        get_user_friends(USER_2)
+        with self.assertRaises(AssertionError):
+            with assert_query_budget(self, 1):
+                get_user_friends(USER_2)
+                get_user_friends(USER_2)
+
+    @patch('loop.db_session.time.sleep')
+    def test_retries(self, mock_sleep):
+        attempts = []
+
+        @retryable_db_session((TransactionError,))
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise TransactionError('test')
+
+        with collect_sql_metrics() as metrics:
+            flaky()
+        self.assertEqual(metrics.retries, 2)
+        self.assertEqual(sum(metrics.retries_by_function.values()), 2)
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def setUp(self):
+        setup_rds()
+        # Load the lookup tables (seeded after the db is initialised)
+        get_user_friends(USER_2)
+
+    def tearDown(self):
+        unbind_rds()
+
+    def test_get_parameter_shapes(self):
+        self.assertEqual(get_parameter_shapes(None), '()')
+        self.assertEqual(get_parameter_shapes((1, 'a')), '(int, str)')
+        self.assertEqual(get_parameter_shapes({'p1': 1}), "{'p1': 'int'}")
+        self.assertEqual(
+            get_parameter_shapes([(1, 'a'), (2, 'b')]), '2 x (int, str)'
+        )
+
+    @patch('loop.sql_metrics.SLOW_QUERY_THRESHOLD_MS', 0)
+    def test_slow_query_logged(self):
+        with self.assertLogs(level='WARNING') as logs:
+            get_pending_requests(USER_4, FriendRequestType.BOTH)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(
+            'from loop.friends.get_pending_requests > ', logs.output[0]
+        )
+        self.assertNotIn(
+            'get_pending_requests > loop.friends.get_pending_requests',
+            logs.output[0],
+        )
+        self.assertIn('with parameters (int', logs.output[0])
+        self.assertNotIn('Slow query plan', logs.output[0])
+
+    @patch('loop.sql_metrics.SLOW_QUERY_THRESHOLD_MS', 0)
+    def test_slow_query_explained_in_debug(self):
+        with self.assertLogs(level='DEBUG') as logs:
+            get_pending_requests(USER_4, FriendRequestType.BOTH)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('Slow query plan', logs.output[1])
+
+    @patch('loop.sql_metrics.SLOW_QUERY_THRESHOLD_MS', -1)
+    def test_slow_query_log_disabled(self):
+        with patch('loop.sql_metrics.logger') as mock_logger:
+            get_pending_requests(USER_4, FriendRequestType.BOTH)
+        mock_logger.warning.assert_not_called()
+
+    @db_session
+    def test_explain(self):
+        db = data.DB_TYPE[DbType.WRITE]
+        query_plan = db.explain(
+            'SELECT "id" FROM "user" WHERE "email" = ?', ('admin_test_email',)
+        )
+        self.assertTrue(query_plan)
+        self.assertTrue(
+            db.explain('DELETE FROM "user" WHERE "id" = ?', (5,))
+        )
+        self.assertIsNone(
+            db.explain(
+                'INSERT INTO "group" ("description") VALUES (?)', ('a',)
+            )
+        )
+
+
+class TestEmitSqlMetrics(unittest.TestCase):
+    @patch('builtins.print')
+    def test_emit_sql_metrics(self, mock_print):
+        metrics = SqlMetrics(
+            statements=2,
+            db_time_ms=1.5,
+            retries=0,
+            fingerprints={'SELECT ?': 2},
+        )
+        emit_sql_metrics(metrics, route='/friends')
+        self.assertEqual(mock_print.call_count, 1)
+        log = json.loads(mock_print.call_args[0][0])
+        self.assertEqual(log['Route'], '/friends')
+        self.assertEqual(log['Statements'], 2)
+        self.assertEqual(log['DbTime'], 1.5)
+        self.assertEqual(log['Fingerprints'], {'SELECT ?': 2})
+        self.assertEqual(
+            log['_aws']['CloudWatchMetrics'][0]['Dimensions'], [['Route']]
+        )
+
+    @patch('builtins.print')
+    def test_emit_sql_metrics_function_retries(self, mock_print):
+        metrics = SqlMetrics(
+            retries=3,
+            retry_delay_ms=40.0,
+            retries_by_function={
+                'loop.friends.FriendWorker.accept_friend_request': 2,
+                'loop.data.update_rating': 1,
+            },
+        )
+        emit_sql_metrics(metrics, route='/ratings')
+        logs = [json.loads(args[0]) for args, _ in mock_print.call_args_list]
+        self.assertEqual(logs[0]['Retries'], 3)
+        self.assertEqual(logs[0]['RetryDelay'], 40.0)
+        self.assertEqual(
+            [(log['Function'], log['FunctionRetries']) for log in logs[1:]],
+            [
+                ('loop.friends.FriendWorker.accept_friend_request', 2),
+                ('loop.data.update_rating', 1),
+            ],
+        )
+        self.assertEqual(
+            logs[1]['_aws']['CloudWatchMetrics'][0]['Dimensions'],
+            [['Route', 'Function']],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
+import threading
 import unittest
+from contextvars import ContextVar
 from unittest.mock import Mock, call, patch
 
+from loop.exceptions import GatewayTimeoutError
 from loop.utils import *
 
+REQUEST_ID = ContextVar('REQUEST_ID', default=None)
+
 
 class TestUtils(unittest.TestCase):
     def test_get_admin_user(self):
@@ -16,6 +21,43 @@ class TestUtils(unittest.TestCase):
             ),
         )
 
+    def test_get_search_name(self):
+        self.assertEqual(
+            get_search_name('Mary-Jane', " O'Neil_Smith "),
+            'mary jane o neil smith',
+        )
+
+    def test_get_search_name_missing_name(self):
+        self.assertEqual(get_search_name('Prince', None), 'prince')
+
+    def test_get_thread_pool(self):
+        thread_pool = get_thread_pool()
+        self.assertIsInstance(thread_pool, ThreadPoolExecutor)
+        self.assertIs(get_thread_pool(), thread_pool)
+        self.assertEqual(thread_pool.submit(sum, [1, 2]).result(), 3)
+
+    def test_submit_copies_context(self):
+        token = REQUEST_ID.set('request_1')
+        try:
+            future = submit(REQUEST_ID.get)
+        finally:
+            REQUEST_ID.reset(token)
+        self.assertEqual(get_result(future, 1, 'request id'), 'request_1')
+
+    def test_get_result_timeout(self):
+        release = threading.Event()
+        future = submit(release.wait)
+        try:
+            with self.assertRaises(GatewayTimeoutError) as e:
+                get_result(future, 0.01, 'slow dependency')
+            self.assertIn('slow dependency', str(e.exception))
+        finally:
+            release.set()
+
+    def test_get_result_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            get_result(submit(lambda: 1 / 0), 1, 'division')
+
     def test_conditional_load_with_string(self):
         body = '{"body": "hello"}'
         response = conditional_load(body)
@@ -1,20 +1,70 @@
 import json
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextvars import copy_context
 from copy import deepcopy
-from typing import Dict, Generator, List
+from threading import Lock
+from typing import Any, Callable, Dict, Generator, List
 
 from loop.api_classes import Coordinates
 from loop.constants import (
     LOOP_ADMIN_COGNITO_USERNAME,
     LOOP_ADMIN_GROUP,
     LOOP_ADMIN_ID,
+    THREAD_POOL_MAX_WORKERS,
 )
 from loop.data_classes import UserObject
+from loop.deadline import get_timeout
+from loop.exceptions import GatewayTimeoutError
 
 """
 This module provides some generic functions for use across the loop back-end
 repository.
 """
 
+THREAD_POOL = None
+THREAD_POOL_LOCK = Lock()
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """
+    Returns the container scoped thread pool used to run independent I/O
+    (e.g. AWS or Google calls) concurrently within a request.
+    """
+    global THREAD_POOL
+    with THREAD_POOL_LOCK:
+        if THREAD_POOL is None:
+            THREAD_POOL = ThreadPoolExecutor(
+                max_workers=THREAD_POOL_MAX_WORKERS
+            )
+        return THREAD_POOL
+
+
+def submit(func: Callable, *args, **kwargs) -> Future:
+    """
+    Runs func on the thread pool in a copy of the caller's context, so
+    request scoped context variables (e.g. SQL metrics) carry over.
+    """
+    return get_thread_pool().submit(copy_context().run, func, *args, **kwargs)
+
+
+def get_result(future: Future, timeout_seconds: float, dependency: str) -> Any:
+    """
+    Waits up to timeout_seconds (or until the request deadline, if sooner)
+    for the future's result, raising a GatewayTimeoutError naming the
+    dependency if it is not done by then.
+    """
+    timeout_seconds = get_timeout(timeout_seconds)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except FutureTimeoutError as e:
+        future.cancel()
+        raise GatewayTimeoutError(
+            f'Timed out after {timeout_seconds:.2f}s waiting for '
+            f'{dependency}.'
+        )
+
 
 def get_admin_user():
     return UserObject(
@@ -24,6 +74,16 @@ def get_admin_user():
     )
 
 
+def get_search_name(*names: str) -> str:
+    """
+    Normalises names for searching: lower case, punctuation replaced with
+    spaces and whitespace collapsed (e.g. "Mary-Jane O'Neil" ->
+    "mary jane o neil").
+    """
+    name = ' '.join([name for name in names if name]).lower()
+    return ' '.join(re.sub(r'[\W_]+', ' ', name).split())
+
+
 def conditional_load(body):
     if isinstance(body, str):
         body = json.loads(body)
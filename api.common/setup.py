@@ -20,5 +20,6 @@ setup(
         'cachetools',
         'requests',
         'boto3',
+        'numpy',
     ],
 )
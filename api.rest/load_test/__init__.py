@@ -0,0 +1,2 @@
+from .fakes import FakeServices, Latency
+from .harness import run_load_test
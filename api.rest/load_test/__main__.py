@@ -0,0 +1,115 @@
+import argparse
+import json
+
+from load_test.fakes import FakeServices, Latency
+from load_test.harness import ROUTE_MIX, run_load_test
+from loop.test_setup.dataset import DatasetConfig, parse_db_url
+
+"""
+Load tests the loop-api with fake AWS and Google services, e.g. (from
+api.rest)
+
+python -m load_test --concurrency 1 8 32 --requests 2000 \
+    --google-latency lognormal:120:0.6 --s3-latency lognormal:30:0.4
+
+Latencies are "none", "fixed:<ms>", "uniform:<min ms>:<max ms>" or
+"lognormal:<median ms>:<sigma>".
+
+The default in memory SQLite database locks whole tables, so concurrent
+writes (POST /ratings) can fail with "database table is locked"; use --db
+with a MySQL url to see realistic write contention.
+"""
+
+
+def parse_args():
+    defaults = DatasetConfig(tag='load_test')
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        nargs='+',
+        default=[1, 8],
+        help="Numbers of concurrent workers to run the requests with",
+    )
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--route',
+        action='append',
+        choices=list(ROUTE_MIX),
+        help="Only send requests to this route (can be repeated)",
+    )
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--locations', type=int, default=defaults.locations)
+    parser.add_argument('--ratings', type=int, default=defaults.ratings)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--tag', default=defaults.tag)
+    for service in ('google', 's3', 'sqs', 'cognito', 'secrets'):
+        parser.add_argument(
+            f'--{service}-latency',
+            type=Latency.parse,
+            default=Latency(),
+            help=f"Latency of {service} calls",
+        )
+    parser.add_argument(
+        '--auth-disabled',
+        action='store_true',
+        help="Send every request as the admin user (LOOP_AUTH_DISABLED)",
+    )
+    parser.add_argument(
+        '--db',
+        help="Database url (see scripts/generate_dataset.py), in memory "
+        "SQLite if not given",
+    )
+    parser.add_argument('--output', help="File to write the reports to")
+    return parser.parse_args()
+
+
+def print_report(report: dict) -> None:
+    print(
+        f'\nconcurrency {report["concurrency"]}: {report["requests"]} '
+        f'requests in {report["elapsed_seconds"]}s'
+    )
+    print(
+        f'{"requests":>9}{"errors":>8}{"req/s":>9}{"p50 ms":>9}'
+        f'{"p95 ms":>9}{"p99 ms":>9}  route'
+    )
+    for route, result in report['results'].items():
+        print(
+            f'{result["requests"]:>9}{result["errors"]:>8}'
+            f'{result["throughput_rps"]:>9.1f}{result["p50_ms"]:>9.1f}'
+            f'{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}  {route}'
+        )
+
+
+def main():
+    args = parse_args()
+    reports = run_load_test(
+        DatasetConfig(
+            users=args.users,
+            locations=args.locations,
+            ratings=args.ratings,
+            seed=args.seed,
+            tag=args.tag,
+        ),
+        args.requests,
+        args.concurrency,
+        services=FakeServices(
+            google_latency=args.google_latency,
+            s3_latency=args.s3_latency,
+            sqs_latency=args.sqs_latency,
+            cognito_latency=args.cognito_latency,
+            secrets_latency=args.secrets_latency,
+        ),
+        db_dict=parse_db_url(args.db) if args.db else None,
+        routes=args.route,
+        auth_disabled=args.auth_disabled,
+    )
+    for report in reports:
+        print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(reports, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+from loop import auth, principals, secrets
+from loop.constants import (
+    COGNITO_SECRET_NAME,
+    DELETE_USER_QUEUE,
+    RESTAURANT_THUMBNAILS_BUCKET,
+    RESTAURANT_THUMBNAILS_QUEUE,
+)
+from loop.google_client import GOOGLE_API_KEY_SECRET
+
+"""
+In-process fakes of the services the loop-api calls (Google Places, S3, SQS,
+Cognito and Secrets Manager), each with an injectable latency distribution,
+so the app can be load tested without AWS or Google.
+
+FakeServices.install() patches boto3 sessions and googlemaps.Client, and
+clears the container caches that would otherwise hold real clients.
+"""
+
+LATENCY_KINDS = ('none', 'fixed', 'uniform', 'lognormal')
+
+
+class Latency:
+    """
+    A latency distribution, parsed from "<kind>[:<args>]" with times in
+    milliseconds:
+
+    none, fixed:<ms>, uniform:<min ms>:<max ms>,
+    lognormal:<median ms>:<sigma> (a long tail, like most network calls)
+    """
+
+    def __init__(self, kind: str = 'none', *args: float, seed: int = 0):
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f'Latency kind must be one of {LATENCY_KINDS}')
+        expected_args = {'none': 0, 'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if len(args) != expected_args[kind]:
+            raise ValueError(
+                f'{kind} latency takes {expected_args[kind]} arguments'
+            )
+        self.kind = kind
+        self.args = args
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+
+    @classmethod
+    def parse(cls, latency: str, seed: int = 0) -> 'Latency':
+        kind, *args = latency.split(':')
+        return cls(kind, *[float(arg) for arg in args], seed=seed)
+
+    def sample_ms(self) -> float:
+        with self._lock:
+            if self.kind == 'fixed':
+                return self.args[0]
+            if self.kind == 'uniform':
+                return self._rng.uniform(*self.args)
+            if self.kind == 'lognormal':
+                median_ms, sigma = self.args
+                return median_ms * self._rng.lognormvariate(0, sigma)
+        return 0.0
+
+    def wait(self) -> None:
+        latency_ms = self.sample_ms()
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000)
+
+    def __repr__(self) -> str:
+        return ':'.join([self.kind] + [f'{arg:g}' for arg in self.args])
+
+
+def _client_error(code: str, operation: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeSecretsManagerClient:
+    def __init__(self, secrets: Dict[str, Dict], latency: Latency):
+        self.secrets = secrets
+        self.latency = latency
+        self.calls = 0
+
+    def get_secret_value(self, SecretId: str) -> Dict:
+        self.latency.wait()
+        self.calls += 1
+        if SecretId not in self.secrets:
+            raise _client_error(
+                'ResourceNotFoundException', 'GetSecretValue'
+            )
+        return {
+            'Name': SecretId,
+            'SecretString': json.dumps(self.secrets[SecretId]),
+            'VersionId': 'load-test',
+        }
+
+
+class FakeS3Client:
+    def __init__(self, buckets: List[str], latency: Latency):
+        self.objects: Dict[str, Dict[str, Dict]] = {
+            bucket: {} for bucket in buckets
+        }
+        self.latency = latency
+        self._lock = Lock()
+
+    def list_buckets(self) -> Dict:
+        self.latency.wait()
+        return {'Buckets': [{'Name': bucket} for bucket in self.objects]}
+
+    def list_objects(self, Bucket: str) -> Dict:
+        self.latency.wait()
+        with self._lock:
+            keys = list(self.objects.get(Bucket, {}))
+        return {'Contents': [{'Key': key} for key in keys]}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None) -> None:
+        self.latency.wait()
+        with self._lock:
+            self.objects[Bucket][Key] = {'Filename': Filename}
+
+
+class FakeQueue:
+    def __init__(self, latency: Latency):
+        self.messages: List[str] = []
+        self.latency = latency
+
+    def send_message(self, MessageBody: str) -> Dict:
+        self.latency.wait()
+        self.messages.append(MessageBody)
+        return {'MessageId': str(len(self.messages))}
+
+
+class FakeSqsResource:
+    def __init__(self, queue_names: List[str], latency: Latency):
+        self.queues = {name: FakeQueue(latency) for name in queue_names}
+        self.latency = latency
+
+    def get_queue_by_name(self, QueueName: str) -> FakeQueue:
+        self.latency.wait()
+        if QueueName not in self.queues:
+            raise _client_error('QueueDoesNotExist', 'GetQueueUrl')
+        return self.queues[QueueName]
+
+
+class FakeCognitoClient:
+    class exceptions:
+        class UserNotFoundException(Exception):
+            pass
+
+    def __init__(self, latency: Latency, admin_users: List[str] = None):
+        self.latency = latency
+        self.admin_users = set(admin_users or [])
+        self.deleted_users: List[str] = []
+
+    def admin_list_groups_for_user(self, UserPoolId, Username) -> Dict:
+        self.latency.wait()
+        groups = (
+            [{'GroupName': 'loop_admin'}]
+            if Username in self.admin_users
+            else []
+        )
+        return {'Groups': groups}
+
+    def admin_delete_user(self, UserPoolId, Username) -> Dict:
+        self.latency.wait()
+        self.deleted_users.append(Username)
+        return {}
+
+
+class FakeGoogleMapsClient:
+    """
+    Returns deterministic places for any place id, and search results for
+    any search term.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    @staticmethod
+    def _get_place(google_id: str) -> Dict:
+        digest = int(hashlib.sha256(google_id.encode()).hexdigest(), 16)
+        return {
+            'place_id': google_id,
+            'name': f'Place {digest % 10000}',
+            'formatted_address': f'{digest % 200} Fake Street, London',
+            'geometry': {
+                'location': {
+                    'lat': 51.4 + (digest % 2000) / 10000,
+                    'lng': -0.2 + (digest // 2000 % 2000) / 10000,
+                }
+            },
+            'photos': [{'photo_reference': f'photo_{google_id}'}],
+            'formatted_phone_number': '020 7946 0000',
+            'website': 'https://example.com',
+            'price_level': digest % 4 + 1,
+        }
+
+    def place(self, place_id: str, *args, **kwargs) -> Dict:
+        self.latency.wait()
+        return {'status': 'OK', 'result': self._get_place(place_id)}
+
+    def find_place(self, input: str, input_type: str, **kwargs) -> Dict:
+        self.latency.wait()
+        candidates = [
+            {
+                key: value
+                for key, value in self._get_place(f'{input}_{i}').items()
+                if key in ('place_id', 'name', 'formatted_address')
+            }
+            for i in range(3)
+        ]
+        return {'status': 'OK', 'candidates': candidates}
+
+    def places_photo(self, photo_reference: str, **kwargs) -> Iterator:
+        self.latency.wait()
+        yield b'\xff\xd8\xff\xe0' + photo_reference.encode()
+
+
+class FakeServices:
+    """The fakes, with a latency distribution per service."""
+
+    def __init__(
+        self,
+        google_latency: Optional[Latency] = None,
+        s3_latency: Optional[Latency] = None,
+        sqs_latency: Optional[Latency] = None,
+        cognito_latency: Optional[Latency] = None,
+        secrets_latency: Optional[Latency] = None,
+    ):
+        self.google = FakeGoogleMapsClient(google_latency or Latency())
+        self.s3 = FakeS3Client(
+            [RESTAURANT_THUMBNAILS_BUCKET], s3_latency or Latency()
+        )
+        self.sqs = FakeSqsResource(
+            [RESTAURANT_THUMBNAILS_QUEUE, DELETE_USER_QUEUE],
+            sqs_latency or Latency(),
+        )
+        self.cognito = FakeCognitoClient(cognito_latency or Latency())
+        self.secrets = FakeSecretsManagerClient(
+            {
+                COGNITO_SECRET_NAME: {
+                    'arn': 'arn:aws:cognito-idp:eu-west-2:0:userpool/load',
+                    'user_pool_id': 'load-test-pool',
+                    'client_id': 'load-test-client',
+                },
+                GOOGLE_API_KEY_SECRET: {'key': 'load-test-key'},
+            },
+            secrets_latency or Latency(),
+        )
+
+    def _client(self, service_name: str, *args, **kwargs):
+        clients = {
+            's3': self.s3,
+            'cognito-idp': self.cognito,
+            'secretsmanager': self.secrets,
+        }
+        if service_name not in clients:
+            raise ValueError(f'No fake for boto3 client {service_name}')
+        return clients[service_name]
+
+    def _resource(self, service_name: str, *args, **kwargs):
+        if service_name != 'sqs':
+            raise ValueError(f'No fake for boto3 resource {service_name}')
+        return self.sqs
+
+    @staticmethod
+    def _clear_caches() -> None:
+        secrets.clear_secret_cache()
+        auth.clear_cognito_cache()
+        principals.clear_principal_cache()
+
+    @contextmanager
+    def install(self):
+        services = self
+
+        def _session_client(session, service_name, *args, **kwargs):
+            return services._client(service_name)
+
+        def _session_resource(session, service_name, *args, **kwargs):
+            return services._resource(service_name)
+
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch('boto3.session.Session.client', _session_client)
+            )
+            stack.enter_context(
+                patch('boto3.session.Session.resource', _session_resource)
+            )
+            stack.enter_context(
+                patch(
+                    'googlemaps.Client', lambda key, **kwargs: self.google
+                )
+            )
+            # Use the fake Secrets Manager rather than any local overrides.
+            stack.enter_context(patch('loop.secrets.SECRET_OVERRIDES', {}))
+            self._clear_caches()
+            stack.callback(self._clear_caches)
+            yield self
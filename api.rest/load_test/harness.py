@@ -0,0 +1,400 @@
+import importlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import jwt
+from chalice import Chalice
+from chalice.test import Client
+from load_test.fakes import FakeServices
+from loop import data
+from loop.enums import DbType
+from loop.test_setup.dataset import (
+    DatasetConfig,
+    delete_dataset,
+    generate_dataset,
+)
+from pony.orm import Database, db_session, select
+
+"""
+Drives the loop-api routes through chalice.test.Client from a pool of worker
+threads, against a synthetic dataset (see loop.test_setup.dataset) and the
+in-process fakes of Google, S3, SQS, Cognito and Secrets Manager, and
+reports per route throughput and p50/p95/p99 latency. Run with
+python -m load_test (from api.rest).
+
+Each worker behaves like a concurrent lambda container sharing the database
+and the (faked) services, except that the module level caches are shared
+too. Chalice keeps the current request on the app, so the app's
+current_request is made thread local for the run.
+"""
+
+APP_MODULE = 'loop-api.app'
+# Shared, so that every worker thread sees the same in memory database.
+SQLITE_MEMORY_DB = {'provider': 'sqlite', 'filename': ':sharedmemory:'}
+TOKEN_TTL_SECONDS = 3600
+# Places not in the dataset, so that viewing and rating them creates
+# locations.
+NEW_PLACES = 200
+MAX_PLAN_USERS = 1000
+USER_SEARCH_TERMS = ['john', 'mary', 'patel', 'ol', 'wilson']
+PLACE_SEARCH_TERMS = ['pizza', 'dumplings', 'tapas', 'curry', 'sushi']
+SEARCH_COORDINATES = 'lat=51.5072&lng=-0.1276'
+
+
+@dataclass
+class RouteLoadResult:
+    route: str
+    requests: int
+    errors: int
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    status_codes: Dict[int, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return deepcopy(asdict(self))
+
+
+class LoadTestContext:
+    """The users (with tokens) and places requests are made with."""
+
+    def __init__(self, tag: str, tokens: List[str], place_ids: List[str]):
+        self.tokens = tokens
+        self.place_ids = place_ids
+        # Tagged, so they are deleted with the dataset.
+        self.new_place_ids = [
+            f'{tag}:new-place-{i}' for i in range(NEW_PLACES)
+        ]
+
+
+# (method, path, body) for a request to the route.
+RouteRequest = Tuple[str, str, Optional[Dict]]
+
+
+def _get_rating_body(context: LoadTestContext, rng: random.Random) -> Dict:
+    return {
+        'google_id': rng.choice(context.place_ids + context.new_place_ids),
+        'price': rng.randint(1, 5),
+        'vibe': rng.randint(1, 5),
+        'food': rng.randint(1, 5),
+    }
+
+
+# Routes by name, with their weight in the request mix and a function
+# building a request to them.
+ROUTE_MIX: Dict[
+    str, Tuple[int, Callable[[LoadTestContext, random.Random], RouteRequest]]
+] = {
+    'GET /ratings': (10, lambda context, rng: ('GET', '/ratings', None)),
+    'GET /friends_ratings': (
+        20,
+        lambda context, rng: ('GET', '/friends_ratings', None),
+    ),
+    'GET /friends': (10, lambda context, rng: ('GET', '/friends', None)),
+    'GET /friends/counts': (
+        5,
+        lambda context, rng: ('GET', '/friends/counts', None),
+    ),
+    'GET /pending_friends/inbound': (
+        5,
+        lambda context, rng: ('GET', '/pending_friends/inbound', None),
+    ),
+    'GET /search_users': (
+        10,
+        lambda context, rng: (
+            'GET',
+            f'/search_users?term={rng.choice(USER_SEARCH_TERMS)}'
+            '&page_count=1',
+            None,
+        ),
+    ),
+    'GET /restaurant_search/{search_term}': (
+        10,
+        lambda context, rng: (
+            'GET',
+            f'/restaurant_search/{rng.choice(PLACE_SEARCH_TERMS)}'
+            f'?{SEARCH_COORDINATES}',
+            None,
+        ),
+    ),
+    'GET /restaurant/{place_id}': (
+        20,
+        lambda context, rng: (
+            'GET',
+            f'/restaurant/'
+            f'{rng.choice(context.place_ids + context.new_place_ids)}',
+            None,
+        ),
+    ),
+    'POST /ratings': (
+        10,
+        lambda context, rng: (
+            'POST',
+            '/ratings',
+            _get_rating_body(context, rng),
+        ),
+    ),
+}
+
+
+def get_auth_token(cognito_user_name: str) -> str:
+    """
+    An unsigned (not Cognito issued) token for the user. These are accepted
+    because no JWKS is configured in the load test.
+    """
+    return jwt.encode(
+        {
+            'sub': cognito_user_name,
+            'cognito:username': cognito_user_name,
+            'exp': int(time.time()) + TOKEN_TTL_SECONDS,
+        },
+        'load-test',
+        algorithm='HS256',
+    )
+
+
+def load_app(auth_disabled: bool = False):
+    """
+    Imports the loop-api app (reloading it if it was imported with the
+    other auth setting). The fakes must be installed first, as the app reads
+    the Cognito secret at import.
+    """
+    os.environ['LOOP_AUTH_DISABLED'] = '1' if auth_disabled else '0'
+    app_module = importlib.import_module(APP_MODULE)
+    if app_module.LOOP_AUTH_DISABLED != auth_disabled:
+        app_module = importlib.reload(app_module)
+    return app_module
+
+
+class _ThreadLocalRequests(threading.local):
+    current_request = None
+    lambda_context = None
+
+
+@contextmanager
+def thread_local_requests(app: Chalice):
+    """
+    Chalice sets the request being handled on the app, so concurrent
+    requests would see each other's. Gives each thread its own for the
+    duration.
+    """
+    requests = _ThreadLocalRequests()
+
+    def _property(name: str) -> property:
+        return property(
+            lambda self: getattr(requests, name),
+            lambda self, value: setattr(requests, name, value),
+        )
+
+    app_class = app.__class__
+    state = {
+        name: app.__dict__.pop(name, None)
+        for name in ('current_request', 'lambda_context')
+    }
+    app.__class__ = type(
+        app_class.__name__,
+        (app_class,),
+        {name: _property(name) for name in state},
+    )
+    try:
+        yield app
+    finally:
+        app.__class__ = app_class
+        app.__dict__.update(state)
+
+
+def prepare_database(
+    config: DatasetConfig,
+    db_dict: Optional[Dict[str, Union[str, int, bool]]] = None,
+) -> Database:
+    db = data.init_db(
+        db_dict or SQLITE_MEMORY_DB, check_tables=True, create_tables=True
+    )
+    data.DB_TYPE[DbType.WRITE] = db
+    generate_dataset(db, config)
+    return db
+
+
+@db_session
+def get_context(db: Database, tag: str, seed: int = 0) -> LoadTestContext:
+    prefix = f'{tag}:'
+    cognito_user_names = select(
+        user.cognito_user_name
+        for user in db.User
+        if user.cognito_user_name.startswith(prefix)
+    ).order_by(1)[:]
+    rng = random.Random(seed)
+    plan_users = rng.sample(
+        list(cognito_user_names),
+        min(len(cognito_user_names), MAX_PLAN_USERS),
+    )
+    place_ids = select(
+        location.google_id
+        for location in db.Location
+        if location.google_id.startswith(prefix)
+    ).order_by(1)[:]
+    return LoadTestContext(
+        tag=tag,
+        tokens=[get_auth_token(user_name) for user_name in plan_users],
+        place_ids=place_ids,
+    )
+
+
+def get_plan(
+    context: LoadTestContext,
+    requests: int,
+    seed: int = 0,
+    routes: Optional[Sequence[str]] = None,
+) -> List[Tuple[str, RouteRequest, str]]:
+    """
+    The (route, request, token) to send, drawn from the route mix. The same
+    seed gives the same plan.
+    """
+    route_mix = {
+        route: weighted_request
+        for route, weighted_request in ROUTE_MIX.items()
+        if not routes or route in routes
+    }
+    if not route_mix:
+        raise ValueError(f'Routes must be from {list(ROUTE_MIX)}')
+    rng = random.Random(seed)
+    names = rng.choices(
+        list(route_mix),
+        weights=[weight for weight, _ in route_mix.values()],
+        k=requests,
+    )
+    return [
+        (name, route_mix[name][1](context, rng), rng.choice(context.tokens))
+        for name in names
+    ]
+
+
+def _percentile(timings: List[float], percentile: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+
+def summarise(
+    route: str, timings: List[Tuple[float, int]], elapsed: float
+) -> RouteLoadResult:
+    latencies = [latency_ms for latency_ms, _ in timings]
+    status_codes: Dict[int, int] = {}
+    for _, status_code in timings:
+        status_codes[status_code] = status_codes.get(status_code, 0) + 1
+    return RouteLoadResult(
+        route=route,
+        requests=len(timings),
+        errors=sum(
+            count
+            for status_code, count in status_codes.items()
+            if status_code >= 500
+        ),
+        throughput_rps=round(len(timings) / elapsed, 2) if elapsed else 0,
+        p50_ms=round(_percentile(latencies, 0.5), 2),
+        p95_ms=round(_percentile(latencies, 0.95), 2),
+        p99_ms=round(_percentile(latencies, 0.99), 2),
+        max_ms=round(max(latencies), 2),
+        status_codes=status_codes,
+    )
+
+
+def run_load(
+    app: Chalice,
+    plan: List[Tuple[str, RouteRequest, str]],
+    concurrency: int,
+) -> Dict:
+    """
+    Sends the planned requests from concurrency worker threads and returns
+    the report, with results by route and for all routes.
+    """
+    timings: Dict[str, List[Tuple[float, int]]] = {}
+    timings_lock = threading.Lock()
+
+    def _send(planned: Tuple[str, RouteRequest, str]) -> None:
+        route, (method, path, body), token = planned
+        headers = {'Authorization': token}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        response = client.http.request(
+            method,
+            path,
+            headers=headers,
+            body=json.dumps(body).encode() if body is not None else b'',
+        )
+        latency_ms = (time.perf_counter() - start) * 1000
+        with timings_lock:
+            timings.setdefault(route, []).append(
+                (latency_ms, response.status_code)
+            )
+
+    # The client swaps os.environ per request, which is not thread safe, so
+    # restore it afterwards.
+    environ = os.environ
+    try:
+        with thread_local_requests(app), Client(app) as client:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(_send, plan))
+            elapsed = time.perf_counter() - start
+    finally:
+        os.environ = environ
+    results = {
+        route: summarise(route, route_timings, elapsed).to_dict()
+        for route, route_timings in sorted(timings.items())
+    }
+    results['all'] = summarise(
+        'all',
+        [
+            timing
+            for route_timings in timings.values()
+            for timing in route_timings
+        ],
+        elapsed,
+    ).to_dict()
+    return {
+        'concurrency': concurrency,
+        'requests': len(plan),
+        'elapsed_seconds': round(elapsed, 3),
+        'results': results,
+    }
+
+
+def run_load_test(
+    config: DatasetConfig,
+    requests: int,
+    concurrencies: Sequence[int],
+    services: Optional[FakeServices] = None,
+    db_dict: Optional[Dict[str, Union[str, int, bool]]] = None,
+    routes: Optional[Sequence[str]] = None,
+    auth_disabled: bool = False,
+) -> List[Dict]:
+    """
+    Generates the dataset, then runs the same request plan at each
+    concurrency, returning a report per concurrency. The dataset (and any
+    locations and ratings created by the requests) is deleted afterwards.
+    """
+    services = services or FakeServices()
+    db = prepare_database(config, db_dict)
+    try:
+        with services.install():
+            app_module = load_app(auth_disabled)
+            context = get_context(db, config.tag, config.seed)
+            plan = get_plan(context, requests, config.seed, routes)
+            return [
+                run_load(app_module.app, plan, concurrency)
+                for concurrency in concurrencies
+            ]
+    finally:
+        delete_dataset(db, config.tag)
+        db.disconnect()
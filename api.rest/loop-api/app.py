@@ -1,53 +1,87 @@
 import logging
 import os
+from concurrent.futures import Future
 from functools import wraps
-from typing import Union
+from threading import Thread
+from typing import Optional, Union
+from urllib.parse import unquote
 
-import jwt
-import requests
 from chalice import Chalice, CognitoUserPoolAuthorizer, Response
 from loop import admin_utils, data
 from loop.api_classes import (
     Coordinates,
     CreateRating,
     FriendValidator,
+    ImportRatings,
+    MapView,
+    NearbyPlaces,
+    PaginatedFriends,
     PaginatedRatings,
+    RestaurantIds,
     SearchUsers,
     UpdateRating,
     UserCredentials,
 )
 from loop.auth import CognitoAuth
-from loop.constants import COGNITO_SECRET_NAME, LOOP_ADMIN_GROUP
+from loop.constants import (
+    COGNITO_SECRET_NAME,
+    GOOGLE_PLACE_TIMEOUT_SECONDS,
+    LOOP_ADMIN_GROUP,
+    PLACE_RATINGS_TIMEOUT_SECONDS,
+    SQL_METRICS_ENABLED,
+    THUMBNAIL_CHECK_MIN_BUDGET_SECONDS,
+    THUMBNAIL_CHECK_TIMEOUT_SECONDS,
+)
 from loop.data_classes import (
     Location,
+    LocationStats,
+    NearbyPlacesPageResults,
     PaginatedUserSearch,
-    Rating,
+    RatingsImportResults,
     RatingsPageResults,
     UploadThumbnailEvent,
     UserObject,
 )
-from loop.enums import FriendRequestType
+from loop.deadline import has_budget, request_deadline
+from loop.enums import DbType, FriendRequestType, MapMode
 from loop.exceptions import (
     BadRequestError,
+    GatewayTimeoutError,
     LoopException,
     NoCurrentUserError,
     UnauthorizedError,
 )
 from loop.friends import (
     FriendWorker,
+    clear_place_clusters,
+    get_friend_counts,
+    get_friend_place_clusters,
+    get_friend_places_in_bbox,
+    get_nearby_friend_places,
     get_pending_requests,
+    get_pending_requests_paginated,
     get_ratings_for_place_and_friends,
     get_user_friend_ids,
     get_user_friends,
+    get_user_friends_paginated,
     search_for_users,
 )
-from loop.google_client import find_location, search_place
-from loop.secrets import get_secret
+from loop.google_client import (
+    GOOGLE_API_KEY_SECRET,
+    find_location,
+    find_locations,
+    search_place,
+)
+from loop.principals import get_user_from_auth_token
+from loop.secrets import get_secret, prefetch_secrets
+from loop.sql_metrics import collect_sql_metrics, emit_sql_metrics
 from loop.thumbnails import check_thumbnail_exists, upload_thumbnail
-from loop.utils import get_admin_user
+from loop.utils import get_admin_user, get_result, submit
 from pydantic import ValidationError as PydanticValidationError
 
 LOOP_AUTH_DISABLED = os.environ.get("LOOP_AUTH_DISABLED", "0").lower() == "1"
+# Set by the lambda runtime (not when packaging/deploying or running locally).
+IN_LAMBDA = "AWS_LAMBDA_FUNCTION_NAME" in os.environ
 
 APP_NAME = 'loop-api'
 
@@ -62,7 +96,8 @@ def setup_app():
             "CI environment; skipping database and Datadog link setup."
         )
     else:
-        data.init_write_db()
+        # The database is connected on first use rather than at import.
+        data.DB_TYPE.set_initialiser(DbType.WRITE, data.init_write_db)
         app = Chalice(app_name=APP_NAME)
         app.log.setLevel(logging.INFO)
 
@@ -70,8 +105,54 @@ def setup_app():
 setup_app()
 
 
+@app.middleware('http')
+def deadline_middleware(event, get_response):
+    """
+    Sets the request deadline from the lambda's remaining time, which
+    outbound calls derive their timeouts and retries from.
+    """
+    lambda_context = app.lambda_context
+    remaining_ms = (
+        lambda_context.get_remaining_time_in_millis()
+        if lambda_context
+        else None
+    )
+    with request_deadline(remaining_ms):
+        return get_response(event)
+
+
+@app.middleware('http')
+def sql_metrics_middleware(event, get_response):
+    """
+    Emits each request's SQL statement count, db time, retries and statement
+    fingerprints (opt-in with LOOP_SQL_METRICS=1).
+    """
+    if not SQL_METRICS_ENABLED:
+        return get_response(event)
+    with collect_sql_metrics() as metrics:
+        response = get_response(event)
+    emit_sql_metrics(metrics, route=event.path)
+    return response
+
+
+if not LOOP_AUTH_DISABLED:
+    # Load the secrets used on request paths in the background, so the fetch
+    # overlaps the rest of the cold start instead of blocking it.
+    Thread(
+        target=prefetch_secrets,
+        args=([COGNITO_SECRET_NAME, GOOGLE_API_KEY_SECRET],),
+        daemon=True,
+    ).start()
+
+
 def get_required_cognito_authorizer() -> CognitoUserPoolAuthorizer:
     if not LOOP_AUTH_DISABLED:
+        if IN_LAMBDA:
+            # API Gateway runs the authorizer before invoking the lambda, the
+            # user pool arn is only needed when packaging the app.
+            return CognitoUserPoolAuthorizer(
+                'cognito_authorizer', provider_arns=[]
+            )
         cognito_secret = get_secret(COGNITO_SECRET_NAME)
         if 'arn' not in cognito_secret:
             raise ValueError('cognito secret missing arn.')
@@ -92,20 +173,7 @@ def _get_user_from_authorization() -> UserObject:
     auth_token = app.current_request.headers.get('Authorization')
     if not auth_token:
         raise UnauthorizedError("Authorization header is expected")
-    try:
-        cognito_user = jwt.decode(
-            auth_token, options={'verify_signature': False}
-        )
-    except jwt.DecodeError as e:
-        raise UnauthorizedError(f'Jwt decode error: {e}')
-    except Exception as e:
-        raise UnauthorizedError(f'Unexpected error: {e}')
-    if not cognito_user:
-        raise UnauthorizedError("Could not find cognito user")
-    cognito_user_name = cognito_user.get('sub')
-    if not cognito_user_name:
-        raise UnauthorizedError("Could not find cognito username")
-    return data.get_user_from_cognito_username(cognito_user_name)
+    return get_user_from_auth_token(auth_token)
 
 
 def get_current_user(func):
@@ -143,6 +211,27 @@ def access_admin(func):
     return _access_admin
 
 
+def _get_paginated_friends() -> Union[PaginatedFriends, None]:
+    """
+    Friends lists are only paginated when a cursor or limit is given, so
+    existing clients keep receiving the full list.
+    """
+    query_params = app.current_request.query_params or {}
+    pagination_params = {
+        key: value
+        for key, value in query_params.items()
+        if key in PaginatedFriends.__fields__
+    }
+    if not pagination_params:
+        return None
+    try:
+        return PaginatedFriends(**pagination_params)
+    except PydanticValidationError as e:
+        raise BadRequestError(
+            "; ".join([error["msg"] for error in e.errors()])
+        )
+
+
 # -----------------------------------------------------------------------------
 # USER ENDPOINTS
 # -----------------------------------------------------------------------------
@@ -216,6 +305,159 @@ def get_all_ratings(user: UserObject = None):
         raise LoopException.as_chalice_exception(e)
 
 
+@app.route(
+    '/friends_places',
+    methods=['GET'],
+    cors=True,
+    authorizer=COGNITO_AUTHORIZER,
+)
+@get_current_user
+def get_friends_places(user: UserObject = None):
+    """
+    Get friends' places.
+    ---
+    get:
+        operationId: getFriendsPlaces
+        summary: Get the places in the map view rated by the user and their
+            friends.
+        description: Get a pin for each place in the bounding box rated by
+            the user and their friends, with the number of ratings, the
+            average scores and the latest reviewer.
+        security:
+            - API Key: []
+        parameters:
+            -   in: query
+                name: south
+                type: number
+                required: true
+            -   in: query
+                name: west
+                type: number
+                required: true
+            -   in: query
+                name: north
+                type: number
+                required: true
+            -   in: query
+                name: east
+                type: number
+                required: true
+                description: East edge of the bounding box (less than west
+                    if the box crosses the antimeridian).
+            -   in: query
+                name: zoom
+                type: integer
+                required: true
+                description: Map zoom level.
+            -   in: query
+                name: mode
+                type: string
+                required: false
+                description: Either pins (default), a pin per place, or
+                    clusters, the number of places and their centroid per
+                    geohash cell.
+        responses:
+            200:
+                description: OK
+                schema:
+                    type: object
+            default:
+                description: Unexpected error
+                schema:
+                    type: object
+    """
+    try:
+        query_params = app.current_request.query_params or {}
+        try:
+            map_view = MapView(**query_params)
+        except PydanticValidationError as e:
+            raise BadRequestError(
+                "; ".join([error["msg"] for error in e.errors()])
+            )
+        if map_view.mode == MapMode.CLUSTERS:
+            clusters = get_friend_place_clusters(
+                user, map_view, map_view.zoom
+            )
+            app.log.info(
+                f"Successfully returned {len(clusters)} place clusters in "
+                f"the map view for user {user.id}."
+            )
+            return {'clusters': clusters}
+        places = get_friend_places_in_bbox(user, map_view, map_view.zoom)
+        app.log.info(
+            f"Successfully returned {len(places)} places in the map view "
+            f"for user {user.id}."
+        )
+        return {'places': places}
+    except LoopException as e:
+        raise LoopException.as_chalice_exception(e)
+
+
+@app.route(
+    '/friends_places/nearby',
+    methods=['GET'],
+    cors=True,
+    authorizer=COGNITO_AUTHORIZER,
+)
+@get_current_user
+def get_nearby_friends_places(user: UserObject = None):
+    """
+    Get nearby friends' places.
+    ---
+    get:
+        operationId: getNearbyFriendsPlaces
+        summary: Get the places rated by the user and their friends nearest
+            a location.
+        description: Get a page of the places rated by the user and their
+            friends, ordered by distance from the location.
+        security:
+            - API Key: []
+        parameters:
+            -   in: query
+                name: lat
+                type: string
+                required: true
+                description: Latitude of the location.
+            -   in: query
+                name: lng
+                type: string
+                required: true
+                description: Longitude of the location.
+            -   in: query
+                name: page_count
+                type: integer
+                required: false
+                description: Page number (1 by default).
+        responses:
+            200:
+                description: OK
+                schema:
+                    type: object
+            default:
+                description: Unexpected error
+                schema:
+                    type: object
+    """
+    try:
+        query_params = app.current_request.query_params or {}
+        try:
+            nearby_places = NearbyPlaces(**query_params)
+        except PydanticValidationError as e:
+            raise BadRequestError(
+                "; ".join([error["msg"] for error in e.errors()])
+            )
+        results: NearbyPlacesPageResults = get_nearby_friend_places(
+            user, nearby_places
+        )
+        app.log.info(
+            f"Successfully returned page {nearby_places.page_count} of "
+            f"nearby places for user {user.id}."
+        )
+        return results.to_dict()
+    except LoopException as e:
+        raise LoopException.as_chalice_exception(e)
+
+
 @app.route(
     '/ratings', methods=['POST'], cors=True, authorizer=COGNITO_AUTHORIZER
 )
@@ -255,18 +497,11 @@ def create_rating(user: UserObject = None):
             raise BadRequestError(
                 "; ".join([error["msg"] for error in e.errors()])
             )
-        google_location_id = validated_params.google_id
-        location_id = data.get_or_create_location_id(google_location_id)
-        rating = Rating(
-            location=location_id,
-            user=user.id,
-            price=validated_params.price,
-            vibe=validated_params.vibe,
-            food=validated_params.food,
-            message=validated_params.message,
-        )
-        data.create_rating(rating)
-        app.log.info(f"Successfully created rating entry {rating.__dict__}")
+        data.create_place_rating(validated_params, user)
+        clear_place_clusters(user.id)
+        app.log.info(
+            f"Successfully created rating entry {validated_params.__dict__}"
+        )
         return Response(status_code=200, body='')
     except LoopException as e:
         raise LoopException.as_chalice_exception(e)
@@ -363,6 +598,7 @@ def delete_rating(rating_id: int, user: UserObject = None):
     """
     try:
         data.delete_rating(rating_id, user)
+        clear_place_clusters(user.id)
         app.log.info(
             f"Successfully deleted rating entry {rating_id} "
             f"for user {user.id}."
@@ -548,6 +784,17 @@ def list_friends(user: UserObject = None):
         description: List a user's friends.
         security:
             - API Key: []
+        parameters:
+            -   in: query
+                name: cursor
+                type: integer
+                required: false
+                description: Cursor returned by the previous page.
+            -   in: query
+                name: limit
+                type: integer
+                required: false
+                description: Page size, paginates the response if given.
         responses:
             200:
                 description: OK
@@ -559,7 +806,13 @@ def list_friends(user: UserObject = None):
                     type: object
     """
     try:
-        user_friends = get_user_friends(user)
+        paginated_friends = _get_paginated_friends()
+        if paginated_friends:
+            user_friends = get_user_friends_paginated(
+                user, paginated_friends
+            ).to_dict()
+        else:
+            user_friends = get_user_friends(user)
         app.log.info(
             f"Successfully returned user's friends for user {user.id}"
         )
@@ -568,6 +821,44 @@ def list_friends(user: UserObject = None):
         raise LoopException.as_chalice_exception(e)
 
 
+@app.route(
+    '/friends/counts',
+    methods=['GET'],
+    cors=True,
+    authorizer=COGNITO_AUTHORIZER,
+)
+@get_current_user
+def count_friends(user: UserObject = None):
+    """
+    Count friends.
+    ---
+    get:
+        operationId: countFriends
+        summary: Count your friends and pending requests.
+        description: Count a user's friends, inbound and outbound pending
+            friend requests.
+        security:
+            - API Key: []
+        responses:
+            200:
+                description: OK
+                schema:
+                    type: object
+            default:
+                description: Unexpected error
+                schema:
+                    type: object
+    """
+    try:
+        friend_counts = get_friend_counts(user)
+        app.log.info(
+            f"Successfully returned user's friend counts for user {user.id}"
+        )
+        return friend_counts.to_dict()
+    except LoopException as e:
+        raise LoopException.as_chalice_exception(e)
+
+
 @app.route(
     '/search_users', methods=['GET'], cors=True, authorizer=COGNITO_AUTHORIZER
 )
@@ -588,6 +879,11 @@ def search_users(user: UserObject = None):
                 type: string
                 required: true
                 description: Search term to search users for.
+            -   in: query
+                name: mode
+                type: string
+                required: false
+                description: Search mode, either fuzzy (default) or database.
         responses:
             200:
                 description: OK
@@ -660,7 +956,7 @@ def search_restaurant(search_term=str(), user: UserObject = None):
                     type: object
     """
     try:
-        search_term = requests.utils.unquote(search_term)
+        search_term = unquote(search_term)
         query_params = app.current_request.query_params or {}
         try:
             coordinates = Coordinates(
@@ -680,6 +976,36 @@ def search_restaurant(search_term=str(), user: UserObject = None):
         raise LoopException.as_chalice_exception(e)
 
 
+def _should_upload_thumbnail(
+    location: Location, thumbnail_future: Optional[Future]
+) -> bool:
+    """
+    The thumbnail is optional, so rather than slow the request its upload is
+    left to a later request when the check was skipped or timed out, or the
+    request deadline is close.
+    """
+    if not location.photo_reference:
+        return False
+    place_id = location.google_id
+    if thumbnail_future is None or not has_budget(
+        THUMBNAIL_CHECK_MIN_BUDGET_SECONDS
+    ):
+        app.log.warning(
+            f'Request deadline is close, skipping thumbnail upload for '
+            f'{place_id}.'
+        )
+        return False
+    try:
+        return not get_result(
+            thumbnail_future,
+            THUMBNAIL_CHECK_TIMEOUT_SECONDS,
+            'thumbnail check',
+        )
+    except GatewayTimeoutError as e:
+        app.log.warning(f'{e} Skipping thumbnail upload for {place_id}.')
+        return False
+
+
 @app.route(
     '/restaurant/{place_id}',
     methods=['GET'],
@@ -714,34 +1040,126 @@ def get_restaurant(place_id=str(), user: UserObject = None):
                     type: object
     """
     try:
-        place_id = requests.utils.unquote(place_id)
+        place_id = unquote(place_id)
         app.log.info(
             "Getting restaurant information with Google API "
             f"for place_id: {place_id}."
         )
-        location: Location = find_location(place_id)
         """
-        Here we need to check to see if an image for this location is stored
-        in s3
+        The Google lookup, the check for this location's image in s3, the
+        user's friends/own reviews of this location and its rating stats are
+        independent, so run them concurrently. Only queueing the thumbnail
+        upload needs both of the first two.
         """
-        if location.photo_reference and not check_thumbnail_exists(place_id):
+        location_future = submit(find_location, place_id)
+        thumbnail_future = (
+            submit(check_thumbnail_exists, place_id)
+            if has_budget(THUMBNAIL_CHECK_MIN_BUDGET_SECONDS)
+            else None
+        )
+        reviews_future = submit(
+            get_ratings_for_place_and_friends, place_id, user
+        )
+        stats_future = submit(data.get_location_stats, place_id)
+        location: Location = get_result(
+            location_future, GOOGLE_PLACE_TIMEOUT_SECONDS, 'Google place'
+        )
+        if _should_upload_thumbnail(location, thumbnail_future):
             upload_thumbnail(
                 UploadThumbnailEvent(
                     place_id=place_id, photo_reference=location.photo_reference
                 )
             )
         location = location.to_dict()
-        """
-        Add on user's friends/own reviews of this location.
-        """
-        reviews: List[Dict] = get_ratings_for_place_and_friends(place_id, user)
+        reviews: List[Dict] = get_result(
+            reviews_future, PLACE_RATINGS_TIMEOUT_SECONDS, 'place ratings'
+        )
         if reviews:
             location['reviews'] = reviews
+        stats: Optional[LocationStats] = get_result(
+            stats_future, PLACE_RATINGS_TIMEOUT_SECONDS, 'place stats'
+        )
+        if stats:
+            location['stats'] = stats.to_dict()
         return location
     except LoopException as e:
         raise LoopException.as_chalice_exception(e)
 
 
+@app.route(
+    '/restaurants',
+    methods=['GET'],
+    cors=True,
+    authorizer=COGNITO_AUTHORIZER,
+)
+@get_current_user
+def get_restaurants(user: UserObject = None):
+    """
+    Get restaurants.
+    ---
+    get:
+        operationId: getRestaurants
+        summary: Get many restaurants' info.
+        description: Get the name, address and coordinates of many
+            restaurants (e.g. the pins on the map), from the db where known
+            and otherwise using Google API.
+        security:
+            - Qi API Key: []
+        parameters:
+            -   in: query
+                name: ids
+                type: string
+                required: true
+                description: Comma separated Google place_ids.
+        responses:
+            200:
+                description: OK
+                schema:
+                    type: object
+            default:
+                description: Unexpected error
+                schema:
+                    type: object
+    """
+    try:
+        query_params = app.current_request.query_params or {}
+        try:
+            validated_params = RestaurantIds(**query_params)
+        except PydanticValidationError as e:
+            raise BadRequestError(
+                "; ".join([error["msg"] for error in e.errors()])
+            )
+        place_ids = validated_params.ids
+        restaurants = data.get_locations_by_google_ids(place_ids)
+        # Places not in the db yet are found using Google API concurrently.
+        # Those which time out are returned under not_found with the rest.
+        google_locations, not_found = find_locations(
+            [place_id for place_id in place_ids if place_id not in restaurants]
+        )
+        for place_id, location in google_locations.items():
+            restaurants[place_id] = {
+                'id': None,
+                'google_id': place_id,
+                'display_name': location.display_name,
+                'address': location.address,
+                'coordinates': location.coordinates.model_dump(),
+            }
+        app.log.info(
+            f"Successfully returned {len(restaurants)} restaurants "
+            f"({len(google_locations)} from Google API)."
+        )
+        return {
+            'restaurants': [
+                restaurants[place_id]
+                for place_id in place_ids
+                if place_id in restaurants
+            ],
+            'not_found': not_found,
+        }
+    except LoopException as e:
+        raise LoopException.as_chalice_exception(e)
+
+
 @app.route(
     '/pending_friends/outbound',
     methods=['GET'],
@@ -759,6 +1177,17 @@ def get_outbound_pending_friends(user: UserObject = None):
         description: List a user's outbound pending friends.
         security:
             - API Key: []
+        parameters:
+            -   in: query
+                name: cursor
+                type: integer
+                required: false
+                description: Cursor returned by the previous page.
+            -   in: query
+                name: limit
+                type: integer
+                required: false
+                description: Page size, paginates the response if given.
         responses:
             200:
                 description: OK
@@ -770,9 +1199,15 @@ def get_outbound_pending_friends(user: UserObject = None):
                     type: object
     """
     try:
-        outbound_requests = get_pending_requests(
-            user, FriendRequestType.OUTBOUND
-        )
+        paginated_friends = _get_paginated_friends()
+        if paginated_friends:
+            outbound_requests = get_pending_requests_paginated(
+                user, FriendRequestType.OUTBOUND, paginated_friends
+            ).to_dict()
+        else:
+            outbound_requests = get_pending_requests(
+                user, FriendRequestType.OUTBOUND
+            )
         app.log.info(
             "Successfully returned user's outbound friend requests"
             f" for user {user.id}"
@@ -799,6 +1234,17 @@ def get_inbound_pending_friends(user: UserObject = None):
         description: List a user's inbound pending friends.
         security:
             - API Key: []
+        parameters:
+            -   in: query
+                name: cursor
+                type: integer
+                required: false
+                description: Cursor returned by the previous page.
+            -   in: query
+                name: limit
+                type: integer
+                required: false
+                description: Page size, paginates the response if given.
         responses:
             200:
                 description: OK
@@ -810,9 +1256,15 @@ def get_inbound_pending_friends(user: UserObject = None):
                     type: object
     """
     try:
-        inbound_requests = get_pending_requests(
-            user, FriendRequestType.INBOUND
-        )
+        paginated_friends = _get_paginated_friends()
+        if paginated_friends:
+            inbound_requests = get_pending_requests_paginated(
+                user, FriendRequestType.INBOUND, paginated_friends
+            ).to_dict()
+        else:
+            inbound_requests = get_pending_requests(
+                user, FriendRequestType.INBOUND
+            )
         app.log.info(
             "Successfully returned user's inbound friend requests"
             f" for user {user.id}"
@@ -878,6 +1330,66 @@ def get_admin_ratings(user: UserObject = None):
         raise LoopException.as_chalice_exception(e)
 
 
+@app.route(
+    '/admin/ratings/import',
+    methods=['POST'],
+    cors=True,
+    authorizer=COGNITO_AUTHORIZER,
+)
+@get_current_user
+@access_admin
+def admin_import_ratings(user: UserObject = None):
+    """
+    Admin import a user's ratings.
+    ---
+    post:
+        operationId: adminImportRatings
+        summary: Create many rating entries for a user in the db.
+        description: Create many rating entries for a user (by email) in the
+            db, e.g. a list migrated from another app. Ratings of places that
+            cannot be found are not created.
+        security:
+            - Qi API Key: []
+        consumes:
+            -   application/json
+        parameters:
+            -   in: body
+                name: import_ratings_schema
+                schema:
+                    type: object
+                required: true
+                description: JSON object containing the user's email and a
+                    list of ratings (as for creating a rating).
+        responses:
+            200:
+                description: OK
+                schema:
+                    type: object
+            default:
+                description: Unexpected error
+                schema:
+                    type: object
+    """
+    try:
+        payload = app.current_request.json_body
+        try:
+            validated_params = ImportRatings(**payload)
+        except PydanticValidationError as e:
+            raise BadRequestError(
+                "; ".join([error["msg"] for error in e.errors()])
+            )
+        results: RatingsImportResults = admin_utils.import_ratings(
+            validated_params
+        )
+        app.log.info(
+            f"Successfully imported {results.created} ratings for "
+            f"{validated_params.email} (admin)."
+        )
+        return results.to_dict()
+    except LoopException as e:
+        raise LoopException.as_chalice_exception(e)
+
+
 @app.route(
     '/admin/ratings/{rating_id}',
     methods=['DELETE'],
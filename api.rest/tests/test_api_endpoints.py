@@ -1,5 +1,7 @@
 import importlib
 import json
+import threading
+import time
 import unittest
 from unittest.mock import call, patch
 
@@ -9,11 +11,13 @@ from loop.api_classes import Coordinates, UpdateRating
 from loop.data_classes import (
     NULL_USER_SEARCH_PAGE_RESULT,
     Location,
+    RatingsImportResults,
     RatingsPageResults,
     UploadThumbnailEvent,
     UserObject,
 )
 from loop.enums import DbType
+from loop.friends import PLACE_CLUSTERS
 from loop.test_setup.common import setup_rds, unbind_rds
 
 mock_url_write_db = 'loop.data.init_write_db'
@@ -22,7 +26,7 @@ mock_url_write_db = 'loop.data.init_write_db'
 def mocked_init_write_db(check_tables=False, create_tables=False):
     if not check_tables and not create_tables:
         return
-    db_dict = {'provider': 'sqlite', 'filename': ':memory:'}
+    db_dict = {'provider': 'sqlite', 'filename': ':sharedmemory:'}
     data.DB_TYPE[DbType.WRITE] = data.init_db(
         db_dict, check_tables=True, create_tables=True
     )
@@ -84,19 +88,6 @@ class TestGetRatings(unittest.TestCase):
             self.assertEqual(
                 response.json_body,
                 [
-                    {
-                        'id': 3,
-                        'first_name': 'Test',
-                        'last_name': 'User',
-                        'place_id': 'test_google_id_1',
-                        'latitude': 1.5,
-                        'longitude': -0.7,
-                        'food': 3,
-                        'price': 4,
-                        'vibe': 4,
-                        'message': 'Food was incredible.',
-                        'time_created': '2000-01-01 00:00:00',
-                    },
                     {
                         'id': 4,
                         'first_name': 'Test',
@@ -110,6 +101,19 @@ class TestGetRatings(unittest.TestCase):
                         'message': 'Place had a great atmosphere.',
                         'time_created': '2000-01-01 00:00:00',
                     },
+                    {
+                        'id': 3,
+                        'first_name': 'Test',
+                        'last_name': 'User',
+                        'place_id': 'test_google_id_1',
+                        'latitude': 1.5,
+                        'longitude': -0.7,
+                        'food': 3,
+                        'price': 4,
+                        'vibe': 4,
+                        'message': 'Food was incredible.',
+                        'time_created': '2000-01-01 00:00:00',
+                    },
                 ],
             )
 
@@ -125,16 +129,29 @@ class TestGetRatings(unittest.TestCase):
                 {
                     'page_data': [
                         {
-                            'id': 1,
-                            'first_name': 'Admin',
+                            'id': 4,
+                            'first_name': 'Test',
+                            'last_name': 'User',
+                            'place_id': 'test_google_id_2',
+                            'latitude': 1.2,
+                            'longitude': -0.9,
+                            'food': 5,
+                            'price': 4,
+                            'vibe': 5,
+                            'message': 'Place had a great atmosphere.',
+                            'time_created': '2000-01-01 00:00:00',
+                        },
+                        {
+                            'id': 3,
+                            'first_name': 'Test',
                             'last_name': 'User',
                             'place_id': 'test_google_id_1',
                             'latitude': 1.5,
                             'longitude': -0.7,
                             'food': 3,
                             'price': 4,
-                            'vibe': 5,
-                            'message': None,
+                            'vibe': 4,
+                            'message': 'Food was incredible.',
                             'time_created': '2000-01-01 00:00:00',
                         },
                         {
@@ -151,29 +168,16 @@ class TestGetRatings(unittest.TestCase):
                             'time_created': '2000-01-01 00:00:00',
                         },
                         {
-                            'id': 3,
-                            'first_name': 'Test',
+                            'id': 1,
+                            'first_name': 'Admin',
                             'last_name': 'User',
                             'place_id': 'test_google_id_1',
                             'latitude': 1.5,
                             'longitude': -0.7,
                             'food': 3,
                             'price': 4,
-                            'vibe': 4,
-                            'message': 'Food was incredible.',
-                            'time_created': '2000-01-01 00:00:00',
-                        },
-                        {
-                            'id': 4,
-                            'first_name': 'Test',
-                            'last_name': 'User',
-                            'place_id': 'test_google_id_2',
-                            'latitude': 1.2,
-                            'longitude': -0.9,
-                            'food': 5,
-                            'price': 4,
                             'vibe': 5,
-                            'message': 'Place had a great atmosphere.',
+                            'message': None,
                             'time_created': '2000-01-01 00:00:00',
                         },
                     ],
@@ -525,6 +529,34 @@ class TestListFriends(unittest.TestCase):
             response = client.http.get(f'/friends')
             self.assertEqual(response.status_code, 200)
 
+    def test_get_user_friends_paginated(self):
+        with Client(app.app) as client:
+            response = client.http.get('/friends?limit=5')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body, {'page_data': [], 'next_cursor': None}
+            )
+
+    def test_get_user_friends_other_query_params(self):
+        with Client(app.app) as client:
+            response = client.http.get('/friends?_=1700000000')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json_body, [])
+
+    def test_get_user_friends_paginated_limit_error(self):
+        with Client(app.app) as client:
+            response = client.http.get('/friends?limit=1000')
+            self.assertEqual(response.status_code, 400)
+
+    def test_count_friends(self):
+        with Client(app.app) as client:
+            response = client.http.get('/friends/counts')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {'friends': 0, 'inbound': 1, 'outbound': 0},
+            )
+
 
 class TestGetFriendRequests(unittest.TestCase):
     @patch(mock_url_write_db)
@@ -554,6 +586,26 @@ class TestGetFriendRequests(unittest.TestCase):
             response = client.http.get(f'/pending_friends/inbound')
             self.assertEqual(response.status_code, 200)
 
+    def test_get_inbound_pending_friends_paginated(self):
+        with Client(app.app) as client:
+            response = client.http.get('/pending_friends/inbound?limit=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {
+                    'page_data': [
+                        {
+                            'id': 4,
+                            'user_name': '67ce7049-109f-420f-861b-3f1e7d6824b5',
+                            'email': 'test_person_email_2',
+                            'first_name': 'Random',
+                            'last_name': 'Persons-Mate',
+                        }
+                    ],
+                    'next_cursor': None,
+                },
+            )
+
 
 class TestSearchUsers(unittest.TestCase):
     @patch(mock_url_write_db)
@@ -707,6 +759,76 @@ class TestGetRestaurant(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
         self.assertFalse(mock_upload_thumbnail.called)
 
+    @patch('loop-api.app.GOOGLE_PLACE_TIMEOUT_SECONDS', 0.01)
+    @patch('loop-api.app.upload_thumbnail')
+    @patch('loop-api.app.check_thumbnail_exists')
+    @patch('loop-api.app.find_location')
+    def test_get_restaurant_google_timeout(
+        self, mock_find_location, mock_check_thumbnail, mock_upload_thumbnail
+    ):
+        release = threading.Event()
+        mock_find_location.side_effect = lambda place_id: release.wait()
+        mock_check_thumbnail.return_value = False
+
+        try:
+            with Client(app.app) as client:
+                response = client.http.get('/restaurant/X_TEST_GOOGLE_ID_X')
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(mock_upload_thumbnail.called)
+
+    @patch('loop-api.app.THUMBNAIL_CHECK_TIMEOUT_SECONDS', 0.01)
+    @patch('loop-api.app.upload_thumbnail')
+    @patch('loop-api.app.check_thumbnail_exists')
+    @patch('loop-api.app.find_location')
+    def test_get_restaurant_thumbnail_check_timeout(
+        self, mock_find_location, mock_check_thumbnail, mock_upload_thumbnail
+    ):
+        location = Location(
+            google_id='X_TEST_GOOGLE_ID_X',
+            address='55 Northberk Street, Sunderland',
+            display_name='Greggs',
+            coordinates=Coordinates(lat=1.0, lng=1.0),
+            photo_reference='TEST_PHOTO_REFERENCE',
+        )
+        release = threading.Event()
+        mock_find_location.return_value = location
+        mock_check_thumbnail.side_effect = lambda place_id: release.wait()
+
+        try:
+            with Client(app.app) as client:
+                response = client.http.get('/restaurant/X_TEST_GOOGLE_ID_X')
+        finally:
+            release.set()
+        # The location is still returned, the upload is left to a later
+        # request.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json_body['google_id'], 'X_TEST_GOOGLE_ID_X')
+        self.assertFalse(mock_upload_thumbnail.called)
+
+    @patch('loop-api.app.THUMBNAIL_CHECK_MIN_BUDGET_SECONDS', 60)
+    @patch('loop-api.app.upload_thumbnail')
+    @patch('loop-api.app.check_thumbnail_exists')
+    @patch('loop-api.app.find_location')
+    def test_get_restaurant_skips_thumbnail_near_deadline(
+        self, mock_find_location, mock_check_thumbnail, mock_upload_thumbnail
+    ):
+        location = Location(
+            google_id='X_TEST_GOOGLE_ID_X',
+            address='55 Northberk Street, Sunderland',
+            display_name='Greggs',
+            coordinates=Coordinates(lat=1.0, lng=1.0),
+            photo_reference='TEST_PHOTO_REFERENCE',
+        )
+        mock_find_location.return_value = location
+
+        with Client(app.app) as client:
+            response = client.http.get('/restaurant/X_TEST_GOOGLE_ID_X')
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_check_thumbnail.called)
+        self.assertFalse(mock_upload_thumbnail.called)
+
     @patch('loop-api.app.upload_thumbnail')
     @patch('loop-api.app.check_thumbnail_exists')
     @patch('loop-api.app.find_location')
@@ -752,8 +874,242 @@ class TestGetRestaurant(unittest.TestCase):
                         'time_created': '2000-01-01 00:00:00',
                     }
                 ],
+                'stats': {
+                    'ratings': 2,
+                    'food': 3.0,
+                    'price': 4.0,
+                    'vibe': 4.5,
+                    'last_rated': '2000-01-01 00:00:00',
+                },
+            },
+        )
+
+
+class TestGetFriendsPlaces(unittest.TestCase):
+    @patch(mock_url_write_db)
+    def setUp(self, write_db):
+        write_db.side_effect = mocked_init_write_db
+
+        global app
+        app = importlib.import_module("loop-api.app")
+        setup_rds()
+        PLACE_CLUSTERS.clear()
+
+    def tearDown(self):
+        unbind_rds()
+
+    def test_get_friends_places(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places?south=1.4&west=-1&north=2&east=0&zoom=10'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {
+                    'places': [
+                        {
+                            'id': 1,
+                            'google_id': 'test_google_id_1',
+                            'display_name': 'Home',
+                            'coordinates': {'lat': 1.5, 'lng': -0.7},
+                            'ratings': 1,
+                            'food': 3.0,
+                            'price': 4.0,
+                            'vibe': 4.0,
+                            'latest_reviewer': {
+                                'id': 1,
+                                'first_name': 'Test',
+                                'last_name': 'User',
+                                'last_rated': '2000-01-01 00:00:00',
+                            },
+                        }
+                    ]
+                },
+            )
+
+    def test_get_friends_places_clusters(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places?south=0&west=-1&north=2&east=0&zoom=3'
+                '&mode=clusters'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {
+                    'clusters': [
+                        {
+                            'geohash': 'eb',
+                            'count': 2,
+                            'coordinates': {'lat': 1.35, 'lng': -0.8},
+                        }
+                    ]
+                },
+            )
+
+    def test_get_friends_places_unknown_mode_error(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places?south=0&west=-1&north=2&east=0&zoom=3'
+                '&mode=heatmap'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_nearby_friends_places(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places/nearby?lat=1.2&lng=-0.9'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {
+                    'page_data': [
+                        {
+                            'id': 2,
+                            'google_id': 'test_google_id_2',
+                            'display_name': "Baggins'",
+                            'coordinates': {'lat': 1.2, 'lng': -0.9},
+                            'distance_km': 0.0,
+                        },
+                        {
+                            'id': 1,
+                            'google_id': 'test_google_id_1',
+                            'display_name': 'Home',
+                            'coordinates': {'lat': 1.5, 'lng': -0.7},
+                            'distance_km': 40.089,
+                        },
+                    ],
+                    'total_pages': 1,
+                },
+            )
+
+    def test_get_nearby_friends_places_page_error(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places/nearby?lat=1.2&lng=-0.9&page_count=2'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_nearby_friends_places_no_lat_error(self):
+        with Client(app.app) as client:
+            response = client.http.get('/friends_places/nearby?lng=-0.9')
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_friends_places_missing_zoom_error(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places?south=1.4&west=-1&north=2&east=0'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_friends_places_south_of_north_error(self):
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/friends_places?south=2&west=-1&north=1&east=0&zoom=10'
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class TestGetRestaurants(unittest.TestCase):
+    @patch(mock_url_write_db)
+    def setUp(self, write_db):
+        write_db.side_effect = mocked_init_write_db
+
+        global app
+        app = importlib.import_module("loop-api.app")
+        setup_rds()
+
+    def tearDown(self):
+        unbind_rds()
+
+    @patch('loop-api.app.find_locations')
+    def test_get_restaurants(self, mock_find_locations):
+        mock_find_locations.return_value = (
+            {
+                'X_TEST_GOOGLE_ID_X': Location(
+                    google_id='X_TEST_GOOGLE_ID_X',
+                    address='55 Northberk Street, Sunderland',
+                    display_name='Greggs',
+                    coordinates=Coordinates(lat=1.0, lng=1.0),
+                )
             },
+            ['X_MISSING_GOOGLE_ID_X'],
         )
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/restaurants?ids=X_TEST_GOOGLE_ID_X,test_google_id_1,'
+                'X_MISSING_GOOGLE_ID_X'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {
+                    'restaurants': [
+                        {
+                            'id': None,
+                            'google_id': 'X_TEST_GOOGLE_ID_X',
+                            'display_name': 'Greggs',
+                            'address': '55 Northberk Street, Sunderland',
+                            'coordinates': {'lat': 1.0, 'lng': 1.0},
+                        },
+                        {
+                            'id': 1,
+                            'google_id': 'test_google_id_1',
+                            'display_name': 'Home',
+                            'address': '14 Lambert Street, London, N1 1JE',
+                            'coordinates': {'lat': 1.5, 'lng': -0.7},
+                        },
+                    ],
+                    'not_found': ['X_MISSING_GOOGLE_ID_X'],
+                },
+            )
+            mock_find_locations.assert_called_once_with(
+                ['X_TEST_GOOGLE_ID_X', 'X_MISSING_GOOGLE_ID_X']
+            )
+
+    @patch('loop.google_client.places.GOOGLE_PLACE_TIMEOUT_SECONDS', 0.05)
+    @patch('loop.google_client.places.find_location')
+    def test_get_restaurants_google_timeout(self, mock_find_location):
+        def _find_location(google_id):
+            if google_id == 'X_SLOW_GOOGLE_ID_X':
+                time.sleep(0.5)
+            return Location(
+                google_id=google_id,
+                address='55 Northberk Street, Sunderland',
+                display_name='Greggs',
+                coordinates=Coordinates(lat=1.0, lng=1.0),
+            )
+
+        mock_find_location.side_effect = _find_location
+        with Client(app.app) as client:
+            response = client.http.get(
+                '/restaurants?ids=X_SLOW_GOOGLE_ID_X,test_google_id_1,'
+                'X_TEST_GOOGLE_ID_X'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [
+                    restaurant['google_id']
+                    for restaurant in response.json_body['restaurants']
+                ],
+                ['test_google_id_1', 'X_TEST_GOOGLE_ID_X'],
+            )
+            self.assertEqual(
+                response.json_body['not_found'], ['X_SLOW_GOOGLE_ID_X']
+            )
+
+    def test_get_restaurants_no_ids_error(self):
+        with Client(app.app) as client:
+            response = client.http.get('/restaurants')
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_restaurants_too_many_ids_error(self):
+        ids = ','.join(f'google_id_{i}' for i in range(51))
+        with Client(app.app) as client:
+            response = client.http.get(f'/restaurants?ids={ids}')
+            self.assertEqual(response.status_code, 400)
 
 
 class TestAdminEndpoints(unittest.TestCase):
@@ -798,6 +1154,54 @@ class TestAdminEndpoints(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertTrue(mock_delete_user.called)
 
+    @patch('loop.admin_utils.import_ratings')
+    def test_import_admin_ratings(self, mock_import_ratings):
+        mock_import_ratings.return_value = RatingsImportResults(
+            created=1, failed_google_ids=['test_google_id_x']
+        )
+        with Client(app.app) as client:
+            response = client.http.post(
+                '/admin/ratings/import',
+                headers={'Content-Type': 'application/json'},
+                body=json.dumps(
+                    {
+                        'email': 'some_email@hotmail.com',
+                        'ratings': [
+                            {
+                                'google_id': 'test_google_id_1',
+                                'price': 1,
+                                'vibe': 5,
+                                'food': 3,
+                            },
+                            {
+                                'google_id': 'test_google_id_x',
+                                'price': 2,
+                                'vibe': 4,
+                                'food': 3,
+                            },
+                        ],
+                    }
+                ),
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json_body,
+                {'created': 1, 'failed_google_ids': ['test_google_id_x']},
+            )
+            import_ratings = mock_import_ratings.call_args[0][0]
+            self.assertEqual(len(import_ratings.ratings), 2)
+
+    def test_import_admin_ratings_no_ratings_error(self):
+        with Client(app.app) as client:
+            response = client.http.post(
+                '/admin/ratings/import',
+                headers={'Content-Type': 'application/json'},
+                body=json.dumps(
+                    {'email': 'some_email@hotmail.com', 'ratings': []}
+                ),
+            )
+            self.assertEqual(response.status_code, 400)
+
     def test_delete_admin_user_bad_email_error(self):
         with Client(app.app) as client:
             response = client.http.delete('/admin/user/HELLO')
@@ -0,0 +1,83 @@
+import importlib
+import unittest
+
+from load_test.fakes import FakeServices, Latency
+from load_test.harness import (
+    ROUTE_MIX,
+    LoadTestContext,
+    get_plan,
+    run_load_test,
+    thread_local_requests,
+)
+from loop.test_setup.dataset import DatasetConfig
+
+READ_ROUTES = [route for route in ROUTE_MIX if not route.startswith('POST')]
+
+
+class TestLatency(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(Latency.parse('none').sample_ms(), 0)
+        self.assertEqual(Latency.parse('fixed:25').sample_ms(), 25)
+        uniform = Latency.parse('uniform:10:20')
+        for _ in range(10):
+            self.assertTrue(10 <= uniform.sample_ms() <= 20)
+        self.assertGreater(Latency.parse('lognormal:50:0.5').sample_ms(), 0)
+        self.assertEqual(repr(Latency.parse('uniform:10:20')), 'uniform:10:20')
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ValueError):
+            Latency.parse('gaussian:10')
+        with self.assertRaises(ValueError):
+            Latency.parse('fixed')
+        with self.assertRaises(ValueError):
+            Latency.parse('fixed:ten')
+
+
+class TestLoadHarness(unittest.TestCase):
+    def test_get_plan(self):
+        context = LoadTestContext(
+            tag='plan', tokens=['token_1', 'token_2'], place_ids=['place_1']
+        )
+        plan = get_plan(context, 50, seed=1)
+        self.assertEqual(len(plan), 50)
+        self.assertEqual(plan, get_plan(context, 50, seed=1))
+        self.assertTrue(all(route in ROUTE_MIX for route, _, _ in plan))
+        plan = get_plan(context, 10, routes=['GET /friends'])
+        self.assertEqual(
+            {request for _, request, _ in plan}, {('GET', '/friends', None)}
+        )
+        with self.assertRaises(ValueError):
+            get_plan(context, 10, routes=['GET /unknown'])
+
+    def test_thread_local_requests(self):
+        app = importlib.import_module("loop-api.app").app
+        app_class = app.__class__
+        app.current_request = 'request'
+        with thread_local_requests(app):
+            self.assertIsNone(app.current_request)
+            app.current_request = 'thread request'
+            self.assertEqual(app.current_request, 'thread request')
+        self.assertIs(app.__class__, app_class)
+        self.assertEqual(app.current_request, 'request')
+
+    def test_run_load_test(self):
+        services = FakeServices(google_latency=Latency('fixed', 1))
+        reports = run_load_test(
+            DatasetConfig(users=30, locations=10, ratings=60, tag='load'),
+            requests=40,
+            concurrencies=[1, 4],
+            services=services,
+            routes=READ_ROUTES,
+            auth_disabled=True,
+        )
+        self.assertEqual([report['concurrency'] for report in reports], [1, 4])
+        for report in reports:
+            results = report['results']
+            self.assertEqual(results['all']['requests'], 40)
+            self.assertEqual(results['all']['errors'], 0)
+            self.assertTrue(set(results) - {'all'} <= set(READ_ROUTES))
+            for result in results.values():
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+                self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+                self.assertLessEqual(result['p99_ms'], result['max_ms'])
+                self.assertGreater(result['throughput_rps'], 0)
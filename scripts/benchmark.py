@@ -0,0 +1,99 @@
+import argparse
+import json
+import sys
+
+from loop.test_setup.benchmark import compare_results, run_benchmarks
+from loop.test_setup.dataset import parse_db_url
+
+"""
+Benchmarks the loop.data and loop.friends hot paths over synthetic datasets,
+writing the results as JSON, and compares results to a baseline, e.g.
+
+python scripts/benchmark.py run --scales 1000 10000 --output baseline.json
+python scripts/benchmark.py run --scales 1000 10000 --output current.json
+python scripts/benchmark.py compare baseline.json current.json
+
+compare exits with status 1 if any benchmark regressed.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the benchmarks")
+    run_parser.add_argument(
+        '--scales',
+        type=int,
+        nargs='+',
+        default=[1000, 10000],
+        help="Numbers of users to benchmark with",
+    )
+    run_parser.add_argument('--iterations', type=int, default=20)
+    run_parser.add_argument(
+        '--benchmark',
+        action='append',
+        help="Only run this benchmark (can be repeated)",
+    )
+    run_parser.add_argument(
+        '--db',
+        help="Database url (see generate_dataset.py), in memory SQLite if "
+        "not given",
+    )
+    run_parser.add_argument('--output', help="File to write results to")
+
+    compare_parser = subparsers.add_parser(
+        'compare', help="Compare results to a baseline"
+    )
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help="Slowdown (as a fraction of the baseline median) that is a "
+        "regression",
+    )
+    return parser.parse_args()
+
+
+def run(args) -> None:
+    results = run_benchmarks(
+        args.scales,
+        iterations=args.iterations,
+        db_dict=parse_db_url(args.db) if args.db else None,
+        names=args.benchmark,
+    )
+    print(f'{"median ms":>10}{"p95 ms":>10}  benchmark')
+    for key, result in results['results'].items():
+        print(f'{result["median_ms"]:>10.2f}{result["p95_ms"]:>10.2f}  {key}')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+def compare(args) -> int:
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current) as current_file:
+        current = json.load(current_file)
+    comparisons = compare_results(baseline, current, args.threshold)
+    print(f'{"baseline":>10}{"current":>10}{"change":>9}  benchmark')
+    for comparison in comparisons:
+        flag = '  REGRESSION' if comparison.regression else ''
+        print(
+            f'{comparison.baseline_ms:>10.2f}{comparison.current_ms:>10.2f}'
+            f'{comparison.change:>+9.0%}  {comparison.key}{flag}'
+        )
+    return 1 if any(comparison.regression for comparison in comparisons) else 0
+
+
+def main():
+    args = parse_args()
+    if args.command == 'compare':
+        sys.exit(compare(args))
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
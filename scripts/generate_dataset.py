@@ -0,0 +1,89 @@
+import argparse
+import json
+
+from loop import data
+from loop.enums import DbType
+from loop.test_setup.dataset import (
+    DatasetConfig,
+    delete_dataset,
+    generate_dataset,
+    parse_db_url,
+)
+
+"""
+Generates (or deletes) a synthetic dataset in a local SQLite or MySQL
+database, e.g.
+
+python scripts/generate_dataset.py --db sqlite:////tmp/loop.db \
+    --users 100000 --locations 20000 --ratings 500000
+python scripts/generate_dataset.py --db mysql://root:pw@localhost:3306/loop \
+    --users 100000 --tag load_test
+python scripts/generate_dataset.py --db sqlite:////tmp/loop.db --delete
+
+Tables are created if they do not exist. The same --seed and sizes
+generate the same data.
+"""
+
+
+def parse_args():
+    defaults = DatasetConfig()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--db',
+        required=True,
+        help="sqlite:///<path> or mysql://<user>:<password>@<host>/<db>",
+    )
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--locations', type=int, default=defaults.locations)
+    parser.add_argument('--ratings', type=int, default=defaults.ratings)
+    parser.add_argument(
+        '--friends-per-user',
+        type=int,
+        default=defaults.friends_per_user,
+        help="Friends each new user makes (the mean number of friendships "
+        "per user is about twice this)",
+    )
+    parser.add_argument(
+        '--pending-fraction',
+        type=float,
+        default=defaults.pending_fraction,
+        help="Fraction of friendships left as pending requests",
+    )
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--tag', default=defaults.tag)
+    parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+    parser.add_argument(
+        '--delete',
+        action='store_true',
+        help="Delete the dataset with the tag instead of generating one",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db = data.init_db(
+        parse_db_url(args.db), check_tables=True, create_tables=True
+    )
+    data.DB_TYPE[DbType.WRITE] = db
+    if args.delete:
+        delete_dataset(db, args.tag)
+        return
+    summary = generate_dataset(
+        db,
+        DatasetConfig(
+            users=args.users,
+            locations=args.locations,
+            ratings=args.ratings,
+            friends_per_user=args.friends_per_user,
+            pending_fraction=args.pending_fraction,
+            seed=args.seed,
+            tag=args.tag,
+            batch_size=args.batch_size,
+        ),
+    )
+    print(json.dumps(summary.to_dict(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+"""
+Reports the import time of a module (by default the loop-api app) per
+imported module, using python's -X importtime. Run from the repo root, e.g.
+
+python scripts/profile_imports.py --top 30
+python scripts/profile_imports.py --module auth-api.app --group
+"""
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULE = 'loop-api.app'
+DEFAULT_PATH = os.path.join(REPO_ROOT, 'api.rest')
+IMPORT_TIME_PREFIX = 'import time:'
+
+# Keep the profile to imports: no database, secrets or auth setup.
+PROFILE_ENVIRONMENT = {
+    'NO_DB': '1',
+    'LOOP_AUTH_DISABLED': '1',
+    'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'eu-west-2'),
+    'ENVIRONMENT': os.environ.get('ENVIRONMENT', 'develop'),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--module',
+        default=DEFAULT_MODULE,
+        help="Module to import (e.g. loop-api.app, loop.friends)",
+    )
+    parser.add_argument(
+        '--path',
+        default=DEFAULT_PATH,
+        help="Directory to import the module from",
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=25,
+        help="Number of modules to report",
+    )
+    parser.add_argument(
+        '--sort',
+        choices=['self', 'cumulative'],
+        default='cumulative',
+        help="Sort by a module's own import time or including its imports",
+    )
+    parser.add_argument(
+        '--group',
+        action='store_true',
+        help="Sum self import time per top level package",
+    )
+    return parser.parse_args()
+
+
+def profile_import(module: str, path: str) -> List[Tuple[str, int, int]]:
+    """
+    Imports the module in a fresh interpreter, returning (module, self us,
+    cumulative us) for every module imported.
+    """
+    env = dict(os.environ, **PROFILE_ENVIRONMENT)
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            f'import importlib; importlib.import_module({module!r})',
+        ],
+        cwd=path,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Could not import {module}:\n{result.stderr}')
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        self_us, cumulative_us, name = line[len(IMPORT_TIME_PREFIX):].split(
+            '|'
+        )
+        if not self_us.strip().isdigit():
+            # Header line.
+            continue
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def group_by_package(timings: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    packages = defaultdict(int)
+    for name, self_us, _ in timings:
+        packages[name.split('.')[0]] += self_us
+    return packages
+
+
+def main():
+    args = parse_args()
+    timings = profile_import(args.module, args.path)
+    total_ms = sum(self_us for _, self_us, _ in timings) / 1000
+    print(f'Importing {args.module} took {total_ms:.1f}ms')
+    if args.group:
+        packages = group_by_package(timings)
+        print(f'{"self ms":>10}  package')
+        for package, self_us in sorted(
+            packages.items(), key=lambda item: item[1], reverse=True
+        )[: args.top]:
+            print(f'{self_us / 1000:>10.1f}  {package}')
+        return
+    sort_index = 1 if args.sort == 'self' else 2
+    print(f'{"self ms":>10}{"cumul. ms":>11}  module')
+    for name, self_us, cumulative_us in sorted(
+        timings, key=lambda timing: timing[sort_index], reverse=True
+    )[: args.top]:
+        print(f'{self_us / 1000:>10.1f}{cumulative_us / 1000:>11.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import argparse
+
+from loop import data
+from loop.enums import DbType
+from loop.test_setup.dataset import parse_db_url
+
+"""
+Recomputes the location rating stats (the location_stats table) from the
+ratings, e.g. after ratings were changed outside loop.data, or to check the
+incrementally maintained stats:
+
+python scripts/rebuild_location_stats.py --db sqlite:////tmp/loop.db
+python scripts/rebuild_location_stats.py --location-id 1 --location-id 2
+
+Uses the environment's rds secret if --db is not given.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--db',
+        help="sqlite:///<path> or mysql://<user>:<password>@<host>/<db>, "
+        "the environment's database if not given",
+    )
+    parser.add_argument(
+        '--location-id',
+        type=int,
+        action='append',
+        help="Only rebuild this location's stats (can be repeated)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        data.DB_TYPE[DbType.WRITE] = data.init_db(
+            parse_db_url(args.db), check_tables=True
+        )
+    else:
+        data.init_write_db(check_tables=True)
+    locations = data.rebuild_location_stats(args.location_id)
+    print(f'Rebuilt the stats of {locations} locations.')
+
+
+if __name__ == '__main__':
+    main()